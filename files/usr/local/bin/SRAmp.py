@@ -13,9 +13,10 @@
 #
 # -----------------------------------------------------------------------------
 
-import os, subprocess, shlex
+import os, time, subprocess, shlex, traceback
 
 from SRBase import Base
+from SRBus  import VolumeEvent
 
 class Amp(Base):
   """ Amp-controller """
@@ -25,6 +26,8 @@ class Amp(Base):
 
     self._app    = app
     self._volume = -1                 # and unknown volume
+    self._m_time = app.metrics.histogram("simple_radio_amp_seconds",
+                                         "execution time of mixer-commands")
 
     self.read_config()
     app.register_funcs(self.get_funcs())
@@ -53,52 +56,67 @@ class Amp(Base):
     try:
       cmd = ( "amixer %s get %s|grep -o [0-9]*%%|sed 's/%%//'| head -n 1" %
               (self._mixer_opts,self._mixer) )
+      start = time.monotonic()
       self._volume = int(subprocess.check_output(cmd,shell=True).splitlines()[0])
-      self.debug("current volume is: %d%%" % self._volume)
+      self._m_time.observe(time.monotonic()-start)
+      self.debug("current volume is: %d%%",self._volume)
+      self._app.bus.publish(VolumeEvent(self._volume))
       return self._volume
     except:
       if self._debug:
         traceback.print_exc()
       return -1
 
+  # --- return volume   ------------------------------------------------------
+
+  def get_volume(self):
+    """ return current volume in percent (-1 if unknown) """
+
+    return self._get_volume()
+
   # --- set volume   ----------------------------------------------------------
 
   def _set_volume(self,volume):
     """ set volume """
 
-    self.debug("setting volume to %d%%" % volume)
+    self.debug("setting volume to %d%%",volume)
     try:
       args = shlex.split("amixer %s -q set %s %d%%" %
                                        (self._mixer_opts,self._mixer,volume))
+      start = time.monotonic()
       subprocess.call(args)
+      self._m_time.observe(time.monotonic()-start)
       self._volume = volume
+      self._app.bus.publish(VolumeEvent(volume))
     except:
       if self._debug:
         traceback.print_exc()
 
   # --- turn volume up   ------------------------------------------------------
 
-  def func_volume_up(self,_):
-    """ turn volume up """
+  def func_volume_up(self,_,count=1):
+    """ turn volume up (count steps) """
 
-    self.debug("turn volume up")
+    self.debug("turn volume up (%d)",count)
     if self._app.cec.have_cec():
-      self._app.cec.volume_up()
+      for i in range(count):
+        self._app.cec.volume_up()
     else:
       current_volume = self._get_volume()
-      self._set_volume(min(current_volume+self._vol_delta,100))
+      self._set_volume(min(current_volume+count*self._vol_delta,100))
 
   # --- turn volume down   ----------------------------------------------------
 
-  def func_volume_down(self,_):
-    """ turn volume down """
+  def func_volume_down(self,_,count=1):
+    """ turn volume down (count steps) """
 
-    self.debug("turn volume down")
+    self.debug("turn volume down (%d)",count)
     if self._app.cec.have_cec():
-      self._app.cec.volume_down()
+      for i in range(count):
+        self._app.cec.volume_down()
     else:
       current_volume = self._get_volume()
-      self._set_volume(max(current_volume-self._vol_delta,0))
+      self._set_volume(max(current_volume-count*self._vol_delta,0))
 
   # --- toggle mute   ---------------------------------------------------------
 
@@ -109,5 +127,7 @@ class Amp(Base):
     if self._app.cec.have_cec():
       self._app.cec.toggle_mute()
     else:
+      start = time.monotonic()
       subprocess.call(["amixer","-q","sset",self._mixer,"toggle"])
+      self._m_time.observe(time.monotonic()-start)
 
@@ -0,0 +1,287 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class Api
+#
+# The class Api implements a small HTTP/JSON-server for remote control
+# (e.g. from home automation). It runs within the shared event-loop.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import asyncio, json, urllib.parse, traceback
+
+from SRBase import Base
+from SRBus  import TOPICS, TitleEvent
+
+HTTP_STATUS = {200: "OK", 202: "Accepted", 400: "Bad Request",
+               404: "Not Found", 405: "Method Not Allowed",
+               503: "Service Unavailable"}
+REQUEST_TIMEOUT = 10                   # timeout for reading a request
+MAX_HEADERS     = 64
+MAX_EVENTS      = 16                   # events pending per SSE-client
+
+# --- helper class for requests   ---------------------------------------------
+
+class Request(object):
+  """ parsed HTTP-request """
+
+  def __init__(self,method,target,headers,reader,writer):
+    """ initialization """
+
+    url          = urllib.parse.urlsplit(target)
+    self.method  = method
+    self.path    = urllib.parse.unquote(url.path)
+    self.query   = dict(urllib.parse.parse_qsl(url.query))
+    self.headers = headers
+    self.reader  = reader
+    self.writer  = writer
+
+# --- API server   ------------------------------------------------------------
+
+class Api(Base):
+  """ HTTP/JSON-API """
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app        = app
+    self._routes     = []                   # (method,path,prefix?,handler)
+    self._clients    = set()                # subscriptions of SSE-clients
+    self.read_config()
+
+    self.add_route("GET", "/status",   self._get_status)
+    self.add_route("GET", "/channels", self._get_channels)
+    self.add_route("GET", "/functions",self._get_functions)
+    self.add_route("POST","/exec/",    self._post_exec,prefix=True)
+    self.add_route("GET", "/events",   self._get_events)
+    self.add_route("GET", "/metrics",  self._get_metrics)
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug  = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+    self._active = self.get_value(self._app.parser,"GLOBAL", "api","0") == "1"
+
+    # section [API]
+    self._host        = self.get_value(self._app.parser,"API","host","127.0.0.1")
+    self._port        = int(self.get_value(self._app.parser,"API","port",8080))
+    self._max_clients = int(self.get_value(self._app.parser,"API","clients",32))
+
+  # --- return active-state of the object   -----------------------------------
+
+  def is_active(self):
+    """ return active-state (overrides SRBase.is_active()) """
+
+    return self._active
+
+  # --- add a route   ---------------------------------------------------------
+
+  def add_route(self,method,path,handler,prefix=False):
+    """ register a handler (coroutine) for the given method and path """
+
+    self._routes.append((method,path,prefix,handler))
+
+  # --- start server   --------------------------------------------------------
+
+  def start(self):
+    """ start server within the shared event-loop """
+
+    if self._active:
+      self._app.eventloop.submit(self._serve())
+
+  # --- server   --------------------------------------------------------------
+
+  async def _serve(self):
+    """ run the server """
+
+    self.debug("starting API-server on %s:%d",self._host,self._port)
+    try:
+      server = await asyncio.start_server(self._handle,self._host,self._port)
+      async with server:
+        await server.serve_forever()
+    except asyncio.CancelledError:
+      pass
+    except:
+      print("[ERROR] could not start API-server on %s:%d" %
+            (self._host,self._port))
+      if self._debug:
+        traceback.print_exc()
+
+  # --- handle a single connection   ------------------------------------------
+
+  async def _handle(self,reader,writer):
+    """ parse request and dispatch it to a handler """
+
+    try:
+      request = await asyncio.wait_for(self._read_request(reader,writer),
+                                       REQUEST_TIMEOUT)
+      if request is None:
+        await self.send_json(writer,400,{"error": "invalid request"})
+        return
+
+      status = 404
+      for (method,path,prefix,handler) in self._routes:
+        if request.path == path or (prefix and request.path.startswith(path)):
+          if request.method != method:
+            status = 405
+            continue
+          await handler(request)
+          break
+      else:
+        await self.send_json(writer,status,{"error": HTTP_STATUS[status]})
+    except (asyncio.TimeoutError,ConnectionError,asyncio.CancelledError):
+      pass
+    except:
+      if self._debug:
+        traceback.print_exc()
+    finally:
+      writer.close()
+
+  # --- read request   --------------------------------------------------------
+
+  async def _read_request(self,reader,writer):
+    """ read request-line and headers """
+
+    line = await reader.readline()
+    try:
+      (method,target,_) = line.decode('latin-1').split()
+    except ValueError:
+      return None
+
+    headers = {}
+    for i in range(MAX_HEADERS):
+      line = await reader.readline()
+      line = line.decode('latin-1').rstrip('\r\n')
+      if not line:
+        break
+      (name,_,value) = line.partition(':')
+      headers[name.strip().lower()] = value.strip()
+    else:
+      return None
+    return Request(method,target,headers,reader,writer)
+
+  # --- send response header   ------------------------------------------------
+
+  def send_header(self,writer,status,content_type,length=None,extra=[]):
+    """ write status-line and headers """
+
+    header = ["HTTP/1.1 %d %s" % (status,HTTP_STATUS.get(status,"")),
+              "Content-Type: %s" % content_type,
+              "Cache-Control: no-cache",
+              "Connection: close"]
+    if length is not None:
+      header.append("Content-Length: %d" % length)
+    header.extend(extra)
+    writer.write(("\r\n".join(header)+"\r\n\r\n").encode('latin-1'))
+
+  # --- send JSON-response   --------------------------------------------------
+
+  async def send_json(self,writer,status,obj):
+    """ send object as JSON """
+
+    body = json.dumps(obj,indent=2,sort_keys=True).encode('utf-8')
+    self.send_header(writer,status,"application/json",len(body))
+    writer.write(body)
+    await writer.drain()
+
+  # --- format an event of the bus   -----------------------------------------
+
+  def _format_event(self,event):
+    """ return Server-Sent-Event (data of titles: just the title) """
+
+    data = event.title if isinstance(event,TitleEvent) else event._asdict()
+    return ("event: %s\ndata: %s\n\n" %
+            (TOPICS[type(event)],json.dumps(data))).encode('utf-8')
+
+  # --- GET /status   ---------------------------------------------------------
+
+  async def _get_status(self,request):
+    """ return status of radio, player and recorder """
+
+    status = {
+      "mode":     "player" if self._app.player.is_active() else "radio",
+      "radio":    self._app.radio.get_status(),
+      "player":   self._app.player.get_status(),
+      "recorder": self._app.recorder.get_status(),
+      "title":    getattr(self._app.bus.last(TitleEvent),"title",None)
+      }
+    await self.send_json(request.writer,200,status)
+
+  # --- GET /channels   -------------------------------------------------------
+
+  async def _get_channels(self,request):
+    """ return list of channels """
+
+    radio    = self._app.radio
+    channels = [{"nr": i+1, "name": name, "url": url,
+                 "dead": radio.is_dead(i)}
+                for (i,(name,url)) in enumerate(radio.get_channels())]
+    await self.send_json(request.writer,200,channels)
+
+  # --- GET /functions   ------------------------------------------------------
+
+  async def _get_functions(self,request):
+    """ return list of functions """
+
+    await self.send_json(request.writer,200,self._app.get_func_names())
+
+  # --- POST /exec/<function>?key=<key>   -------------------------------------
+
+  async def _post_exec(self,request):
+    """ execute a function """
+
+    func_name = request.path[len("/exec/"):]
+    if func_name not in self._app.get_func_names():
+      await self.send_json(request.writer,404,{"error": "unknown function"})
+      return
+    key = request.query.get("key","_")
+    self._app.queue_func(func_name,key)
+    await self.send_json(request.writer,202,{"function": func_name,
+                                             "key": key})
+
+  # --- GET /metrics   --------------------------------------------------------
+
+  async def _get_metrics(self,request):
+    """ return metrics in the Prometheus text-format """
+
+    body = self._app.metrics.render().encode('utf-8')
+    self.send_header(request.writer,200,"text/plain; version=0.0.4",len(body))
+    request.writer.write(body)
+    await request.writer.drain()
+
+  # --- GET /events   ---------------------------------------------------------
+
+  async def _get_events(self,request):
+    """ stream events as Server-Sent-Events """
+
+    if len(self._clients) >= self._max_clients:
+      await self.send_json(request.writer,503,{"error": "too many clients"})
+      return
+
+    # the bus drops the oldest events of slow clients
+    wake   = asyncio.Event()
+    client = self._app.bus.subscribe(*TOPICS,maxlen=MAX_EVENTS,
+                        notify=lambda: self._app.eventloop.call_soon(wake.set))
+    self._clients.add(client)
+    try:
+      self.send_header(request.writer,200,"text/event-stream")
+      title = self._app.bus.last(TitleEvent)
+      if title:
+        request.writer.write(self._format_event(title))
+      while True:
+        for event in client.drain():
+          request.writer.write(self._format_event(event))
+        await request.writer.drain()
+        await wake.wait()
+        wake.clear()
+    finally:
+      client.close()
+      self._clients.discard(client)
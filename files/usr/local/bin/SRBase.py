@@ -12,19 +12,152 @@
 #
 # -----------------------------------------------------------------------------
 
-import sys
+import sys, logging, collections, json
+
+try:
+  from systemd import journal
+  have_journal = True
+except ImportError:
+  have_journal = False
+
+LOGGER = "simple-radio"
+FORMAT = "[%(levelname)s] %(component)s: %(message)s"
+
+_loggers = {}                                    # class -> logger
+
+# --- filter: per-component log-levels   ---------------------------------------
+
+class ComponentFilter(logging.Filter):
+  """ filter records by the level configured for the component """
+
+  def __init__(self,levels,default):
+    """ initialization """
+    super(ComponentFilter,self).__init__()
+    self._levels  = levels
+    self._default = default
+
+  def filter(self,record):
+    """ add component-name and check level """
+    record.component = record.name.rpartition('.')[2]
+    return record.levelno >= self._levels.get(record.component,self._default)
+
+# --- formatter for structured output   ----------------------------------------
+
+class JsonFormatter(logging.Formatter):
+  """ format records as one JSON-object per line """
+
+  def format(self,record):
+    """ return JSON-representation of the record """
+    return json.dumps({"ts":        record.created,
+                       "level":     record.levelname,
+                       "component": record.name.rpartition('.')[2],
+                       "thread":    record.threadName,
+                       "msg":       record.getMessage()})
+
+# --- handler keeping the last n records in memory   ---------------------------
+
+class RingHandler(logging.Handler):
+  """ keep the last n records (unformatted) for post-mortem dumps """
+
+  def __init__(self,size):
+    """ initialization """
+    super(RingHandler,self).__init__()
+    self.records = collections.deque(maxlen=size)
+
+  def emit(self,record):
+    """ store record, formatting is deferred until the dump """
+    self.records.append(record)
+
+  def dump(self,stream=sys.stderr):
+    """ write records to the given stream """
+    formatter = logging.Formatter(
+      "%(asctime)s [%(levelname)s] %(threadName)s %(name)s: %(message)s")
+    for record in list(self.records):
+      stream.write(formatter.format(record)+"\n")
+    stream.flush()
+
+_ring = None
+
+# --- configure logging   ------------------------------------------------------
+
+def setup_logging(parser):
+  """ configure logging from section [GLOBAL] """
+
+  def get(option,default):
+    if parser.has_option("GLOBAL",option):
+      return parser.get("GLOBAL",option)
+    return default
+
+  global _ring
+  default = logging.DEBUG if get("debug","0") == "1" else logging.WARNING
+  levels  = {}
+  for item in get("log_levels","").split(","):
+    (name,_,level) = item.partition("=")
+    level = logging.getLevelName(level.strip().upper())
+    if not name.strip():
+      continue
+    elif isinstance(level,int):
+      levels[name.strip()] = level
+    else:
+      print("[WARNING] invalid log-level for %s" % name.strip())
+
+  logger = logging.getLogger(LOGGER)
+  logger.propagate = False
+  for handler in list(logger.handlers):
+    logger.removeHandler(handler)
+
+  # output: stderr or journald
+  target = get("log_target","stderr")
+  if target == "journal" and have_journal:
+    handler = journal.JournalHandler(SYSLOG_IDENTIFIER=LOGGER)
+  else:
+    if target == "journal":
+      print("[WARNING] could not import systemd.journal, logging to stderr")
+    handler = logging.StreamHandler(sys.stderr)
+  if get("log_format","text") == "json":
+    handler.setFormatter(JsonFormatter())
+  else:
+    handler.setFormatter(logging.Formatter(FORMAT))
+  handler.addFilter(ComponentFilter(levels,default))
+  logger.addHandler(handler)
+
+  # in-memory ring-buffer (records everything down to DEBUG)
+  ring_size = int(get("log_ring",0))
+  if ring_size:
+    _ring = RingHandler(ring_size)
+    logger.addHandler(_ring)
+  else:
+    _ring = None
+
+  # logger-levels decide if a message is created at all
+  logger.setLevel(logging.DEBUG if _ring else default)
+  for (name,level) in levels.items():
+    logging.getLogger("%s.%s" % (LOGGER,name)).setLevel(
+      logging.DEBUG if _ring else level)
+
+# --- dump ring-buffer   -------------------------------------------------------
+
+def dump_log(stream=sys.stderr):
+  """ dump ring-buffer (if configured) """
+
+  if _ring:
+    stream.write("[INFO] dumping last %d log-records\n" % len(_ring.records))
+    _ring.dump(stream)
 
 class Base(object):
   """ base class with common methods """
 
-  # --- print debug messages   ------------------------------------------------
+  # --- log debug messages   --------------------------------------------------
 
-  def debug(self,text):
-    """ print debug-message """
+  def debug(self,msg,*args):
+    """ log debug-message. Arguments are only formatted if the message
+        is actually emitted (or dumped from the ring-buffer) """
 
-    if self._debug:
-      sys.stderr.write("[DEBUG] %s\n" % text)
-      sys.stderr.flush()
+    logger = _loggers.get(self.__class__)
+    if logger is None:
+      logger = logging.getLogger("%s.%s" % (LOGGER,self.__class__.__name__))
+      _loggers[self.__class__] = logger
+    logger.debug(msg,*args)
 
   # --- read configuration value   --------------------------------------------
 
@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class Bus
+#
+# The class Bus is an in-process publish/subscribe event-bus with typed
+# topics (one event-class per topic). Publishing never blocks: a
+# subscription either keeps a bounded number of events (dropping the
+# oldest) or only the latest event of every topic. The bus retains the
+# last event of every topic for state-queries.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import threading, collections, traceback
+
+from SRBase import Base
+
+# --- topics   ----------------------------------------------------------------
+
+TitleEvent    = collections.namedtuple("TitleEvent",["title"])
+ChannelEvent  = collections.namedtuple("ChannelEvent",["nr","name"])
+PlaybackEvent = collections.namedtuple("PlaybackEvent",["state","radio"])
+RecordEvent   = collections.namedtuple("RecordEvent",
+                                       ["recording","channel","start","duration"])
+VolumeEvent   = collections.namedtuple("VolumeEvent",["volume"])
+
+TOPICS = {TitleEvent:    "title",       # new ICY-title
+          ChannelEvent:  "channel",     # tuned channel (nr None: radio off)
+          PlaybackEvent: "playback",    # state: playing|paused|stopped
+          RecordEvent:   "record",      # recording started/stopped
+          VolumeEvent:   "volume"}      # new volume (percent)
+
+MAX_EVENTS = 16                         # default size of a subscription
+
+# --- subscription of a single consumer   -------------------------------------
+
+class Subscription(object):
+  """ pending events of some topics for a single consumer """
+
+  def __init__(self,bus,topics,maxlen,latest,notify):
+    """ initialization """
+
+    self._bus    = bus
+    self.topics  = topics
+    self.maxlen  = maxlen
+    self.latest  = latest
+    self.notify  = notify                # callback, must not block
+    self.dropped = 0
+    self._cond   = threading.Condition()
+    if latest:
+      self._events = collections.OrderedDict()  # topic -> event
+    else:
+      self._events = collections.deque()
+
+  # --- add event (called by the bus)   ---------------------------------------
+
+  def _put(self,event):
+    """ add event, drop the oldest (bounded) or the previous (latest) """
+
+    with self._cond:
+      if self.latest:
+        self._events.pop(type(event),None)
+        self._events[type(event)] = event
+      else:
+        if len(self._events) >= self.maxlen:
+          self._events.popleft()
+          self.dropped += 1
+          self._bus._m_dropped.inc()
+        self._events.append(event)
+      self._cond.notify()
+    if self.notify:
+      self.notify()
+
+  # --- return next event   ---------------------------------------------------
+
+  def get(self,timeout=None):
+    """ return next event (None after timeout, timeout 0 won't wait) """
+
+    with self._cond:
+      if not self._events and timeout != 0:
+        self._cond.wait(timeout)
+      if not self._events:
+        return None
+      if self.latest:
+        return self._events.popitem(last=False)[1]
+      return self._events.popleft()
+
+  # --- return all pending events   -------------------------------------------
+
+  def drain(self):
+    """ return (and remove) all pending events """
+
+    with self._cond:
+      events = list(self._events.values() if self.latest else self._events)
+      self._events.clear()
+    return events
+
+  # --- unsubscribe   ---------------------------------------------------------
+
+  def close(self):
+    """ remove subscription from the bus """
+
+    self._bus.unsubscribe(self)
+
+# --- event-bus   -------------------------------------------------------------
+
+class Bus(Base):
+  """ publish/subscribe event-bus """
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app    = app
+    self._lock   = threading.Lock()
+    self._subscriptions = []
+    self._last   = {}                    # topic -> last event
+    self._m_events  = app.metrics.counter("simple_radio_bus_events_total",
+                                          "events published on the bus")
+    self._m_dropped = app.metrics.counter("simple_radio_bus_dropped_total",
+                                          "events dropped (slow subscribers)")
+    self.read_config()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+
+  # --- subscribe topics   ----------------------------------------------------
+
+  def subscribe(self,*topics,maxlen=MAX_EVENTS,latest=False,notify=None):
+    """ return subscription for the given topics. A latest-value
+        subscription starts with the retained events of its topics """
+
+    subscription = Subscription(self,topics,maxlen,latest,notify)
+    with self._lock:
+      self._subscriptions.append(subscription)
+      retained = [self._last[t] for t in topics if t in self._last]
+    if latest:
+      for event in retained:
+        subscription._put(event)
+    return subscription
+
+  # --- unsubscribe   ---------------------------------------------------------
+
+  def unsubscribe(self,subscription):
+    """ remove subscription """
+
+    with self._lock:
+      if subscription in self._subscriptions:
+        self._subscriptions.remove(subscription)
+
+  # --- publish an event   ----------------------------------------------------
+
+  def publish(self,event):
+    """ pass event to all subscribers of its topic (thread-safe, never
+        blocks) """
+
+    self.debug("publish %r",event)
+    with self._lock:
+      self._last[type(event)] = event
+      subscriptions = [s for s in self._subscriptions if type(event) in s.topics]
+    self._m_events.inc()
+    for subscription in subscriptions:
+      try:
+        subscription._put(event)
+      except:
+        if self._debug:
+          traceback.print_exc()
+
+  # --- return last event of a topic   ----------------------------------------
+
+  def last(self,topic):
+    """ return retained event of the topic (None if never published) """
+
+    return self._last.get(topic)
@@ -69,9 +69,9 @@ class CECController(Base):
     self._cecconfig.SetCommandCallback(self._process_command)
 
     self._controller = cec.ICECAdapter.Create(self._cecconfig)
-    self.debug("libCEC version " +
-          self._controller.VersionToString(self._cecconfig.serverVersion) +
-          " loaded: " + self._controller.GetLibInfo())
+    self.debug("libCEC version %s loaded: %s",
+          self._controller.VersionToString(self._cecconfig.serverVersion),
+          self._controller.GetLibInfo())
 
     # search for adapters
     self._com_port = self._get_com_port()
@@ -93,7 +93,7 @@ class CECController(Base):
     """ process keys """
 
     # if the remote sends keys, we could map the keys to commands here
-    self.debug("key: " + str(key))
+    self.debug("key: %s",key)
     return 0
 
   # --- process commands   ---------------------------------------------------
@@ -103,7 +103,7 @@ class CECController(Base):
 
     # if the remote sends (correct) commands, we could take actions here
     # e.g. turn on the radio
-    self.debug("cec command: " + cmd)
+    self.debug("cec command: %s",cmd)
     return 0
 
   # --- process log-messages   ------------------------------------------------
@@ -124,7 +124,7 @@ class CECController(Base):
     elif level == cec.CEC_LOG_DEBUG:
       levelstr = "CEC-DEBUG:   "
 
-    self.debug(levelstr + "[" + str(time) + "]     " + message)
+    self.debug("%s[%s]     %s",levelstr,time,message)
     return 0
 
   # --- return com port path of adapter   -------------------------------------
@@ -134,9 +134,9 @@ class CECController(Base):
 
     for adapter in self._controller.DetectAdapters():
       self.debug("CEC Adapter:")
-      self.debug("Port:     " + adapter.strComName)
-      self.debug("vendor:   " + hex(adapter.iVendorId))
-      self.debug("Produkt:  " + hex(adapter.iProductId))
+      self.debug("Port:     %s",adapter.strComName)
+      self.debug("vendor:   %#x",adapter.iVendorId)
+      self.debug("Produkt:  %#x",adapter.iProductId)
       return adapter.strComName
 
     self.debug("no cec adapter found")
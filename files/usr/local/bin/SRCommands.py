@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class CommandQueue
+#
+# Input-threads (keypad, lirc, api) only enqueue commands, a single worker
+# executes them in order. Waiting commands are coalesced: repeated volume-
+# and next/prev-steps merge into one command with a count, opposite steps
+# cancel each other and tuning a channel supersedes all waiting zaps.
+# Only volume-steps are executed before other waiting commands, since they
+# don't depend on the state of the playback.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import threading, time, collections, traceback
+from threading import Thread
+
+from SRBase import Base
+
+POLL_TIME = 1
+
+# functions which accept a count (value: opposite function)
+COALESCE = {"volume_up":    "volume_down",
+            "volume_down":  "volume_up",
+            "next_channel": "prev_channel",
+            "prev_channel": "next_channel"}
+
+# functions which tune a channel
+ZAPS = {"tune_channel","next_channel","prev_channel"}
+
+# functions executed before all others (never playback-state commands)
+URGENT = {"volume_up","volume_down"}
+
+class CommandQueue(Thread,Base):
+  """ queue and worker for all commands """
+
+  def __init__(self,app):
+    """ initialization """
+    super(CommandQueue,self).__init__(name="CommandQueue")
+
+    self._app     = app
+    self._cond    = threading.Condition()
+    self._pending = (collections.deque(),collections.deque())  # urgent,normal
+    self._m_wait  = app.metrics.histogram("simple_radio_command_wait_seconds",
+                                          "time commands wait for execution")
+    self._m_merge = app.metrics.counter("simple_radio_commands_coalesced_total",
+                                        "commands merged or superseded")
+    self.read_config()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+
+  # --- add a command   -------------------------------------------------------
+
+  def put(self,func_name,key):
+    """ enqueue command (coalesce with waiting commands) """
+
+    with self._cond:
+      pending = self._pending[0 if func_name in URGENT else 1]
+
+      # tuning a channel supersedes all waiting zaps
+      if func_name == "tune_channel":
+        count = len(pending)
+        for cmd in [cmd for cmd in pending if cmd[0] in ZAPS]:
+          pending.remove(cmd)
+        if count > len(pending):
+          self.debug("dropped %d waiting zaps",count-len(pending))
+          self._m_merge.inc(count-len(pending))
+
+      # merge with the last waiting command
+      if pending and func_name in COALESCE:
+        last = pending[-1]
+        if last[0] == func_name:
+          last[2] += 1
+          self._m_merge.inc()
+          return
+        elif last[0] == COALESCE[func_name]:
+          last[2] -= 1
+          if not last[2]:
+            pending.pop()
+          self._m_merge.inc(2 if not last[2] else 1)
+          return
+
+      pending.append([func_name,key,1,time.monotonic()])
+      self._cond.notify()
+
+  # --- fetch next command   --------------------------------------------------
+
+  def _get(self):
+    """ return next command (None on stop-request) """
+
+    with self._cond:
+      while not self._app.stop_event.is_set():
+        for pending in self._pending:
+          if pending:
+            return pending.popleft()
+        self._cond.wait(POLL_TIME)
+    return None
+
+  # --- worker thread   -------------------------------------------------------
+
+  def run(self):
+    """ execute commands """
+
+    self.debug("starting CommandQueue.run()")
+    while True:
+      cmd = self._get()
+      if not cmd:
+        break
+      (func_name,key,count,queued) = cmd
+      self._m_wait.observe(time.monotonic()-queued)
+      try:
+        self._app.exec_func(func_name,key,count,queued)
+      except:
+        if self._debug:
+          traceback.print_exc()
+    self.debug("terminating CommandQueue.run() on stop request")
@@ -3,7 +3,7 @@
 # -----------------------------------------------------------------------------
 # Simple radio: implementation of class Display
 #
-# The class Display controls a 1602 or 2004 LCD-display
+# The class Display controls a 1602 or 2004 LCD-display (paging or marquee)
 #
 # Author: Bernhard Bablok
 # License: GPL3
@@ -12,18 +12,17 @@
 #
 # -----------------------------------------------------------------------------
 
-import threading, os
+import threading, os, time
 from threading import Thread
-import queue, collections
-
-try:
-  import lcddriver
-  have_lcd = True
-except ImportError:
-  print("[WARNING] could not import lcddriver")
-  have_lcd = False
+import collections
 
 from SRBase import Base
+from SRBus  import ChannelEvent, PlaybackEvent, RecordEvent, VolumeEvent
+from SRDisplayBackend import BACKENDS, get_backend
+
+MARQUEE_MAX_SPEED = 10                             # chars/s (bounds I2C-load)
+POLL_TIME         = 1
+MAX_LINES         = 64                             # split lines pending
 
 class Display(Thread,Base):
   """ Display-controller """
@@ -33,8 +32,19 @@ class Display(Thread,Base):
     super(Display,self).__init__(name="Display")
 
     self._app              = app
-    self._content_queue    = queue.Queue()         # for split content data
+    self._content_queue    = collections.deque(maxlen=MAX_LINES)
     self._content_provider = None                  # content provider
+    self._wake             = threading.Event()     # refresh-request
+    self._events           = app.bus.subscribe(PlaybackEvent,
+                                               notify=self._wake.set)
+    self._changes          = app.bus.subscribe(ChannelEvent,RecordEvent,
+                                               VolumeEvent,latest=True,
+                                               notify=self._wake.set)
+    self._i2c_bytes        = 0
+    self._m_render = app.metrics.histogram("simple_radio_display_render_seconds",
+                                           "time to write a frame to the display")
+    self._m_i2c    = app.metrics.counter("simple_radio_i2c_bytes_total",
+                                         "bytes written to the I2C-bus")
     self.read_config()
 
   # --- read configuration   --------------------------------------------------
@@ -50,13 +60,25 @@ class Display(Thread,Base):
     # section [DISPLAY]
     have_disp         = (self.get_value(self._app.parser,
                                         "DISPLAY", "display","0") == "1")
-    self.have_disp    = have_lcd and have_disp
+    self._backend_name = self.get_value(self._app.parser,"DISPLAY","backend",
+                                        "lcd" if have_disp else "ansi")
+    self._path        = self.get_value(self._app.parser,"DISPLAY","path",None)
     self._i2c         = int(self.get_value(self._app.parser,"DISPLAY","i2c",0))
     self._rows        = int(self.get_value(self._app.parser,"DISPLAY", "rows",2))
     self._cols        = int(self.get_value(self._app.parser,"DISPLAY", "cols",16))
     self._scroll_time = int(self.get_value(self._app.parser,"DISPLAY", "scroll",3))
+    self._mode        = self.get_value(self._app.parser,"DISPLAY","mode","page")
+    speed             = float(self.get_value(self._app.parser,"DISPLAY",
+                                             "marquee_speed",4))
+    self._mq_speed    = max(0.5,min(speed,MARQUEE_MAX_SPEED))
+    self._mq_gap      = int(self.get_value(self._app.parser,"DISPLAY",
+                                           "marquee_gap",4))
+    self._mq_hold     = float(self.get_value(self._app.parser,"DISPLAY",
+                                             "marquee_hold",2))
+    self._mq_reset    = False
 
     rule              = self.get_value(self._app.parser,"DISPLAY","trans",None)
+    self._glyphs      = self.get_value(self._app.parser,"DISPLAY","glyphs",None)
     self._build_map(rule)
 
   # --- build translation map for display   -----------------------------------
@@ -86,44 +108,74 @@ class Display(Thread,Base):
   def init(self):
     """ initialize display """
 
+    # initialize backend, fall back to the terminal
+    backend = get_backend(self._backend_name)
+    if not backend:
+      print("[WARNING] unknown display-backend %s" % self._backend_name)
+      backend = BACKENDS["ansi"]
+    self._backend = backend(self)
+    if not self._backend.open():
+      self.debug("display-backend %s not available",self._backend_name)
+      self._backend = BACKENDS["ansi"](self)
+    geometry = self._backend.geometry()
+    if geometry:
+      (self._rows,self._cols) = geometry
+
     # initialize data structures
     self._content_deque   = collections.deque(maxlen=self._rows-1)
     self._fmt_line        = u"{0:%d.%ds}" % (self._cols,self._cols)
-
-    # initialize hardware
-    try:
-      self._lcd = lcddriver.lcd(port=self._i2c,tmap=self._transmap)
-    except NameError:
-      self.debug("no display detected")
-      self.have_disp = False
     title = self._content_provider.get_title()
     self._update_display(self._format_title(*title),[],True)
 
+  # --- request a refresh   -------------------------------------------------
+
+  def refresh(self):
+    """ update the display as soon as possible (e.g. after a key-event) """
+    self._wake.set()
+
+  # --- wait for timeout or refresh-request   -------------------------------
+
+  def _wait(self,timeout):
+    """ wait, return True on stop-request """
+
+    end = time.monotonic() + timeout
+    while not self._app.stop_event.is_set():
+      left = end - time.monotonic()
+      if left <= 0 or self._wake.wait(min(left,POLL_TIME)):
+        return False
+    return True
+
   # --- clear display   -----------------------------------------------------
 
   def clear(self):
     """ clear the display """
-    if self.have_disp:
-      self._lcd.lcd_clear()
+    self._backend.clear()
 
   # --- clear current content   ---------------------------------------------
 
   def clear_content(self):
     """ clear current content """
 
-    try:
-      count = 0
-      while not self._content_queue.empty():
-        count += 1
-        self.debug("  ... %d" % count)
-        self._content_queue.get_nowait()
-    except:
-      if self._debug:
-        traceback.print_exc()
-      pass
+    if self._mode == "marquee":
+      self._mq_reset = True
+      return
+
+    self.debug("clearing %d pending lines ...",len(self._content_queue))
+    self._content_queue.clear()
     self.debug("... and clearing lines on the display")
     for i in range(self._rows-1):
-      self._content_queue.put(" ")
+      self._content_queue.append(" ")
+
+  # --- process events of the bus   -----------------------------------------
+
+  def _handle_events(self):
+    """ clear content after live radio stopped (other events only wake) """
+
+    self._changes.drain()
+    for event in self._events.drain():
+      if (isinstance(event,PlaybackEvent) and event.radio and
+          event.state == "stopped"):
+        self.clear_content()
 
   # --- split content to fit to the display   -------------------------------
 
@@ -131,10 +183,10 @@ class Display(Thread,Base):
     """ split content into chunks """
 
     for line in lines:
-      self.debug("splitting line: %s" % line)
+      self.debug("splitting line: %s",line)
       while len(line) > self._cols:
         split = line[:self._cols].rfind(" ")
-        self.debug("split: %d" % split)
+        self.debug("split: %d",split)
         if split == -1:
           # hard split within a word
           split = self._cols
@@ -142,54 +194,51 @@ class Display(Thread,Base):
         else:
           # split at blank: drop blank
           rest  = line[(split+1):]
-        self.debug("adding: %s" % line[:split])
-        self._content_queue.put(line[:split])
+        self.debug("adding: %s",line[:split])
+        self._content_queue.append(line[:split])
         line = rest
-        self.debug("text left: %s" % line)
+        self.debug("text left: %s",line)
       if len(line):
-        self._content_queue.put(line)
+        self._content_queue.append(line)
 
   # --- pull the next content from the queue to the display-deque   ---------
 
   def _next_content(self):
     # poll queue for data and append to deque
-    try:
-      for  i in range(self._rows-1):
-        line = self._content_queue.get_nowait()
-        self.debug("update_display: line: %s" % line)
-        self._content_deque.append(line)
-    except queue.Empty:
-      self._content_deque.append("")
-    except:
-      if self._debug:
-        traceback.print_exc()
+    for  i in range(self._rows-1):
+      if not self._content_queue:
+        self._content_deque.append("")
+        break
+      line = self._content_queue.popleft()
+      self.debug("update_display: line: %s",line)
+      self._content_deque.append(line)
+
+  # --- precompute the frames of a marquee-line   ----------------------------
+
+  def _marquee_frames(self,line):
+    """ return all frames of a line (short lines don't scroll) """
+
+    if len(line) <= self._cols:
+      return (line,)
+    loop   = line + self._mq_gap*' '
+    double = loop + loop
+    hold   = max(1,int(self._mq_hold*self._mq_speed))
+    return tuple(hold*[double[:self._cols]] +
+                 [double[i:i+self._cols] for i in range(1,len(loop))])
 
   # --- write to the display   ----------------------------------------------
 
   def _update_display(self,title,lines,clear=False):
     """ write to the display """
 
-    # clear screen in simulation-mode (unless debugging)
     if clear:
-      if self.have_disp:
-        pass
-      else:
-        print("\033c")
-
-    # write data to display
-    if self.have_disp:
-      self._lcd.lcd_display_string(title,1)
-      nr = 2
-      for line in lines:
-        self._lcd.lcd_display_string(self._fmt_line.format(line),nr)
-        nr += 1
-    else:
-      # simulate display
-      print("-%s-" % (self._cols*'-'))
-      print("|%s|" % title)
-      for line in lines:
-        print("|%s|" % self._fmt_line.format(line))
-      print("-%s-" % (self._cols*'-'))
+      self._backend.clear()
+
+    # build the complete frame and pass it to the backend
+    rows = [self._fmt_line.format(title)]
+    rows.extend([self._fmt_line.format(line) for line in lines])
+    rows.extend((self._rows-len(rows))*[self._cols*' '])
+    self._backend.write(rows)
 
   # --- format title   -------------------------------------------------------
 
@@ -216,24 +265,93 @@ class Display(Thread,Base):
     """ display-controller-thread """
 
     self.debug("starting update_display")
+    if self._mode == "marquee":
+      self._run_marquee()
+      return
 
+    next_page = time.monotonic()
     while True:
+      self._wake.clear()
+      self._handle_events()
       if self._content_provider:
-        title   = self._content_provider.get_title()
-        if self._content_queue.qsize() < self._rows-1:
+        title = self._content_provider.get_title()
+      else:
+        title = ("","")
+      if time.monotonic() >= next_page:
+        # next page (a refresh-request only updates the title)
+        if (self._content_provider and
+            len(self._content_queue) < self._rows-1):
           # only ask for new content if we don't have enough to display
           content = self._content_provider.get_content()
           if content:
-            self._split_content(content)                 # split and push
-      else:
-        title = ("","")
-      self._next_content()                             # pop lines to deque
-      self._update_display(self._format_title(*title),self._content_deque)
+            self._split_content(content)               # split and push
+        self._next_content()                           # pop lines to deque
+        next_page = time.monotonic() + self._scroll_time
+      self._write_frame(title,self._content_deque)
 
       # sleep
-      if self._app.stop_event.wait(self._scroll_time):
-        self.debug("terminating update_display on stop request")
-        if self.have_disp:
-          self._lcd.lcd_clear()
-          self._lcd.lcd_backlight('OFF')
-        return
+      if self._wait(next_page-time.monotonic()):
+        break
+
+    self.debug("terminating update_display on stop request")
+    self._backend.close()
+
+  # --- marquee: scroll every content-line on its own   ----------------------
+
+  def _run_marquee(self):
+    """ scroll long lines smoothly, one char per step """
+
+    step   = 1.0/self._mq_speed
+    poll   = max(1,int(self._mq_speed))              # poll provider every ~1s
+    title  = ("","")
+    lines  = []
+    frames = []
+    tick   = 0
+    next_t = time.monotonic()
+    woken  = False
+
+    while True:
+      self._handle_events()
+      if self._mq_reset:
+        self._mq_reset = False
+        (lines,frames) = ([],[])
+      if self._content_provider and (woken or tick % poll == 0):
+        title   = self._content_provider.get_title()
+      if self._content_provider and not woken and tick % poll == 0:
+        content = self._content_provider.get_content()
+        # ignore separator-lines, keep the latest lines
+        content = [line for line in content if line.strip('*')]
+        content = content[-(self._rows-1):] if self._rows > 1 else []
+        if content and content != lines:
+          lines  = content
+          frames = [self._marquee_frames(line) for line in lines]
+          tick   = 0
+      self._write_frame(title,[f[tick % len(f)] for f in frames])
+      if not woken:
+        tick   += 1
+        next_t += step
+
+      # sleep until the next step (no drift, skip missed steps)
+      now = time.monotonic()
+      if next_t < now:
+        next_t = now
+      if self._wait(next_t-now):
+        break
+      woken = self._wake.is_set()
+      self._wake.clear()
+
+    self.debug("terminating update_display on stop request")
+    self._backend.close()
+
+  # --- write a frame and update metrics   -----------------------------------
+
+  def _write_frame(self,title,lines):
+    """ write frame to the backend """
+
+    start = time.monotonic()
+    self._update_display(self._format_title(*title),lines)
+    self._m_render.observe(time.monotonic()-start)
+    i2c_bytes = self._backend.bytes_written
+    if i2c_bytes != self._i2c_bytes:
+      self._m_i2c.inc(i2c_bytes-self._i2c_bytes)
+      self._i2c_bytes = i2c_bytes
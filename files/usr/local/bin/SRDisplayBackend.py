@@ -0,0 +1,291 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of display-backends
+#
+# A backend writes complete frames (list of rows) to a device. Available
+# backends: lcd (I2C-LCD), ansi (terminal, only changed cells are
+# rewritten), null (headless), file and socket (publish frames for remote
+# viewers).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import os, sys, socket, json, traceback
+
+try:
+  import lcddriver, lcdcharset
+  have_lcd = True
+except ImportError:
+  print("[WARNING] could not import lcddriver")
+  have_lcd = False
+
+from SRBase import Base
+
+# --- base class of all backends   --------------------------------------------
+
+class Backend(Base):
+  """ null-backend and base-class of all backends """
+
+  def __init__(self,display):
+    """ initialization """
+
+    self._debug       = display._debug
+    self._rows        = display._rows
+    self._cols        = display._cols
+    self.bytes_written = 0                         # bytes written to a bus
+
+  def open(self):
+    """ open device, return False if the device is not available """
+    return True
+
+  def geometry(self):
+    """ return (rows,cols) if the backend defines the geometry """
+    return None
+
+  def clear(self):
+    """ clear the device """
+    pass
+
+  def write(self,rows):
+    """ write a frame (list of rows of exactly cols characters) """
+    pass
+
+  def close(self):
+    """ close device """
+    pass
+
+# --- I2C-LCD   ---------------------------------------------------------------
+
+class LcdBackend(Backend):
+  """ LCD with HD44780 controller on the I2C-bus """
+
+  def __init__(self,display):
+    """ initialization """
+
+    super(LcdBackend,self).__init__(display)
+    self._i2c      = display._i2c
+    self._transmap = display._transmap
+    self._glyphs   = display._glyphs
+    self._last     = []                          # last rows (text)
+    self._last_raw = []                          # last rows (bytes)
+
+  def open(self):
+    """ initialize hardware """
+
+    if not have_lcd:
+      return False
+    try:
+      self._lcd = lcddriver.lcd(port=self._i2c,tmap=self._transmap,
+                                glyphs=self._glyphs)
+      return True
+    except:
+      self.debug("no display detected")
+      if self._debug:
+        traceback.print_exc()
+      return False
+
+  def clear(self):
+    """ clear the display """
+    self._lcd.lcd_clear()
+    self._last     = []
+    self._last_raw = []
+
+  def write(self,rows):
+    """ write changed cells only """
+
+    raw = []
+    for (nr,row) in enumerate(rows):
+      if nr >= len(self._last) or row != self._last[nr]:
+        self._lcd.count_glyphs(row)
+      raw.append(lcdcharset.translate(row,self._lcd.table,self._cols))
+
+    for (nr,data) in enumerate(raw):
+      old = self._last_raw[nr] if nr < len(self._last_raw) else None
+      if old is None or len(old) != len(data):
+        self._lcd.lcd_display_bytes(data,nr+1)
+        continue
+      # write runs of changed bytes (gaps of one byte are written, since
+      # this is cheaper than setting the address again)
+      col = 0
+      while col < len(data):
+        if data[col] == old[col]:
+          col += 1
+          continue
+        end = col + 1
+        while end < len(data) and (data[end] != old[end] or
+                                   (end+1 < len(data) and
+                                    data[end+1] != old[end+1])):
+          end += 1
+        self._lcd.lcd_display_bytes(data[col:end],nr+1,col)
+        col = end
+    self._last     = list(rows)
+    self._last_raw = raw
+    self.bytes_written = self._lcd.lcd_device.bytes_written
+
+  def close(self):
+    """ clear display and turn off backlight """
+
+    self._lcd.lcd_clear()
+    self._lcd.lcd_backlight('OFF')
+
+# --- terminal with ANSI escape-sequences   -----------------------------------
+
+class AnsiBackend(Backend):
+  """ simulated display on a terminal, only changed cells are rewritten """
+
+  def __init__(self,display,stream=sys.stdout):
+    """ initialization """
+
+    super(AnsiBackend,self).__init__(display)
+    self._stream = stream
+    self._last   = None                          # last frame written
+
+  def clear(self):
+    """ clear screen and draw the frame on the next write """
+    self._last = None
+
+  def write(self,rows):
+    """ write changed cells (first frame: clear screen and draw the box) """
+
+    out = []
+    if self._last is None:
+      border = "-%s-" % (self._cols*'-')
+      out.append("\033[H\033[2J%s" % border)
+      for row in rows:
+        out.append("\n|%s|" % row)
+      out.append("\n%s\n" % border)
+    else:
+      for (nr,(new,old)) in enumerate(zip(rows,self._last)):
+        col = 0
+        while col < self._cols:
+          if new[col] == old[col]:
+            col += 1
+            continue
+          end = col + 1
+          while end < self._cols and new[end] != old[end]:
+            end += 1
+          out.append("\033[%d;%dH%s" % (nr+2,col+2,new[col:end]))
+          col = end
+      if out:
+        out.append("\033[%d;1H" % (len(rows)+3))   # park cursor below box
+    self._last = list(rows)
+    if out:
+      self._stream.write("".join(out))
+      self._stream.flush()
+
+# --- publish frames to a file   ----------------------------------------------
+
+class FileBackend(Backend):
+  """ write changed frames atomically to a file """
+
+  def __init__(self,display):
+    """ initialization """
+
+    super(FileBackend,self).__init__(display)
+    self._path = display._path or "/run/simple-radio.display"
+    self._last = None
+
+  def write(self,rows):
+    """ replace file if the frame changed """
+
+    if rows == self._last:
+      return
+    self._last = list(rows)
+    tmp = self._path + ".tmp"
+    try:
+      with open(tmp,"w") as f:
+        f.write("\n".join(rows)+"\n")
+      os.replace(tmp,self._path)
+    except OSError:
+      if self._debug:
+        traceback.print_exc()
+
+# --- publish frames to a unix-socket   ---------------------------------------
+
+class SocketBackend(Backend):
+  """ send changed frames as JSON-lines to all clients of a unix-socket """
+
+  def __init__(self,display):
+    """ initialization """
+
+    super(SocketBackend,self).__init__(display)
+    self._path    = display._path or "/run/simple-radio.display.sock"
+    self._clients = []
+    self._last    = None
+
+  def open(self):
+    """ create listening socket """
+
+    try:
+      if os.path.exists(self._path):
+        os.unlink(self._path)
+      self._socket = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+      self._socket.bind(self._path)
+      self._socket.listen(4)
+      self._socket.setblocking(False)
+      return True
+    except OSError:
+      if self._debug:
+        traceback.print_exc()
+      return False
+
+  def _send(self,client,data):
+    """ send data, drop clients which can't keep up """
+
+    try:
+      if client.send(data,socket.MSG_DONTWAIT) == len(data):
+        return True
+    except OSError:
+      pass
+    client.close()
+    return False
+
+  def write(self,rows):
+    """ accept new clients and send changed frames """
+
+    data = (json.dumps({"rows": rows})+"\n").encode('utf-8')
+    if rows != self._last:
+      self._last    = list(rows)
+      self._clients = [c for c in self._clients if self._send(c,data)]
+
+    while True:
+      try:
+        (client,_) = self._socket.accept()
+      except OSError:
+        break
+      self.debug("new display-client")
+      if self._send(client,data):
+        self._clients.append(client)
+
+  def close(self):
+    """ close all connections and remove the socket """
+
+    for client in self._clients:
+      client.close()
+    self._socket.close()
+    os.unlink(self._path)
+
+BACKENDS = {"null":   Backend,
+            "lcd":    LcdBackend,
+            "ansi":   AnsiBackend,
+            "file":   FileBackend,
+            "socket": SocketBackend}
+
+# graphic backends are only imported on demand (they need PIL)
+GRAPHIC_BACKENDS = {"ssd1306": "SSD1306Backend",
+                    "st7789":  "ST7789Backend"}
+
+# --- return class of a backend   ---------------------------------------------
+
+def get_backend(name):
+  """ return class of the backend with the given name (None if unknown) """
+
+  if name in GRAPHIC_BACKENDS:
+    import SRGraphicDisplay
+    return getattr(SRGraphicDisplay,GRAPHIC_BACKENDS[name])
+  return BACKENDS.get(name)
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class EventLoop
+#
+# The class EventLoop runs a single asyncio event-loop in a thread. It is
+# shared by all components doing network-I/O in the background.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import asyncio, traceback
+from threading import Thread
+
+from SRBase import Base
+
+class EventLoop(Thread,Base):
+  """ thread running the shared asyncio event-loop """
+
+  def __init__(self,app):
+    """ initialization """
+    super(EventLoop,self).__init__(name="EventLoop")
+
+    self._app = app
+    self.loop = asyncio.new_event_loop()
+    self.read_config()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug  = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+
+  # --- run a coroutine within the loop   -------------------------------------
+
+  def submit(self,coro):
+    """ schedule coroutine (thread-safe), returns a concurrent future """
+
+    return asyncio.run_coroutine_threadsafe(coro,self.loop)
+
+  # --- call a function within the loop   -------------------------------------
+
+  def call_soon(self,func,*args):
+    """ schedule function (thread-safe) """
+
+    if not self.loop.is_closed():
+      self.loop.call_soon_threadsafe(func,*args)
+
+  # --- stop the loop   -------------------------------------------------------
+
+  def stop(self):
+    """ stop the event-loop (thread-safe) """
+
+    self.call_soon(self.loop.stop)
+
+  # --- run the loop   --------------------------------------------------------
+
+  def run(self):
+    """ run event-loop until stopped """
+
+    self.debug("starting EventLoop.run()")
+    asyncio.set_event_loop(self.loop)
+    try:
+      self.loop.run_forever()
+
+      # cancel pending tasks and give them a chance to clean up
+      tasks = asyncio.all_tasks(self.loop)
+      for task in tasks:
+        task.cancel()
+      self.loop.run_until_complete(
+        asyncio.gather(*tasks,return_exceptions=True))
+    except:
+      if self._debug:
+        traceback.print_exc()
+    finally:
+      self.loop.close()
+    self.debug("terminating EventLoop.run() on stop request")
@@ -0,0 +1,362 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: display-backends for graphic displays
+#
+# Frames are rendered to a bitmap (text layout with a render-cache, volume-
+# and recording-bars), compared with the last frame and only the dirty
+# regions are transferred to the panel. Supported panels: SSD1306 (I2C,
+# monochrome OLED) and ST7789 (SPI, color TFT).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import time, collections, traceback
+
+try:
+  from PIL import Image, ImageDraw, ImageFont, ImageChops
+  have_pil = True
+except ImportError:
+  print("[WARNING] could not import PIL")
+  have_pil = False
+
+try:
+  import smbus
+except ImportError:
+  smbus = None
+
+try:
+  import spidev
+  import RPi.GPIO as GPIO
+except ImportError:
+  spidev = None
+
+from SRBus            import VolumeEvent, RecordEvent
+from SRDisplayBackend import Backend
+
+CACHE_SIZE = 128                 # number of rendered strings to keep
+BAND       = 8                   # height of the bands checked for changes
+BAR_HEIGHT = 4
+VOLUME_RETRY = 60                # seconds between queries of an unknown volume
+
+# --- panel: SSD1306   --------------------------------------------------------
+
+class SSD1306(object):
+  """ monochrome OLED with SSD1306 controller on the I2C-bus """
+
+  MODE  = "1"
+  FG    = 1
+  BG    = 0
+  BAR   = 1
+  CHUNK = 16                     # bytes per I2C block-transfer
+
+  def __init__(self,backend):
+    """ initialization """
+
+    self.width   = backend._width
+    self.height  = backend._height
+    self._port   = backend._i2c
+    self._addr   = int(backend._address or "0x3C",16)
+    self.bytes_written = 0
+
+  def _command(self,*cmds):
+    """ send command-bytes """
+    self._bus.write_i2c_block_data(self._addr,0x00,list(cmds))
+    self.bytes_written += len(cmds)+1
+
+  def open(self):
+    """ initialize controller """
+
+    self._bus = smbus.SMBus(self._port)
+    self._command(0xAE,                                # display off
+                  0xD5,0x80,                           # clock
+                  0xA8,self.height-1,                  # multiplex
+                  0xD3,0x00,                           # offset
+                  0x40,                                # start line
+                  0x8D,0x14,                           # charge pump
+                  0x20,0x00,                           # horizontal addressing
+                  0xA1,0xC8,                           # segment remap, scan dir
+                  0xDA,0x12 if self.height == 64 else 0x02,
+                  0x81,0x7F,                           # contrast
+                  0xD9,0xF1,                           # precharge
+                  0xDB,0x40,                           # vcom detect
+                  0xA4,0xA6,                           # resume, normal
+                  0xAF)                                # display on
+
+  def transfer(self,image,box):
+    """ transfer region to the panel (rows are aligned to pages) """
+
+    (x0,y0,x1,y1) = box
+    (p0,p1)       = (y0//8,(y1-1)//8)
+    self._command(0x21,x0,x1-1,0x22,p0,p1)
+    for page in range(p0,p1+1):
+      # one byte per column, bit 0 is the top pixel
+      data = image.crop((x0,8*page,x1,8*page+8)).transpose(
+        Image.Transpose.TRANSPOSE).transpose(
+          Image.Transpose.FLIP_LEFT_RIGHT).tobytes()
+      for i in range(0,len(data),SSD1306.CHUNK):
+        chunk = list(data[i:i+SSD1306.CHUNK])
+        self._bus.write_i2c_block_data(self._addr,0x40,chunk)
+        self.bytes_written += len(chunk)+1
+
+  def close(self):
+    """ turn display off """
+    self._command(0xAE)
+
+# --- panel: ST7789   ---------------------------------------------------------
+
+class ST7789(object):
+  """ color TFT with ST7789 controller on the SPI-bus """
+
+  MODE  = "RGB"
+  FG    = (255,255,255)
+  BG    = (0,0,0)
+  BAR   = (0,160,255)
+  CHUNK = 4096                   # bytes per SPI-transfer
+
+  def __init__(self,backend):
+    """ initialization """
+
+    self.width   = backend._width
+    self.height  = backend._height
+    self._spi_nr = [int(x) for x in backend._spi.split(",")]
+    self._dc     = backend._dc_pin
+    self._bl     = backend._bl_pin
+    self._x_off  = backend._x_offset
+    self._y_off  = backend._y_offset
+    self.bytes_written = 0
+
+  def _command(self,cmd,*data):
+    """ send command and optional data """
+
+    GPIO.output(self._dc,0)
+    self._spi.writebytes([cmd])
+    if data:
+      self._data(bytes(data))
+
+  def _data(self,data):
+    """ send data """
+
+    GPIO.output(self._dc,1)
+    for i in range(0,len(data),ST7789.CHUNK):
+      self._spi.writebytes2(data[i:i+ST7789.CHUNK])
+    self.bytes_written += len(data)+1
+
+  def open(self):
+    """ initialize controller """
+
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setwarnings(False)
+    GPIO.setup(self._dc,GPIO.OUT)
+    if self._bl >= 0:
+      GPIO.setup(self._bl,GPIO.OUT)
+      GPIO.output(self._bl,1)
+    self._spi = spidev.SpiDev()
+    self._spi.open(*self._spi_nr)
+    self._spi.max_speed_hz = 40000000
+    self._spi.mode = 0
+
+    self._command(0x01)                      # software reset
+    time.sleep(0.15)
+    self._command(0x11)                      # sleep out
+    time.sleep(0.05)
+    self._command(0x3A,0x55)                 # 16 bit/pixel
+    self._command(0x36,0x00)                 # memory access control
+    self._command(0x21)                      # inversion on
+    self._command(0x13)                      # normal mode
+    self._command(0x29)                      # display on
+
+  def transfer(self,image,box):
+    """ transfer region as RGB565 (big-endian) """
+
+    (x0,y0,x1,y1) = box
+    (x0,x1) = (x0+self._x_off,x1+self._x_off-1)
+    (y0,y1) = (y0+self._y_off,y1+self._y_off-1)
+    self._command(0x2A,x0 >> 8,x0 & 0xFF,x1 >> 8,x1 & 0xFF)
+    self._command(0x2B,y0 >> 8,y0 & 0xFF,y1 >> 8,y1 & 0xFF)
+    self._command(0x2C)
+
+    # convert to RGB565 within PIL (no per-pixel loop in python)
+    (r,g,b) = image.crop(box).split()
+    hi = ImageChops.add(r.point(lambda v: v & 0xF8),g.point(lambda v: v >> 5))
+    lo = ImageChops.add(g.point(lambda v: (v << 3) & 0xE0),
+                        b.point(lambda v: v >> 3))
+    self._data(Image.merge("LA",(hi,lo)).tobytes())
+
+  def close(self):
+    """ turn display and backlight off """
+
+    self._command(0x28)
+    if self._bl >= 0:
+      GPIO.output(self._bl,0)
+    self._spi.close()
+
+# --- backend for graphic displays   ------------------------------------------
+
+class GraphicBackend(Backend):
+  """ render frames to a bitmap and transfer dirty regions """
+
+  PANEL = None
+
+  def __init__(self,display):
+    """ initialization """
+
+    super(GraphicBackend,self).__init__(display)
+    self._app   = display._app
+    self._i2c   = display._i2c
+    parser      = self._app.parser
+    self._width     = int(self.get_value(parser,"DISPLAY","width",128))
+    self._height    = int(self.get_value(parser,"DISPLAY","height",64))
+    self._font_name = self.get_value(parser,"DISPLAY","font",None)
+    self._font_size = int(self.get_value(parser,"DISPLAY","font_size",10))
+    self._bars      = self.get_value(parser,"DISPLAY","bars","1") == "1"
+    self._address   = self.get_value(parser,"DISPLAY","address",None)
+    self._spi       = self.get_value(parser,"DISPLAY","spi","0,0")
+    self._dc_pin    = int(self.get_value(parser,"DISPLAY","dc_pin",25))
+    self._bl_pin    = int(self.get_value(parser,"DISPLAY","bl_pin",-1))
+    self._x_offset  = int(self.get_value(parser,"DISPLAY","x_offset",0))
+    self._y_offset  = int(self.get_value(parser,"DISPLAY","y_offset",0))
+
+    self._cache = collections.OrderedDict()       # text -> image
+    self._state = None                            # input of the last frame
+    self._last  = None                            # last frame
+    self._volume_query = 0                        # next query of the volume
+
+  # --- open panel   ----------------------------------------------------------
+
+  def open(self):
+    """ load font, initialize panel and compute the text geometry """
+
+    if not have_pil:
+      return False
+    try:
+      if self._font_name:
+        self._font = ImageFont.truetype(self._font_name,self._font_size)
+      else:
+        self._font = ImageFont.load_default()
+      (_,top,_,bottom) = self._font.getbbox("Ag")
+      self._line_h = bottom + 2
+      self._char_w = max(1,int(self._font.getlength("M")))
+
+      self._panel = self.PANEL(self)
+      self._panel.open()
+    except:
+      if self._debug:
+        traceback.print_exc()
+      return False
+
+    bar_h = 2*(BAR_HEIGHT+1) if self._bars else 0
+    self._rows = max(1,(self._height-bar_h)//self._line_h)
+    self._cols = self._width//self._char_w
+    self._last = Image.new(self.PANEL.MODE,(self._width,self._height),
+                           self.PANEL.BG)
+    self._panel.transfer(self._last,(0,0,self._width,self._height))
+    return True
+
+  # --- geometry   ------------------------------------------------------------
+
+  def geometry(self):
+    """ return (rows,cols) of the text-layout """
+    return (self._rows,self._cols)
+
+  # --- render text (cached)   ------------------------------------------------
+
+  def _render(self,text):
+    """ return bitmap of the text """
+
+    image = self._cache.get(text)
+    if image is not None:
+      self._cache.move_to_end(text)
+      return image
+
+    image = Image.new(self.PANEL.MODE,(self._width,self._line_h),self.PANEL.BG)
+    ImageDraw.Draw(image).text((0,0),text.rstrip(),font=self._font,
+                               fill=self.PANEL.FG)
+    self._cache[text] = image
+    if len(self._cache) > CACHE_SIZE:
+      self._cache.popitem(last=False)
+    return image
+
+  # --- collect state of bars   -----------------------------------------------
+
+  def _get_bars(self):
+    """ return (volume,recording-progress) in percent (or None) """
+
+    if not self._bars:
+      return (None,None)
+    event  = self._app.bus.last(VolumeEvent)
+    if (not event and hasattr(self._app,'amp') and
+        time.monotonic() >= self._volume_query):
+      # query once (publishes the volume), retry failures on a slow timer,
+      # otherwise rely on the events
+      self._volume_query = time.monotonic() + VOLUME_RETRY
+      self._app.amp.get_volume()
+      event = self._app.bus.last(VolumeEvent)
+    volume = event.volume if event and event.volume >= 0 else None
+    progress = None
+    event  = self._app.bus.last(RecordEvent)
+    if event and event.recording and event.duration:
+      elapsed  = time.time()-event.start
+      progress = max(0,min(100,int(100*elapsed/(60*event.duration))))
+    return (volume,progress)
+
+  # --- clear   ---------------------------------------------------------------
+
+  def clear(self):
+    """ force a complete redraw """
+    self._state = None
+
+  # --- write frame   ---------------------------------------------------------
+
+  def write(self,rows):
+    """ render frame and transfer dirty regions """
+
+    bars  = self._get_bars()
+    state = (tuple(rows),bars)
+    if state == self._state:
+      return                                      # static screen: no work
+    self._state = state
+
+    # render
+    frame = Image.new(self.PANEL.MODE,(self._width,self._height),
+                      self.PANEL.BG)
+    for (nr,row) in enumerate(rows):
+      frame.paste(self._render(row),(0,nr*self._line_h))
+    draw = ImageDraw.Draw(frame)
+    y = self._height - BAR_HEIGHT
+    for value in bars:
+      if value is not None:
+        draw.rectangle((0,y,self._width-1,y+BAR_HEIGHT-1),
+                       outline=self.PANEL.BAR,fill=self.PANEL.BG)
+        draw.rectangle((0,y,(self._width-1)*value//100,y+BAR_HEIGHT-1),
+                       fill=self.PANEL.BAR)
+      y -= BAR_HEIGHT + 1
+
+    # transfer changed bands
+    for y0 in range(0,self._height,BAND):
+      y1   = min(y0+BAND,self._height)
+      box  = ImageChops.difference(frame.crop((0,y0,self._width,y1)).convert("L"),
+                                   self._last.crop((0,y0,self._width,y1))
+                                   .convert("L")).getbbox()
+      if box:
+        self._panel.transfer(frame,(box[0],y0,box[2],y1))
+    self._last = frame
+    self.bytes_written = self._panel.bytes_written
+
+  # --- close   ---------------------------------------------------------------
+
+  def close(self):
+    """ close panel """
+    self._panel.close()
+
+class SSD1306Backend(GraphicBackend):
+  """ backend for SSD1306 """
+  PANEL = SSD1306
+
+class ST7789Backend(GraphicBackend):
+  """ backend for ST7789 """
+  PANEL = ST7789
@@ -41,6 +41,8 @@ class Keypad(Thread,Base):
     # section [GLOBAL]
     self._debug  = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
     self._active = self.get_value(self._app.parser,"GLOBAL", "keypad","1") == "1"
+    self._fifo   = self.get_value(self._app.parser,"GLOBAL", "keypad_fifo",
+                                  FIFO_NAME)
     if not self._active:
       return
 
@@ -82,7 +84,7 @@ class Keypad(Thread,Base):
 
     # wait for pipe
     pipe_wait = 0.5
-    while not os.path.exists(FIFO_NAME):
+    while not os.path.exists(self._fifo):
       self.debug("waiting for pipe ...")
       if pipe_wait < POLL_TIME/2:
         pipe_wait *= 2
@@ -91,7 +93,7 @@ class Keypad(Thread,Base):
         return
 
     # make sure the open call does not block
-    p_fd = os.open(FIFO_NAME,os.O_RDONLY|os.O_NONBLOCK)
+    p_fd = os.open(self._fifo,os.O_RDONLY|os.O_NONBLOCK)
     pipe = os.fdopen(p_fd,"r")
     poll_obj = select.poll()
     poll_obj.register(p_fd,select.POLLPRI|select.POLLIN)
@@ -111,7 +113,7 @@ class Keypad(Thread,Base):
 
         try:
           key = pipe.readline().rstrip('\n')
-          self.debug("key read: %s" % key)
+          self.debug("key read: %s",key)
           if key:
             self.process_key(key)
         except:
@@ -126,12 +128,12 @@ class Keypad(Thread,Base):
   # --- process key   ---------------------------------------------------------
 
   def process_key(self,key):
-    """ map key to command and execute it"""
+    """ map key to command and queue it """
 
-    self.debug("processing key %s" % key)
+    self.debug("processing key %s",key)
     if not key in self._keymaps[self._map_index]:
-      self.debug("unsupported key %s" % key)
+      self.debug("unsupported key %s",key)
       return
-    # delegate execution to class App
-    self._app.exec_func(self._keymaps[self._map_index][key],key)
+    # delegate execution to class App (command-queue)
+    self._app.queue_func(self._keymaps[self._map_index][key],key)
 
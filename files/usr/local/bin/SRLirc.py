@@ -38,6 +38,8 @@ class Lirc(Thread,Base):
     # section [GLOBAL]
     self._debug  = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
     self._active = self.get_value(self._app.parser,"GLOBAL", "lirc","0") == "1"
+    self._socket = self.get_value(self._app.parser,"GLOBAL", "lirc_socket",
+                                  LIRC_SOCKET)
     if not self._active:
       return
 
@@ -61,7 +63,7 @@ class Lirc(Thread,Base):
 
     # wait for socket
     socket_wait = 0.5
-    while not os.path.exists(LIRC_SOCKET):
+    while not os.path.exists(self._socket):
       self.debug("waiting for socket ...")
       if socket_wait < POLL_TIME/2:
         socket_wait *= 2
@@ -71,7 +73,7 @@ class Lirc(Thread,Base):
 
     # make sure the open call does not block
     lirc_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    lirc_socket.connect(LIRC_SOCKET)
+    lirc_socket.connect(self._socket)
     p_fd = lirc_socket.fileno()
     lirc_file = lirc_socket.makefile('r')
     poll_obj = select.poll()
@@ -92,7 +94,7 @@ class Lirc(Thread,Base):
 
         try:
           key = lirc_file.readline().rstrip('\n')
-          self.debug("key read: %s" % key)
+          self.debug("key read: %s",key)
           if key:
             self.process_key(key)
         except:
@@ -108,16 +110,16 @@ class Lirc(Thread,Base):
   # --- process key   ---------------------------------------------------------
 
   def process_key(self,key):
-    """ map key to command and execute it"""
+    """ map key to command and queue it """
 
-    self.debug("processing key %s" % key)
+    self.debug("processing key %s",key)
 
     [_hex,rep_count,key_name,_irname] = key.split(" ")
     rep_count = int(rep_count)
 
     # check for valid KEY (should not happen)
     if not key_name in self._keymap:
-      self.debug("unsupported key %s" % key_name)
+      self.debug("unsupported key %s",key_name)
       return
 
     (func_name,func_repeat,func_delay) = self._keymap[key_name]
@@ -137,5 +139,5 @@ class Lirc(Thread,Base):
         if rep_count % func_repeat > 0:
           return
 
-    # delegate execution to class App (we strip the prefix 'KEY_')
-    self._app.exec_func(func_name,key_name.lstrip("KEY_"))
+    # delegate execution to class App (command-queue, we strip the prefix 'KEY_')
+    self._app.queue_func(func_name,key_name.lstrip("KEY_"))
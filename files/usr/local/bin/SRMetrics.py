@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class Metrics
+#
+# The class Metrics is a registry of counters and histograms. The values
+# are exported in the text-format of Prometheus.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import sys, bisect
+
+from SRBase import Base
+
+# default buckets (seconds)
+BUCKETS = (0.001,0.005,0.01,0.05,0.1,0.25,0.5,1,2.5,5,10)
+
+# --- counter   ---------------------------------------------------------------
+
+class Counter(object):
+  """ monotonic counter """
+
+  TYPE = "counter"
+
+  def __init__(self):
+    """ initialization """
+    self.value = 0
+
+  def inc(self,amount=1):
+    """ increment counter """
+    self.value += amount
+
+  def samples(self,name,labels):
+    """ return list of (name,labels,value) """
+    return [(name,labels,self.value)]
+
+# --- histogram   -------------------------------------------------------------
+
+class Histogram(object):
+  """ histogram with fixed buckets """
+
+  TYPE = "histogram"
+
+  def __init__(self,buckets=BUCKETS):
+    """ initialization """
+    self._buckets = buckets
+    self._counts  = [0]*(len(buckets)+1)          # last bucket: +Inf
+    self.sum      = 0
+    self.count    = 0
+
+  def observe(self,value):
+    """ add observation (cheap: one bisect and three additions) """
+    self._counts[bisect.bisect_left(self._buckets,value)] += 1
+    self.sum   += value
+    self.count += 1
+
+  def samples(self,name,labels):
+    """ return list of (name,labels,value) with cumulative buckets """
+    result = []
+    total  = 0
+    for (le,count) in zip(self._buckets+("+Inf",),self._counts):
+      total += count
+      result.append((name+"_bucket",labels+(("le",str(le)),),total))
+    result.append((name+"_sum",labels,self.sum))
+    result.append((name+"_count",labels,self.count))
+    return result
+
+# --- registry   --------------------------------------------------------------
+
+class Metrics(Base):
+  """ registry of all metrics """
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app     = app
+    self._help    = {}                        # name -> (type,help)
+    self._metrics = {}                        # (name,labels) -> metric
+    self.read_config()
+    app.register_funcs(self.get_funcs())
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug  = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+
+  # --- create or return a metric   -------------------------------------------
+
+  def _get(self,cls,name,help,labels,*args):
+    """ return existing metric or create a new one """
+
+    labels = tuple(sorted(labels.items())) if labels else ()
+    key    = (name,labels)
+    metric = self._metrics.get(key)
+    if metric is None:
+      self._help[name] = (cls.TYPE,help)
+      metric = self._metrics.setdefault(key,cls(*args))
+    return metric
+
+  # --- return counter   ------------------------------------------------------
+
+  def counter(self,name,help,labels=None):
+    """ return counter with the given name and labels """
+
+    return self._get(Counter,name,help,labels)
+
+  # --- return histogram   ----------------------------------------------------
+
+  def histogram(self,name,help,labels=None,buckets=BUCKETS):
+    """ return histogram with the given name and labels """
+
+    return self._get(Histogram,name,help,labels,buckets)
+
+  # --- render all metrics   --------------------------------------------------
+
+  def render(self):
+    """ return all metrics in the Prometheus text-format """
+
+    lines = []
+    for name in sorted(self._help):
+      (mtype,help) = self._help[name]
+      lines.append("# HELP %s %s" % (name,help))
+      lines.append("# TYPE %s %s" % (name,mtype))
+      for (key,metric) in sorted(self._metrics.items()):
+        if key[0] != name:
+          continue
+        for (sname,labels,value) in metric.samples(name,key[1]):
+          if labels:
+            labels = "{%s}" % ",".join('%s="%s"' % label for label in labels)
+          else:
+            labels = ""
+          lines.append("%s%s %s" % (sname,labels,
+                                    repr(value) if isinstance(value,float)
+                                    else value))
+    return "\n".join(lines)+"\n"
+
+  # --- dump metrics   --------------------------------------------------------
+
+  def func_dump_metrics(self,_):
+    """ dump all metrics to stderr """
+
+    sys.stderr.write(self.render())
+    sys.stderr.flush()
@@ -4,6 +4,11 @@
 # Simple radio: implementation of class Mpg123
 #
 # The class Mpg123 encapsulates the mpg123-process for playing mp3s.
+# Streams of the stream-hub are played with a buffer-size and prefill
+# adapted per channel: the prefill follows the jitter of the data, the
+# buffer grows if underruns exceed max_underruns per hour and shrinks
+# after long periods without underruns. ICY-titles are published when the
+# audio they belong to is audible, not when they arrive.
 #
 # Author: Bernhard Bablok
 # License: GPL3
@@ -12,23 +17,53 @@
 #
 # -----------------------------------------------------------------------------
 
-import threading, subprocess, signal, os, shlex, re, traceback
+import threading, subprocess, signal, os, time, shlex, re, traceback
+import fcntl, termios, struct
 from threading import Thread
-import queue, collections
+import collections
 
 from SRBase import Base
+from SRBus  import TitleEvent, PlaybackEvent
 
 class Mpg123(Base):
   """ mpg123 control-object """
 
+  FEED_CHUNK   = 65536                 # chunk-size for queue-playback
+  STREAM_CHUNK = 4096                  # chunk-size for streams of the hub
+  PCM_RATE     = 176400                # bytes/s of decoded audio (44.1kHz)
+  MIN_PREFILL  = 0.5                   # seconds of audio before playback
+  PRELOAD      = 0.2                   # default prefill (fraction of -b)
+  PREFILL_JITTER = 1.5                 # prefill as multiple of the jitter
+  LOW_JITTER   = 1.0                   # seconds
+  JITTER_HALF_LIFE = 3600              # seconds of playback
+  UNDERRUN_TIME = 0.5                  # playback starved for x seconds
+  HEADER_TIMEOUT = 1.0                 # wait for the header of the first frame
+  TITLE_POLL   = 0.25                  # check pending titles every x s
+
   def __init__(self,app):
     """ initialization """
 
     self._app       = app
     self._process   = None
     self._icy_event = None
-
-    self.icy_data   = None
+    self._feed_event = None
+    self._feed_queue = None
+    self._cursor     = None
+    self._fed_pos    = 0
+    self._radio_mode = False
+    self._session    = None              # measurements of the current stream
+    self._tuning     = {}                # url -> buffer-settings and history
+    self._titles     = collections.deque()   # pending (pos,due,title)
+    self._title_event = None
+    self._audio_lock  = threading.Lock()
+    self._audio_time  = None               # start of the audio
+    self._m_switch = app.metrics.histogram("simple_radio_channel_switch_seconds",
+                                           "time from key to first audio")
+    self._m_start  = app.metrics.histogram("simple_radio_mpg123_start_seconds",
+                                           "time from start of mpg123 to "
+                                           "first audio")
+    self._m_underruns = app.metrics.counter("simple_radio_mpg123_underruns_total",
+                                            "playback ran out of data")
     self.read_config()
 
   # --- read configuration   --------------------------------------------------
@@ -43,6 +78,110 @@ class Mpg123(Base):
     # section [MPG123]
     self._mpg123_opts = self.get_value(self._app.parser,"MPG123",
                                        "mpg123_opts","-b 1024")
+    self._buffer  = 0                    # size of the output-buffer (kB)
+    self._preload = Mpg123.PRELOAD       # fraction filled before playback
+    opts = shlex.split(self._mpg123_opts)
+    for (i,opt) in enumerate(opts[:-1]):
+      if opt in ("-b","--buffer"):
+        self._buffer = int(opts[i+1])
+      elif opt == "--preload":
+        self._preload = float(opts[i+1])
+    self._delay_cfg = self.get_value(self._app.parser,"MPG123","delay","auto")
+    self._delay     = self._get_delay(self._buffer)
+
+    self._adaptive   = self.get_value(self._app.parser,"MPG123",
+                                      "adaptive","1") == "1"
+    self._buffer_min = int(self.get_value(self._app.parser,"MPG123",
+                                          "buffer_min",128))
+    self._buffer_max = int(self.get_value(self._app.parser,"MPG123",
+                                          "buffer_max",4096))
+    self._max_underruns = float(self.get_value(self._app.parser,"MPG123",
+                                               "max_underruns",1))
+
+  # --- return persistent state of this class   -------------------------------
+
+  def get_persistent_state(self):
+    """ return persistent state (overrides SRBase.get_pesistent_state()) """
+
+    return {'buffers': self._tuning}
+
+  # --- restore persistent state of this class   ------------------------------
+
+  def set_persistent_state(self,state_map):
+    """ restore persistent state (overrides SRBase.set_pesistent_state()) """
+
+    self.debug("Mpg123: restoring persistent state")
+    if 'buffers' in state_map:
+      self._tuning = state_map['buffers']
+
+  # --- delay of the output-buffer   ------------------------------------------
+
+  def _get_delay(self,buffer):
+    """ return seconds from decoder-input to output """
+
+    if self._delay_cfg == "auto":
+      # estimate from the size of the output-buffer (option -b in kB)
+      return 1024*buffer/Mpg123.PCM_RATE
+    return float(self._delay_cfg)
+
+  # --- buffer-settings of a channel   ----------------------------------------
+
+  def _get_tuning(self,url):
+    """ return settings and history of the channel """
+
+    if not url in self._tuning:
+      buffer = min(max(self._buffer,self._buffer_min),self._buffer_max)
+      self._tuning[url] = {"buffer": buffer, "jitter": None, "start": None,
+                           "secs": 0, "underruns": 0}
+    return self._tuning[url]
+
+  def _get_buffer(self,tuning):
+    """ return (buffer in kB,prefill in s) for the channel """
+
+    secs = 1024*tuning["buffer"]/Mpg123.PCM_RATE
+    if tuning["jitter"] is None:
+      return (tuning["buffer"],Mpg123.PRELOAD*secs)
+    factor = Mpg123.PREFILL_JITTER
+    if (tuning["start"] is not None and tuning["start"] > Mpg123.MIN_PREFILL
+        and tuning["jitter"] < Mpg123.LOW_JITTER):
+      # slower than the minimal prefill: without an initial burst every
+      # second of prefill delays the start, a steady channel needs no
+      # margin above its jitter
+      factor = 1
+    return (tuning["buffer"],
+            min(secs,max(Mpg123.MIN_PREFILL,factor*tuning["jitter"])))
+
+  # --- update the settings of a channel after playback   ---------------------
+
+  def _end_session(self):
+    """ update jitter, start-time and underrun-history of the channel,
+        adapt the buffer-size """
+
+    session = self._session
+    self._session = None
+    if not session or not session["audio"] or not session["tuning"]:
+      return
+    tuning = session["tuning"]
+    secs   = time.monotonic() - session["audio"]
+    decay  = 0.5**(secs/Mpg123.JITTER_HALF_LIFE)
+    tuning["jitter"] = round(max(session["gap"],
+                                 decay*(tuning["jitter"] or 0)),2)
+    tuning["secs"]      = round(tuning["secs"]+secs,1)
+    tuning["underruns"] += session["underruns"]
+
+    # grow if underruns exceed the limit, shrink if there would have been
+    # at least two underruns at the limit
+    buffer = tuning["buffer"]
+    if tuning["underruns"] > self._max_underruns*tuning["secs"]/3600:
+      buffer = min(2*buffer,self._buffer_max)
+    elif (not tuning["underruns"] and
+          tuning["secs"] >= 2*3600/self._max_underruns):
+      buffer = max(buffer//2,self._buffer_min)
+    if buffer != tuning["buffer"]:
+      self.debug("buffer of %s: %d kB -> %d kB (%d underruns in %ds)",
+                 session["url"],tuning["buffer"],buffer,
+                 tuning["underruns"],tuning["secs"])
+      tuning.update({"buffer": buffer, "secs": 0, "underruns": 0})
 
   # --- active-state (return true if playing)   --------------------------------
 
@@ -58,23 +197,274 @@ class Mpg123(Base):
 
     args = ["mpg123"]
     opts = shlex.split(self._mpg123_opts)
+    use_hub = radio_mode and self._app.hub.enabled
+    buffer  = self._buffer
+    self._session = None
+    if use_hub:
+      (tuning,prefill) = (None,self._preload*1024*buffer/Mpg123.PCM_RATE)
+      if self._adaptive:
+        # buffer and prefill of the channel replace the static options
+        tuning = self._get_tuning(name)
+        (buffer,prefill) = self._get_buffer(tuning)
+        opts = [o for (i,o) in enumerate(opts) if not o in
+                ("-b","--buffer","--preload") and
+                not (i and opts[i-1] in ("-b","--buffer","--preload"))]
+        opts += ["-b",str(buffer),"--preload",
+                 "%.2f" % (prefill*Mpg123.PCM_RATE/1024/buffer)]
+      # base: stream-position of the first byte fed to mpg123
+      self._session = {"url": name, "tuning": tuning, "prefill": prefill,
+                       "audio": None, "gap": 0, "underruns": 0, "fed": 0,
+                       "played": 0, "clock": None, "prefilled": None,
+                       "paused": False, "base": 0}
     args += opts
-    if name.endswith(".m3u"):
-      args += ["-@",name]
+    self._delay = self._get_delay(buffer)
+    url     = name
+    if radio_mode and not use_hub:
+      # healthiest mirror of the best variant the bandwidth allows
+      hub = self._app.hub
+      url = hub.get_mirrors(name,hub.select_variant(name))[0]
+    if use_hub:
+      args += ["-"]                  # data from the stream-hub
+    elif url.endswith(".m3u"):
+      args += ["-@",url]
     else:
-      args += [name]
+      args += [url]
 
-    self.debug("with args %r" % (args,))
-    self._process = subprocess.Popen(args,bufsize=1,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT)
+    self.debug("with args %r",args)
+    self._key_time   = self._app.key_time
+    self._start_time = time.monotonic()
+    self._audio_time = None
+    self._radio_mode = radio_mode
+    if radio_mode:
+      self._titles.clear()                 # before feed_stream() queues titles
+      self._title_event = threading.Event()
+    if use_hub:
+      self._process = subprocess.Popen(args,
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+      self._cursor  = self._app.hub.attach(name)
+      self._fed_pos = self._cursor.pos
+      self._session["base"] = self._cursor.pos
+      if self._cursor.stream.title is not None:
+        self._put_title(self._cursor.stream.title)    # title of the start
+      self._stream_thread = threading.Thread(target=self.feed_stream,
+                                             args=(self._process,self._cursor))
+      self._stream_thread.start()
+    else:
+      self._process = subprocess.Popen(args,bufsize=1,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
     if radio_mode:
-      self.icy_data   = queue.Queue()
       self._icy_event = threading.Event()
       self._icy_thread = threading.Thread(target=self.read_icy_meta)
       self._icy_thread.start()
+      self._title_thread = threading.Thread(target=self.release_titles)
+      self._title_thread.start()
     else:
       self._icy_event = None
+    self._app.bus.publish(PlaybackEvent("playing",radio_mode))
+
+  # --- start to play a queue of files   --------------------------------------
+
+  def start_queue(self,files):
+    """ spawn a single mpg123 process reading the given files from stdin """
+
+    args = ["mpg123"]
+    args += shlex.split(self._mpg123_opts)
+    args += ["-"]
+
+    self.debug("with args %r (%d files queued)",args,len(files))
+    self._process = subprocess.Popen(args,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.DEVNULL)
+    self._icy_event  = None
+    self._feed_queue = collections.deque(files)
+    self._feed_lock  = threading.Lock()
+    self._feed_event = threading.Event()
+    self._feed_thread = threading.Thread(target=self.feed_queue,
+                                         args=(self._process,))
+    self._feed_thread.start()
+    self._radio_mode = False
+    self._app.bus.publish(PlaybackEvent("playing",False))
+
+  # --- append files to the current queue   -----------------------------------
+
+  def append_queue(self,files):
+    """ append files to the queue (returns False if no queue is playing) """
+
+    if not self._feed_event or self._feed_event.is_set():
+      return False
+    with self._feed_lock:
+      if self._feed_queue is None:
+        return False                 # feeder already closed stdin
+      self._feed_queue.extend(files)
+    return True
+
+  # --- feed queued files to the running decoder   ----------------------------
+
+  def feed_queue(self,process):
+    """ write queued files to stdin of mpg123, so there are no gaps """
+
+    self.debug("starting feed_queue")
+    try:
+      while not self._feed_event.is_set():
+        with self._feed_lock:
+          if not self._feed_queue:
+            self._feed_queue = None
+            break
+          name = self._feed_queue.popleft()
+        self.debug("feeding %s",name)
+        try:
+          with open(name,"rb") as f:
+            while not self._feed_event.is_set():
+              data = f.read(Mpg123.FEED_CHUNK)
+              if not data:
+                break
+              process.stdin.write(data)
+        except OSError:
+          if process.poll() is not None:
+            break
+          self.debug("could not read %s, skipping",name)
+      process.stdin.close()          # mpg123 terminates after the last frame
+    except:
+      # typically a broken pipe after the process was stopped
+      if self._debug:
+        traceback.print_exc()
+    self.debug("terminating feed_queue")
+
+  # --- feed data of the stream-hub to the running decoder   ----------------
+
+  def feed_stream(self,process,cursor):
+    """ write data of the stream to stdin of mpg123 """
+
+    self.debug("starting feed_stream")
+    session = self._session
+    try:
+      while True:
+        start = time.monotonic()
+        (data,title) = cursor.read(Mpg123.STREAM_CHUNK)
+        if not data:
+          break
+        self._track(session,cursor.stream.byte_rate(),time.monotonic()-start)
+        process.stdin.write(bytes(data))   # blocks while paused: copy the view
+        process.stdin.flush()
+        self._fed_pos = cursor.pos
+        session["fed"] += len(data)
+        session["base"] = cursor.pos - session["fed"]   # skips after overruns
+        if title is not None:
+          # audible at cursor.pos, due is the fallback without a clock
+          self._titles.append((cursor.pos,time.monotonic()+self._delay,title))
+      process.stdin.close()
+    except:
+      # typically a broken pipe after the process was stopped
+      if self._debug:
+        traceback.print_exc()
+    self.debug("terminating feed_stream")
+
+  # --- estimate the playback-position   -------------------------------------
+
+  def _track(self,session,byte_rate,wait):
+    """ advance the estimated playback-position (bytes since start), detect
+        underruns: playback would have passed the data written so far """
+
+    now = time.monotonic()
+    if session["clock"] is None:
+      # playback starts after the prefill (refined by the header of the
+      # first frame, see read_icy_meta())
+      if session["fed"] >= session["prefill"]*byte_rate:
+        session["clock"] = session["prefilled"] = now
+      return
+    if (session["audio"] is None and
+        now-session["prefilled"] > Mpg123.HEADER_TIMEOUT):
+      # mpg123 does not report the first frame (e.g. option -q)
+      self._set_audio(session["prefilled"])
+    session["gap"] = max(session["gap"],wait)
+    if not session["paused"]:
+      played = session["played"] + (now-session["clock"])*byte_rate
+      if played-session["fed"] > Mpg123.UNDERRUN_TIME*byte_rate:
+        self.debug("underrun: no data for %.1fs",wait)
+        session["underruns"] += 1
+        self._m_underruns.inc()
+      session["played"] = min(played,session["fed"])
+    session["clock"] = now
+
+  # --- record the start of the audio   --------------------------------------
+
+  def _set_audio(self,now):
+    """ record start-time and switch-time (first call only),
+        return False if already recorded """
+
+    with self._audio_lock:
+      if self._audio_time is not None:
+        return False
+      self._audio_time = now
+    self._m_start.observe(now-self._start_time)
+    if self._key_time:
+      self._m_switch.observe(now-self._key_time)
+    session = self._session
+    if session:
+      session["audio"] = now
+    if session and session["tuning"]:
+      tuning = session["tuning"]
+      secs   = now-self._start_time
+      if tuning["start"] is not None:
+        secs = 0.7*tuning["start"] + 0.3*secs
+      tuning["start"] = round(secs,2)
+    return True
+
+  # --- return position of the stream which is currently audible   -----------
+
+  def get_audible_pos(self,url):
+    """ return stream-position currently audible (None if not playing url) """
+
+    cursor  = self._cursor
+    session = self._session
+    if not cursor or cursor.stream.url != url or not self.is_active():
+      return None
+
+    # playback started after the prefill and runs in real-time until all
+    # data fed to mpg123 is played (see _track())
+    played = session["played"]
+    if session["clock"] is not None and not session["paused"]:
+      played = min(session["fed"],played + (time.monotonic()-session["clock"])*
+                   cursor.stream.byte_rate())
+    return max(session["base"]+int(played),cursor.stream.first_pos())
+
+  # --- return bytes within the pipe   ----------------------------------------
+
+  def _pending(self,process):
+    """ return number of bytes written to mpg123 but not read yet """
+
+    try:
+      return struct.unpack("i",fcntl.ioctl(process.stdin.fileno(),
+                                           termios.FIONREAD,b"\0\0\0\0"))[0]
+    except:
+      return 0
+
+  # --- return buffer-levels   ------------------------------------------------
+
+  def get_levels(self):
+    """ return (seconds within the ring-buffer, timeshift, bytes in the pipe) """
+
+    cursor  = self._cursor
+    process = self._process
+    if not cursor or not process:
+      return (0.0,0.0,0)
+    stream = cursor.stream
+    return ((stream.pos-stream.first_pos())/stream.byte_rate(),
+            self.get_timeshift(),self._pending(process))
+
+  # --- return timeshift-delay   ---------------------------------------------
+
+  def get_timeshift(self):
+    """ return seconds the playback is behind the live stream """
+
+    cursor = self._cursor
+    if not cursor:
+      return 0
+    return (cursor.stream.pos-self._fed_pos)/cursor.stream.byte_rate()
 
   # --- pause playing   -------------------------------------------------------
 
@@ -84,6 +474,9 @@ class Mpg123(Base):
     self.debug("pausing playback")
     if self.is_active():
       self._process.send_signal(signal.SIGSTOP)
+      if self._session:
+        self._session["paused"] = True
+      self._app.bus.publish(PlaybackEvent("paused",self._radio_mode))
 
   # --- continue playing   ----------------------------------------------------
 
@@ -93,6 +486,11 @@ class Mpg123(Base):
     self.debug("continuing playback")
     if self.is_active():
       self._process.send_signal(signal.SIGCONT)
+      if self._session:
+        if self._session["clock"] is not None:
+          self._session["clock"] = time.monotonic()
+        self._session["paused"] = False
+      self._app.bus.publish(PlaybackEvent("playing",self._radio_mode))
 
   # --- stop player   ---------------------------------------------------------
 
@@ -101,19 +499,68 @@ class Mpg123(Base):
 
     if self._process:
       self.debug("stopping player ...")
+      if self._title_event:
+        self._title_event.set()
+        self._title_thread.join()
+        self._title_event = None
       try:
         self._process.terminate()
+        self._process.send_signal(signal.SIGCONT)   # in case we are paused
       except:
         pass
       self._process = None
+      if self._cursor:
+        self._cursor.close()
+        self._stream_thread.join()
+        self._cursor = None
+      if self._feed_event:
+        self._feed_event.set()
+        self._feed_thread.join()
+        self._feed_event = None
+        self._feed_queue = None
       if self._icy_event:
         self._icy_event.set()
         self._icy_thread.join()
         self._icy_event = None
-        self.icy_data   = None
-        self._app.display.clear_content()
+      self._end_session()
+      self._app.bus.publish(PlaybackEvent("stopped",self._radio_mode))
       self.debug("... done stopping player")
 
+  # --- publish title   -------------------------------------------------------
+
+  def _put_title(self,title):
+    """ publish title (display, API) """
+
+    self._app.bus.publish(TitleEvent(title))
+
+  # --- publish titles when they are audible   -------------------------------
+
+  def release_titles(self):
+    """ publish pending titles as soon as their position (stream-hub) or
+        their due time (without a playback-clock) is reached """
+
+    self.debug("starting release_titles")
+    timeout = Mpg123.TITLE_POLL
+    while not self._title_event.wait(timeout):
+      timeout = Mpg123.TITLE_POLL
+      while self._titles:
+        (pos,due,title) = self._titles[0]
+        session = self._session
+        if pos is not None and session and session["clock"] is not None:
+          cursor  = self._cursor
+          audible = cursor and self.get_audible_pos(cursor.stream.url)
+          if audible is None:
+            break
+          left = (pos-audible)/cursor.stream.byte_rate()
+        else:
+          left = due - time.monotonic()
+        if left > 0:
+          timeout = min(timeout,left)
+          break
+        self._titles.popleft()
+        self._put_title(title)
+    self.debug("terminating release_titles")
+
   # --- read ICY-meta-tags during playback   ----------------------------------
 
   def read_icy_meta(self):
@@ -122,6 +569,7 @@ class Mpg123(Base):
     self.debug("starting read_icy_meta")
 
     regex = re.compile(r".*ICY-META.*?'(.*)';$")
+    first_audio = True
     try:
       while True:
         if self._icy_event.wait(0.01):
@@ -131,7 +579,7 @@ class Mpg123(Base):
           data = self._process.stdout.readline()
           data = data.decode('utf-8')
         except:
-          self.debug("could not decode: '%s'" % data)
+          self.debug("could not decode: '%s'",data)
           self.debug("ignoring data")
           continue
         if data == '' and self._process.poll() is not None:
@@ -139,19 +587,27 @@ class Mpg123(Base):
           self.debug("undefined error condition")
           return
         if data:
-          self.debug("read_icy_meta: data: %s" % data)
+          self.debug("read_icy_meta: data: %s",data)
+          if first_audio and data.startswith("MPEG "):
+            # mpg123 started decoding
+            first_audio = False
+            now = time.monotonic()
+            session = self._session
+            if (self._set_audio(now) and session and
+                session["clock"] is not None and not session["paused"]):
+              # playback started after the prefill was fed
+              session.update({"clock": now, "played": 0})
+            continue
           if 'error:' in data:
-            line = data.rstrip('\n')
-          else:
-            # parse line
-            (line,count) = regex.subn(r'\1',data)
-            if not count:
-              self.debug("ignoring data")
-              continue
-            else:
-              line = line.rstrip('\n')
-          self.icy_data.put(line)
-          self.icy_data.put(6*'*')
+            self._put_title(data.rstrip('\n'))
+            continue
+          # parse line, the title is audible after the output-buffer
+          (line,count) = regex.subn(r'\1',data)
+          if not count:
+            self.debug("ignoring data")
+            continue
+          self._titles.append((None,time.monotonic()+self._delay,
+                               line.rstrip('\n')))
 
     except:
       # typically an IO-exception due to closing of stdout
@@ -12,7 +12,7 @@
 #
 # -----------------------------------------------------------------------------
 
-import os, datetime, subprocess
+import os, datetime, subprocess, bisect, threading
 
 from SRBase import Base
 from SRKeypad import Keypad
@@ -24,6 +24,8 @@ class Player(Base):
     """ initialization """
 
     self._app    = app
+    self._lock   = threading.RLock()         # display versus commands
+    self._queue_secs = {}                    # durations of the queue
     app.register_funcs(self.get_funcs())
 
     self.set_state(False)
@@ -37,32 +39,22 @@ class Player(Base):
     # section [GLOBAL]
     self._debug  = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
 
-    # section [RECORD]
-    if not self._app.options.target_dir is None:
-      self._target_dir = self._app.options.target_dir[0]
-    else:
-      self._target_dir = self.get_value(self._app.parser,"RECORD","dir",
-                                        os.path.expanduser("~"))
-    if not os.path.exists(self._target_dir):
-      os.mkdir(self._target_dir)
-    elif not os.path.isdir(self._target_dir):
-      print("[ERROR] target-directory for recordings %s is not a directory" %
-            self._target_dir)
-
   # --- set state   -----------------------------------------------------------
 
   def set_state(self,active):
     """ set state of object """
 
-    self._active = active
+    with self._lock:
+      self._active = active
 
-    if active:
-      self._play_start_dt = None
-      self._read_recordings()
-    else:
-      self._play_start_dt = None
-      self._rec_index     = None
-      self._recordings    = None
+      self._queue = None
+      if active:
+        self._play_start_dt = None
+        self._read_recordings()
+      else:
+        self._play_start_dt = None
+        self._rec_index     = None
+        self._recordings    = None
 
   # --- return active-state of the object   -----------------------------------
 
@@ -71,11 +63,52 @@ class Player(Base):
 
     return self._active
 
+  # --- return recordings currently in use   ---------------------------------
+
+  def get_active_recordings(self):
+    """ return set of recordings currently played or queued """
+
+    (queue,recordings,rec_index) = (self._queue,self._recordings,
+                                     self._rec_index)
+    if not self._active or not self._app.mpg123.is_active():
+      return set()
+    elif queue:
+      return set(queue[self._queue_pos:])
+    elif rec_index is not None:
+      return set([recordings[rec_index]])
+    else:
+      return set()
+
+  # --- return status   -------------------------------------------------------
+
+  def get_status(self):
+    """ return status of the player """
+
+    (recordings,rec_index) = (self._recordings,self._rec_index)
+    if not self._active or rec_index is None:
+      return {"active": self._active, "recording": None}
+    playing = self._app.mpg123.is_active()
+    return {
+      "active":    self._active,
+      "recording": os.path.basename(recordings[rec_index]),
+      "playing":   playing,
+      "paused":    playing and self._play_pause,
+      "queue":     len(self._queue) if self._queue else 0,
+      "duration":  self._totsecs
+      }
+
   # --- get title-line (1st line of display)   -------------------------------
 
   def get_title(self):
     """ return title-line (1st line of display) """
 
+    with self._lock:
+      return self._get_title()
+
+  def _get_title(self):
+    """ return title-line (caller holds the lock) """
+
+    self._update_recordings()
     if self._rec_index is None and self._recordings:
       return ("reading","")
 
@@ -92,7 +125,10 @@ class Player(Base):
         curtime = self._play_pause_dt - self._play_start_dt
       else:
         curtime = datetime.datetime.now() - self._play_start_dt
-      curtime = self._pp_time(int(curtime.total_seconds()))
+      curtime = int(curtime.total_seconds())
+      if self._queue:
+        curtime = self._update_queue_pos(curtime)
+      curtime = self._pp_time(curtime)
       time_info = "{0:5.5s}/{1:5.5s}".format(curtime,self._tottime)
 
       if self._play_pause:
@@ -135,150 +171,302 @@ class Player(Base):
 
   # --- set info-variables of current file   ----------------------------------
 
-  def _set_recinfo(self):
-    """ gather info about current recording """
+  def _set_recinfo(self,durations=None):
+    """ gather info about current recording (durations: map of seconds of
+        the queued recordings, else query mp3info) """
 
-    cur_rec       = self._recordings[self._rec_index]
-    total_secs    = int(subprocess.check_output(["mp3info", "-p","%S",cur_rec]))
-    self._tottime = self._pp_time(total_secs)
+    self._parts   = self._get_parts(self._rec_index)
+    cur_rec       = self._parts[0]
+    if durations is None:
+      self._totsecs = sum(self._get_durations(self._parts))
+    else:
+      self._totsecs = sum(durations.get(part,0) for part in self._parts)
+    self._tottime = self._pp_time(self._totsecs)
 
-    (_,rec) = os.path.split(cur_rec)                        # remove path
-    (rec,_) = os.path.splitext(rec)                         # remove extension
-    [date,time,self._channel_name] = rec.split("_")         # and split
+    [date,time,self._channel_name] = self._app.recindex.split_name(cur_rec)
     self._date = "%s.%s.%s" % (date[6:8],date[4:6],date[0:4])
     self._time = "%s:%s" % (time[0:2],time[2:4])
 
+  # --- query durations of recordings   --------------------------------------
+
+  def _get_durations(self,files):
+    """ return list of seconds of the files (single mp3info-process) """
+
+    secs = subprocess.check_output(["mp3info", "-p","%S "]+files)
+    return [int(s) for s in secs.split()]
+
+  # --- return start of logical recording   ----------------------------------
+
+  def _group_start(self,index):
+    """ return index of the first part of the recording at index """
+
+    key = self._app.recindex.group_key(self._recordings[index])
+    while (index > 0 and
+           self._app.recindex.group_key(self._recordings[index-1]) == key):
+      index -= 1
+    return index
+
+  # --- return parts of logical recording   -----------------------------------
+
+  def _get_parts(self,index):
+    """ return all parts of the recording starting at index """
+
+    key = self._app.recindex.group_key(self._recordings[index])
+    end = index+1
+    while (end < len(self._recordings) and
+           self._app.recindex.group_key(self._recordings[end]) == key):
+      end += 1
+    return list(self._recordings[index:end])
+
+  # --- start playing a queue of recordings   ---------------------------------
+
+  def _start_queue(self,files):
+    """ play the given recordings without gaps using a single mpg123 """
+
+    if self._app.mpg123.is_active():
+      self.debug("playback in progress, ignoring command")
+      return
+
+    # only mp3-files can be concatenated
+    files = [f for f in files if f.endswith(".mp3")]
+    if not files:
+      self.debug("no recordings to queue")
+      return
+
+    self.debug("starting queue-playback of %d recordings",len(files))
+    self._queue        = files
+    self._queue_pos    = 0
+    self._queue_offset = 0
+    self._queue_secs   = dict(zip(files,self._get_durations(files)))
+    self._rec_index    = self._recordings.index(files[0])
+    self._set_recinfo(self._queue_secs)
+    self._play_pause    = False
+    self._play_start_dt = datetime.datetime.now()
+    self._app.mpg123.start_queue(files)
+
+  # --- update current recording of the queue   -------------------------------
+
+  def _update_queue_pos(self,curtime):
+    """ update current recording from the playtime of the queue,
+        return playtime of the current recording """
+
+    while (curtime - self._queue_offset >= self._totsecs and
+           self._queue_pos + len(self._parts) < len(self._queue)):
+      self._queue_offset += self._totsecs
+      self._queue_pos    += len(self._parts)
+      try:
+        self._rec_index = self._recordings.index(self._queue[self._queue_pos])
+      except ValueError:
+        # recording was deleted in the meantime, just show the last one
+        continue
+      self.debug("current recording: %s",self._recordings[self._rec_index])
+      self._set_recinfo(self._queue_secs)       # durations of _start_queue()
+    return curtime - self._queue_offset
+
   # --- read existing recordings   --------------------------------------------
 
   def _read_recordings(self):
-    """ read recordings from configured directory """
+    """ read recordings from the index of recordings """
 
     self.debug("reading recordings")
 
-    self._recordings = []
-    for f in os.listdir(self._target_dir):
-      rec_file = os.path.join(self._target_dir,f)
-      if not os.path.isfile(rec_file):
-        continue
-      # check extension
-      (_,ext) = os.path.splitext(rec_file)
-      if ext in [".mp3",".ogg",".wav"]:
-        self._recordings.append(rec_file)
-
+    self._rec_version = self._app.recindex.version
+    self._recordings  = self._app.recindex.get_recordings()
     if len(self._recordings):
-      self._recordings.sort()
-      self._rec_index  = len(self._recordings)-1
+      self._rec_index  = self._group_start(len(self._recordings)-1)
       self._set_recinfo()
     else:
       self._rec_index  = None
 
+  # --- pick up changes of the index of recordings   --------------------------
+
+  def _update_recordings(self):
+    """ update recordings if the index changed, keep current recording """
+
+    if self._app.recindex.version == self._rec_version:
+      return
+
+    if self._rec_index is None:
+      cur_rec = None
+    else:
+      cur_rec = self._recordings[self._rec_index]
+    self._rec_version = self._app.recindex.version
+    self._recordings  = self._app.recindex.get_recordings()
+    self.debug("recordings changed, now %d recordings",len(self._recordings))
+
+    if not len(self._recordings):
+      self._rec_index = None
+    elif cur_rec is None:
+      self._rec_index = self._group_start(len(self._recordings)-1)
+      self._set_recinfo()
+    else:
+      # stay at the current recording (or the next one if it was deleted)
+      self._rec_index = self._group_start(
+        min(bisect.bisect_left(self._recordings,cur_rec),
+            len(self._recordings)-1))
+      self._set_recinfo()                       # parts might have changed
+
   # --- toggle play/pause   ---------------------------------------------------
 
   def func_toggle_play(self,_):
     """ toggle play/pause """
 
-    if not self._app.mpg123.is_active():
-      # nothing is playing, so start player
-      self.func_play('_')
-    elif not self._play_pause:
-      # something is playing, so pause now
-      self.func_pause('_')
-    else:
-      # resume from pause
-      self.debug("resuming playback")
-      self._play_pause = False
-      now = datetime.datetime.now()
-      self._play_start_dt += (now-self._play_pause_dt)
-      self._app.mpg123.resume()
+    with self._lock:
+      if not self._app.mpg123.is_active():
+        # nothing is playing, so start player
+        self.func_play('_')
+      elif not self._play_pause:
+        # something is playing, so pause now
+        self.func_pause('_')
+      else:
+        # resume from pause
+        self.debug("resuming playback")
+        self._play_pause = False
+        now = datetime.datetime.now()
+        self._play_start_dt += (now-self._play_pause_dt)
+        self._app.mpg123.resume()
 
   # --- start playing   -------------------------------------------------------
 
   def func_play(self,_):
     """ start playing """
 
-    if not self._app.mpg123.is_active():
-      if not self._rec_index is None:
-        self.debug("starting playback")
+    with self._lock:
+      if not self._app.mpg123.is_active():
+        if self._rec_index is not None and len(self._parts) > 1:
+          # recording with multiple parts
+          self._start_queue(self._parts)
+        elif not self._rec_index is None:
+          self.debug("starting playback")
+          self._play_pause = False
+          self._queue      = None
+          self._play_start_dt = datetime.datetime.now()
+          self._app.mpg123.start(self._recordings[self._rec_index],False)
+      elif self._play_pause:
+        # resume from pause
+        self.debug("resuming playback")
         self._play_pause = False
-        self._play_start_dt = datetime.datetime.now()
-        self._app.mpg123.start(self._recordings[self._rec_index],False)
-    elif self._play_pause:
-      # resume from pause
-      self.debug("resuming playback")
-      self._play_pause = False
-      now = datetime.datetime.now()
-      self._play_start_dt += (now-self._play_pause_dt)
-      self._app.mpg123.resume()
+        now = datetime.datetime.now()
+        self._play_start_dt += (now-self._play_pause_dt)
+        self._app.mpg123.resume()
 
   # --- pause playing   -------------------------------------------------------
 
   def func_pause(self,_):
     """ pause playing """
 
-    if self._app.mpg123.is_active() and  not self._play_pause:
-      # something is playing, so pause now
-      self.debug("pausing playback")
-      self._play_pause = True
-      self._app.mpg123.pause()
-      self._play_pause_dt = datetime.datetime.now()
+    with self._lock:
+      if self._app.mpg123.is_active() and  not self._play_pause:
+        # something is playing, so pause now
+        self.debug("pausing playback")
+        self._play_pause = True
+        self._app.mpg123.pause()
+        self._play_pause_dt = datetime.datetime.now()
 
   # --- stop playing   --------------------------------------------------------
 
   def func_stop_play(self,_):
     """ stop playing """
 
-    if self._play_start_dt:
-      self.debug("stopping playback")
-      self._app.mpg123.stop()
-      self._play_start_dt = None
+    with self._lock:
+      if self._play_start_dt:
+        self.debug("stopping playback")
+        self._app.mpg123.stop()
+        self._play_start_dt = None
+        self._queue         = None
+
+  # --- play current and all following recordings   --------------------------
+
+  def func_play_following(self,_):
+    """ play current and all following recordings without gaps """
+
+    with self._lock:
+      if self._rec_index is None:
+        return
+      self._start_queue(self._recordings[self._rec_index:])
+
+  # --- play all recordings of the current channel   --------------------------
+
+  def func_play_channel(self,_):
+    """ play all recordings of the channel of the current recording """
+
+    with self._lock:
+      if self._rec_index is None:
+        return
+      name = self._channel_name
+      self._start_queue([rec for rec in self._recordings
+                         if self._app.recindex.split_name(rec)[2] == name])
+
+  # --- play all recordings of the current day   ------------------------------
+
+  def func_play_day(self,_):
+    """ play all recordings of the day of the current recording """
+
+    with self._lock:
+      if self._rec_index is None:
+        return
+      day = self._app.recindex.split_name(self._recordings[self._rec_index])[0]
+      self.play_range(day,day)
+
+  # --- play all recordings of a date-range   ---------------------------------
+
+  def play_range(self,first,last):
+    """ play all recordings between the days first and last (YYYYMMDD) """
+
+    if self._recordings:
+      self._start_queue([rec for rec in self._recordings
+                         if first <= self._app.recindex.split_name(rec)[0] <= last])
 
   # --- previous recording   --------------------------------------------------
 
   def func_prev_recording(self,_):
     """ switch to previous recording """
 
-    if self._app.mpg123.is_active():
-      self.debug("playback in progress, ignoring command")
-    else:
-      self.debug("switch to previous recording")
-      if self._rec_index is None:
-        return
+    with self._lock:
+      if self._app.mpg123.is_active():
+        self.debug("playback in progress, ignoring command")
       else:
-        self._rec_index = (self._rec_index-1) % len(self._recordings)
-        self.debug("current recording: %s" % self._recordings[self._rec_index])
-        self._set_recinfo()
+        self.debug("switch to previous recording")
+        self._update_recordings()
+        if self._rec_index is None:
+          return
+        else:
+          self._rec_index = self._group_start(
+                                  (self._rec_index-1) % len(self._recordings))
+          self.debug("current recording: %s",self._recordings[self._rec_index])
+          self._set_recinfo()
 
   # --- next recording   ------------------------------------------------------
 
   def func_next_recording(self,_):
     """ switch to next recording """
 
-    if self._app.mpg123.is_active():
-      self.debug("playback in progress, ignoring command")
-      self.debug("switch to next recording")
-    else:
-      if self._rec_index is None:
-        return
+    with self._lock:
+      if self._app.mpg123.is_active():
+        self.debug("playback in progress, ignoring command")
+        self.debug("switch to next recording")
       else:
-        self._rec_index = (self._rec_index+1) % len(self._recordings)
-        self.debug("current recording: %s" % self._recordings[self._rec_index])
-        self._set_recinfo()
+        self._update_recordings()
+        if self._rec_index is None:
+          return
+        else:
+          self._rec_index = ((self._rec_index+len(self._parts)) %
+                                                          len(self._recordings))
+          self.debug("current recording: %s",self._recordings[self._rec_index])
+          self._set_recinfo()
 
   # --- delete recording   ----------------------------------------------------
 
   def func_delete_recording(self,_):
     """ delete current recording """
 
-    if self._rec_index is None:
-      return
-    self.debug("deleting current recording")
-    self.func_stop_play('-')
-    self.debug("deleting %s" % self._recordings[self._rec_index])
-    os.unlink(self._recordings[self._rec_index])
-    del self._recordings[self._rec_index]
-    if not len(self._recordings):
-      self._rec_index = None
-    else:
-      if self._rec_index > len(self._recordings)-1:
-        self._rec_index -= 1
-      self._set_recinfo()
+    with self._lock:
+      if self._rec_index is None:
+        return
+      self.debug("deleting current recording")
+      self.func_stop_play('-')
+      for cur_rec in self._parts:
+        self.debug("deleting %s",cur_rec)
+        os.unlink(cur_rec)
+        self._app.recindex.remove(cur_rec)
+      self._update_recordings()
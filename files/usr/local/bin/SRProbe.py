@@ -0,0 +1,293 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class Prober
+#
+# The class Prober checks all channels concurrently (asyncio, limited number
+# of connections, timeouts): reachability, connect-latency, time to the
+# first audio-byte, codec, nominal bitrate and measured throughput. The
+# results are cached, the radio skips dead channels. Probing runs
+# periodically within the shared event-loop or once from the commandline
+# (option --probe).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import asyncio, ssl, time, urllib.parse, traceback
+
+from SRBase   import Base
+from SRStream import find_frame, frame_bitrate
+
+MAX_PLAYLIST  = 65536                  # size of m3u-playlists
+MAX_REDIRECTS = 3
+MARGIN        = 1                      # s after the deadline of the audio
+BURST_GAP     = 0.05                   # a read waiting x s ends the burst
+CODECS = {"audio/mpeg":      "mp3",
+          "audio/mp3":       "mp3",
+          "audio/aac":       "aac",
+          "audio/aacp":      "aac",
+          "audio/ogg":       "ogg",
+          "application/ogg": "ogg"}
+
+class Prober(Base):
+  """ health-checks of all channels """
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app     = app
+    self._results = {}                   # url -> result
+    self._m_connect = app.metrics.histogram(
+      "simple_radio_probe_connect_seconds","connect-latency of channels")
+    self._m_failed  = app.metrics.counter("simple_radio_probe_failures_total",
+                                          "failed probes of channels")
+    self.read_config()
+    if hasattr(app,'api'):
+      app.api.add_route("GET","/probe",self._get_probe)
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+
+    # section [PROBE]
+    self._interval    = float(self.get_value(self._app.parser,
+                                             "PROBE","interval",0))
+    self._concurrency = int(self.get_value(self._app.parser,
+                                           "PROBE","concurrency",4))
+    self._timeout     = float(self.get_value(self._app.parser,
+                                             "PROBE","timeout",5))
+    self._bytes       = int(self.get_value(self._app.parser,
+                                           "PROBE","bytes",16384))
+    self.skip_dead    = self.get_value(self._app.parser,
+                                       "PROBE","skip_dead","1") == "1"
+
+  # --- start periodic probing   ----------------------------------------------
+
+  def start(self):
+    """ start periodic probing within the shared event-loop """
+
+    if self._interval > 0:
+      self._app.eventloop.submit(self._run())
+
+  # --- return result   -------------------------------------------------------
+
+  def get_result(self,url):
+    """ return cached result of the url (None if not probed yet) """
+
+    return self._results.get(url)
+
+  # --- check for dead channels   ---------------------------------------------
+
+  def is_dead(self,url):
+    """ return True if the last probe of the url failed """
+
+    result = self._results.get(url)
+    return result is not None and not result["ok"]
+
+  # --- GET /probe (API)   ----------------------------------------------------
+
+  async def _get_probe(self,request):
+    """ return cached results of all channels """
+
+    results = []
+    for (i,(name,url)) in enumerate(self._app.radio.get_channels()):
+      result = dict(self._results.get(url) or {"ok": None})
+      result.update({"nr": i+1, "name": name, "url": url})
+      results.append(result)
+    await self._app.api.send_json(request.writer,200,results)
+
+  # --- periodic probing   ----------------------------------------------------
+
+  async def _run(self):
+    """ probe all channels every interval minutes """
+
+    self.debug("starting periodic probing (every %.1f minutes)",self._interval)
+    while True:
+      try:
+        await self.probe_all()
+      except asyncio.CancelledError:
+        raise
+      except:
+        if self._debug:
+          traceback.print_exc()
+      await asyncio.sleep(60*self._interval)
+
+  # --- probe all channels   --------------------------------------------------
+
+  async def probe_all(self):
+    """ probe all channels concurrently, return list of results """
+
+    limit = asyncio.Semaphore(self._concurrency)
+    async def probe(url):
+      async with limit:
+        return await self.probe(url)
+
+    urls = []
+    for (_,url) in self._app.radio.get_channels():
+      if not url in urls:
+        urls.append(url)
+    start   = time.monotonic()
+    results = await asyncio.gather(*[probe(url) for url in urls])
+    dead    = len([r for r in results if not r["ok"]])
+    self.debug("probed %d channels in %.1fs (%d dead)",
+               len(urls),time.monotonic()-start,dead)
+    return results
+
+  # --- probe a single url   --------------------------------------------------
+
+  async def probe(self,url):
+    """ probe url, cache and return the result """
+
+    result = {"ok": False, "connect": None, "first_byte": None,
+              "codec": None, "bitrate": None, "throughput": None,
+              "error": None,
+              "time": int(time.time())}
+    try:
+      # reading audio stops at the timeout, the margin bounds the rest
+      await asyncio.wait_for(self._fetch(url,result,time.monotonic()),
+                             self._timeout+MARGIN)
+      result["ok"] = result["first_byte"] is not None
+      if not result["ok"]:
+        result["error"] = "no data"
+    except asyncio.TimeoutError:
+      # slow channels are alive once audio arrived
+      result["ok"] = result["first_byte"] is not None
+      if not result["ok"]:
+        result["error"] = "timeout"
+    except (OSError,ValueError) as ex:
+      result["error"] = str(ex) or ex.__class__.__name__
+    if not result["ok"]:
+      self._m_failed.inc()
+    self.debug("probe %s: %r",url,result)
+    self._results[url] = result
+    return result
+
+  # --- connect and read the stream   -----------------------------------------
+
+  async def _fetch(self,url,result,start,redirects=MAX_REDIRECTS):
+    """ connect to the url (follow redirects and playlists), fill result """
+
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http","https") or not parts.hostname:
+      raise ValueError("unsupported url")
+    https = parts.scheme == "https"
+    port  = parts.port or (443 if https else 80)
+    (reader,writer) = await asyncio.open_connection(
+      parts.hostname,port,ssl=ssl.create_default_context() if https else None)
+    try:
+      if result["connect"] is None:
+        result["connect"] = round(time.monotonic()-start,3)
+        self._m_connect.observe(result["connect"])
+      path = parts.path or "/"
+      if parts.query:
+        path += "?" + parts.query
+      writer.write(("GET %s HTTP/1.0\r\nHost: %s\r\n"
+                    "User-Agent: simple-radio\r\n\r\n" %
+                    (path,parts.netloc)).encode('latin-1'))
+      (status,headers) = await self._read_header(reader)
+
+      if status in (301,302,303,307,308) and "location" in headers:
+        if not redirects:
+          raise ValueError("too many redirects")
+        return await self._fetch(urllib.parse.urljoin(url,headers["location"]),
+                                 result,start,redirects-1)
+      if status != 200:
+        raise ValueError("HTTP %d" % status)
+
+      content_type = headers.get("content-type","").split(";")[0].strip()
+      if content_type == "audio/x-mpegurl" or parts.path.endswith(".m3u"):
+        playlist = await reader.read(MAX_PLAYLIST)
+        for line in playlist.decode('utf-8','replace').splitlines():
+          if not line.startswith('#') and len(line) > 1:
+            return await self._fetch(line.strip(),result,start,redirects)
+        raise ValueError("empty playlist")
+
+      # read some audio (until the deadline: slow channels are alive, too),
+      # measure the throughput after the initial burst, i.e. after the
+      # first read which had to wait
+      result["codec"] = CODECS.get(content_type,content_type or None)
+      deadline = start + self._timeout
+      data  = b''
+      burst = None                                # (time,bytes) at its end
+      while len(data) < self._bytes:
+        now = time.monotonic()
+        if now >= deadline:
+          break
+        try:
+          chunk = await asyncio.wait_for(reader.read(self._bytes-len(data)),
+                                         deadline-now)
+        except asyncio.TimeoutError:
+          break
+        if not chunk:
+          break
+        if not data:
+          result["first_byte"] = round(time.monotonic()-start,3)
+        elif burst is None and time.monotonic()-now > BURST_GAP:
+          burst = (time.monotonic(),len(data)+len(chunk))
+        data += chunk
+
+      # measured throughput (kbit/s), the bitrate is nominal
+      if burst and time.monotonic() > burst[0] and len(data) > burst[1]:
+        result["throughput"] = round(8*(len(data)-burst[1])/
+                                     (time.monotonic()-burst[0])/1000,1)
+      pos = find_frame(data) if result["codec"] == "mp3" else -1
+      if pos >= 0:
+        result["bitrate"] = frame_bitrate(data,pos)
+      else:
+        try:
+          result["bitrate"] = int(headers["icy-br"].split(",")[0])
+        except (KeyError,ValueError):
+          pass
+    finally:
+      writer.close()
+
+  # --- read status-line and headers   ----------------------------------------
+
+  async def _read_header(self,reader):
+    """ return (status,headers) (also accepts ICY-responses) """
+
+    try:
+      header = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+      raise ValueError("no response")
+    except asyncio.LimitOverrunError:
+      raise ValueError("invalid response")
+    lines = header.decode('latin-1').split('\r\n')
+    try:
+      status = int(lines[0].split()[1])
+    except (IndexError,ValueError):
+      raise ValueError("invalid response")
+    headers = {}
+    for line in lines[1:]:
+      (name,_,value) = line.partition(':')
+      headers[name.strip().lower()] = value.strip()
+    return (status,headers)
+
+  # --- print results   -------------------------------------------------------
+
+  def print_results(self):
+    """ print results of all channels """
+
+    PRINT_PROBE_FMT = ("{0:>2s} {1:14.14s} {2:4s} {3:>7s} {4:>8s} "
+                       "{5:5s} {6:>4s} {7:>8s} {8:s}")
+    print(PRINT_PROBE_FMT.format("","channel","ok","connect","1st byte",
+                                 "codec","kbps","net kbps","error"))
+    for (i,(name,url)) in enumerate(self._app.radio.get_channels()):
+      r = self._results.get(url)
+      if not r:
+        continue
+      print(PRINT_PROBE_FMT.format(
+        str(i+1),name,"yes" if r["ok"] else "DEAD",
+        "%.3f" % r["connect"] if r["connect"] is not None else "-",
+        "%.3f" % r["first_byte"] if r["first_byte"] is not None else "-",
+        r["codec"] or "-",str(r["bitrate"] or "-"),
+        "%.1f" % r["throughput"] if r["throughput"] is not None else "-",
+        r["error"] or ""))
@@ -12,11 +12,16 @@
 #
 # -----------------------------------------------------------------------------
 
-import threading, os, time, datetime, shlex
-import queue, collections
+import threading, os, time, datetime, shlex, re
+import collections
 import threading, signal, subprocess, traceback
 
 from SRBase import Base
+from SRBus  import TitleEvent, ChannelEvent, RecordEvent
+
+TIMESHIFT_MIN = 2                           # show timeshift-delay from x s
+MAX_TITLES    = 8                           # titles pending for the display
+VARIANT       = re.compile(r"^(\d+):(.+)$")   # kbps:url (quality-variant)
 
 class Radio(Base):
   """ Radio-controller """
@@ -33,6 +38,11 @@ class Radio(Base):
     self._name         = ''
     self.stop_event    = app.stop_event
     self._title_toggle = True               # toggle title during recording
+    self._paused       = False              # live radio paused (timeshift)
+    self._entry        = ""                 # digits of the channel-entry
+    self._entry_timer  = None
+    self._entry_lock   = threading.Lock()
+    self._titles       = app.bus.subscribe(TitleEvent,maxlen=MAX_TITLES)
     self.read_config()
     self.read_channels()
 
@@ -47,6 +57,8 @@ class Radio(Base):
                                        "simple-radio.channels")
     self._channel_file  = self.get_value(self._app.parser,"GLOBAL","channel_file",
                                          default_path)
+    self._digit_timeout = float(self.get_value(self._app.parser,"GLOBAL",
+                                               "digit_timeout",1.5))
 
   # --- return persistent state of this class   -------------------------------
 
@@ -71,10 +83,33 @@ class Radio(Base):
     """ read channels into a list """
 
     self._channels = []
+    self._variants = {}                           # url -> list of variants
     with open(self._channel_file) as f:
       for channel in f:
-        channel = channel.rstrip('\n')
-        self._channels.append(channel.split('@')) # channel: line with name@url
+        channel = channel.strip()
+        if not channel or channel.startswith('#'):
+          continue                                # empty line or comment
+        # channel: line with name@url (optionally @mirror@mirror...), an
+        # url with a kbps:-prefix starts a quality-variant, urls without
+        # prefix are mirrors of the preceding variant
+        (name,*urls) = channel.split('@')
+        if not urls:
+          print("[WARNING] no url for channel %s, ignoring line" % name)
+          continue
+        variants = []
+        for url in urls:
+          match = VARIANT.match(url)
+          if match:
+            variants.append((int(match.group(1)),[match.group(2)]))
+          elif variants:
+            variants[-1][1].append(url)
+          else:
+            variants.append((None,[url]))
+        # the first url identifies the channel, best quality first
+        # (variants without bitrate count as best)
+        self._channels.append([name,variants[0][1][0]])
+        self._variants[variants[0][1][0]] = sorted(
+          variants,key=lambda v: -v[0] if v[0] is not None else -1e9)
 
   # --- get channel info   ----------------------------------------------------
 
@@ -83,6 +118,32 @@ class Radio(Base):
 
     return self._channels[index]
 
+  # --- return variants of a channel   ---------------------------------------
+
+  def get_variants(self,url):
+    """ return list of (kbps,mirrors) of the channel with the given (first)
+        url, best quality first (kbps is None if unknown) """
+
+    return self._variants.get(url,[(None,[url])])
+
+  # --- return all channels   ------------------------------------------------
+
+  def get_channels(self):
+    """ return list of [name,url] of all channels """
+
+    return self._channels
+
+  # --- return status   -------------------------------------------------------
+
+  def get_status(self):
+    """ return status of the radio """
+
+    return {
+      "active":  self._active,
+      "channel": self._channel+1 if self._channel >= 0 else None,
+      "name":    self._name
+      }
+
   # --- set state   -----------------------------------------------------------
 
   def set_state(self,active):
@@ -103,48 +164,65 @@ class Radio(Base):
 
     return self._active
 
+  # --- recording state   -----------------------------------------------------
+
+  def _is_recording(self):
+    """ return recording-state (last event of the recorder) """
+
+    event = self._app.bus.last(RecordEvent)
+    return event is not None and event.recording
+
   # --- get title-line (1st line of display)   -------------------------------
 
   def get_title(self):
-    """ return title-line (1st line of display) """
-
-    now = datetime.datetime.now()
-    if self._name and self._app.recorder.is_recording():
-      # listening radio and ongoing recording: toggle title-line
-      if self._title_toggle:
-        self._title_toggle = False
-        return self._app.recorder.get_title()      # delegate to recorder
-      else:
-        self._title_toggle = True
-        return (self._name,now.strftime("%H:%M"))  # provide title ourselves
+    """ return title-line (1st line of display), toggle between the
+        alternatives of get_titles() """
+
+    titles = self.get_titles()
+    if len(titles) == 1:
+      return titles[0]
+    self._title_toggle = not self._title_toggle
+    return titles[1 if self._title_toggle else 0]
+
+  def get_titles(self):
+    """ return alternative title-lines (the display toggles between them) """
+
+    now   = datetime.datetime.now()
+    entry = self._entry
+    if entry:
+      # pending channel-entry: show number and name of the channel
+      nr = int(entry)
+      name = self._channels[nr-1][0] if 0 < nr <= len(self._channels) else "?"
+      return [("%s_ %s" % (entry,name),"")]
+    elif self._name and self._is_recording():
+      # listening radio and ongoing recording: toggle title-line between
+      # recorder and ourselves
+      return [self._app.recorder.get_title(),
+              (self._name,now.strftime("%H:%M"))]
+    elif self._name and self._paused:
+      return [(self._name,"||")]
     elif self._name:
-      # no recording, just show current channel
-      return (self._name,now.strftime("%H:%M"))
-    elif self._app.recorder.is_recording():
+      # no recording, just show current channel (and timeshift-delay)
+      delay = int(self._app.mpg123.get_timeshift())
+      if delay >= TIMESHIFT_MIN:
+        return [(self._name,"-%d:%02d" % divmod(delay,60))]
+      return [(self._name,now.strftime("%H:%M"))]
+    elif self._is_recording():
       # only recording: delegate to recorder
-      return self._app.recorder.get_title()
+      return [self._app.recorder.get_title()]
     else:
       # return date + time
-      return (now.strftime("%x"),now.strftime("%H:%M"))
+      return [(now.strftime("%x"),now.strftime("%H:%M"))]
 
   # --- get content for display   -------------------------------------------
 
   def get_content(self):
-    """ read icy-data if available """
+    """ return new titles (separated by a line of stars) """
 
     lines = []
-    if self._app.mpg123.icy_data:
-      while True:
-        try:
-          line = self._app.mpg123.icy_data.get_nowait()
-          self.debug("get_content: line: %s" % line)
-          lines.append(line)
-        except queue.Empty:
-          break
-        except:
-          if self._debug:
-            traceback.print_exc()
-          break
+    for event in self._titles.drain():
+      self.debug("get_content: title: %s",event.title)
+      lines.extend([event.title,6*'*'])
     return lines
 
   # --- print channel-list   --------------------------------------------------
@@ -160,20 +238,63 @@ class Radio(Base):
 
   # --- switch channel   ------------------------------------------------------
 
-  def func_switch_channel(self,nr):
+  def func_switch_channel(self,key):
+    """ add digit to the channel-entry, tune if the number is complete """
+
+    if not self._digit_timeout:
+      self.func_tune_channel(key)
+      return
+
+    with self._entry_lock:
+      if self._entry_timer:
+        self._entry_timer.cancel()
+        self._entry_timer = None
+      self._entry += str(key)
+      entry = self._entry
+      self.debug("channel-entry: %s",entry)
+      if int(entry)*10 > len(self._channels):
+        # no further digit possible: tune now
+        self._entry = ""
+      else:
+        self._entry_timer = threading.Timer(self._digit_timeout,
+                                            self._entry_timeout)
+        self._entry_timer.start()
+        entry = None
+    self._app.display.refresh()
+    if entry:
+      self.func_tune_channel(entry)
+
+  # --- timeout of the channel-entry   ----------------------------------------
+
+  def _entry_timeout(self):
+    """ channel-entry is complete: queue tuning of the channel """
+
+    with self._entry_lock:
+      entry             = self._entry
+      self._entry       = ""
+      self._entry_timer = None
+    if entry:
+      self._app.queue_func("tune_channel",entry)
+
+  # --- tune channel   --------------------------------------------------------
+
+  def func_tune_channel(self,nr):
     """ switch to given channel """
 
     nr = int(nr)
-    self.debug("switch to channel %d" % nr)
+    self.debug("switch to channel %d",nr)
     # check if we have to do anything
-    if nr == (self._channel+1):
-      self.debug("already on channel %d" % nr)
+    if nr < 1 or nr == (self._channel+1):
+      self.debug("invalid channel or already on channel %d",nr)
+      self._app.display.refresh()                 # remove channel-entry
       return
 
     # kill current mpg123 process
     self._name = None
     self._channel = -1
+    self._paused  = False
     self._app.mpg123.stop()
+    self._titles.drain()                          # titles of the last channel
 
     self._channel = min(nr-1,len(self._channels)-1)
     self._last_channel = self._channel
@@ -182,34 +303,62 @@ class Radio(Base):
 
     # display name of channel on display
     self._name = channel_name
-    self.debug("starting new channel %s" % self._name)
+    self.debug("starting new channel %s",self._name)
     self._app.mpg123.start(channel_url,True)
+    self._app.bus.publish(ChannelEvent(self._channel+1,channel_name))
+
+  # --- check for dead channels   ---------------------------------------------
+
+  def is_dead(self,index):
+    """ return True if the last probe of the channel failed """
+
+    prober = getattr(self._app,'prober',None)
+    return prober is not None and prober.is_dead(self._channels[index][1])
+
+  # --- skip dead channels   --------------------------------------------------
+
+  def _skip_dead(self,index,step):
+    """ return index of the next live channel (in direction step) """
+
+    prober = getattr(self._app,'prober',None)
+    if not prober or not prober.skip_dead:
+      return index
+    n = len(self._channels)
+    for i in range(n):
+      candidate = (index+i*step) % n
+      if not self.is_dead(candidate):
+        if i:
+          self.debug("skipping %d dead channel(s)",i)
+        return candidate
+    return index                                  # all dead: don't skip
 
   # --- switch to next channel   ----------------------------------------------
 
-  def func_next_channel(self,_):
-    """ switch to next channel """
+  def func_next_channel(self,_,count=1):
+    """ switch to next channel (skip count-1 and dead channels) """
 
-    self.debug("switch to next channel")
-    # switch_channel expects a channel-number, while self._channel is
+    self.debug("switch to next channel (%d)",count)
+    # tune_channel expects a channel-number, while self._channel is
     # a channel index
     if self._channel == -1:
-      self.func_switch_channel(1)
+      index = (count-1) % len(self._channels)
     else:
-      self.func_switch_channel(1+((self._channel+1) % len(self._channels)))
+      index = (self._channel+count) % len(self._channels)
+    self.func_tune_channel(1+self._skip_dead(index,1))
 
   # --- switch to previous channel   ------------------------------------------
 
-  def func_prev_channel(self,_):
-    """ switch to previous channel """
+  def func_prev_channel(self,_,count=1):
+    """ switch to previous channel (skip count-1 and dead channels) """
 
-    self.debug("switch to previous channel")
-    # switch_channel expects a channel-number, while self._channel is
+    self.debug("switch to previous channel (%d)",count)
+    # tune_channel expects a channel-number, while self._channel is
     # a channel index
     if self._channel == -1:
-      self.func_switch_channel(len(self._channels))
+      index = (-count) % len(self._channels)
     else:
-      self.func_switch_channel(1+((self._channel-1) % len(self._channels)))
+      index = (self._channel-count) % len(self._channels)
+    self.func_tune_channel(1+self._skip_dead(index,-1))
 
   # --- turn radio off   ------------------------------------------------------
 
@@ -219,7 +368,9 @@ class Radio(Base):
     self.debug("turning radio off")
     self._name    = None
     self._channel = -1
+    self._paused  = False
     self._app.mpg123.stop()
+    self._app.bus.publish(ChannelEvent(None,None))
 
   # --- turn radio on   -------------------------------------------------------
 
@@ -229,10 +380,44 @@ class Radio(Base):
     if self._channel == -1:
       self.debug("turning radio on")
       # if last_channel is -1, we just switch to the first channel
-      self.func_switch_channel(max(self._last_channel,0)+1)
+      self.func_tune_channel(max(self._last_channel,0)+1)
     else:
       self.debug("ignoring command, radio already on")
 
+  # --- pause live radio   ----------------------------------------------------
+
+  def func_pause(self,_):
+    """ pause live radio (the stream-hub keeps buffering) """
+
+    if not self._app.hub.enabled or self._paused or self._channel == -1:
+      self.debug("ignoring pause")
+      return
+    self.debug("pausing live radio")
+    self._paused = True
+    self._app.mpg123.pause()
+
+  # --- continue live radio   -------------------------------------------------
+
+  def func_play(self,_):
+    """ continue paused live radio (delayed) """
+
+    if self._paused:
+      self.debug("continuing live radio")
+      self._paused = False
+      self._app.mpg123.resume()
+    elif self._channel == -1:
+      self.func_radio_on(_)
+
+  # --- toggle pause/play   ---------------------------------------------------
+
+  def func_toggle_play(self,_):
+    """ toggle pause/play of live radio """
+
+    if self._paused or self._channel == -1:
+      self.func_play(_)
+    else:
+      self.func_pause(_)
+
   # --- toggle recording   ----------------------------------------------------
 
   def func_toggle_record(self,_):
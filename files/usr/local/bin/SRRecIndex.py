@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class RecIndex
+#
+# The class RecIndex keeps a sorted list of all recordings of the
+# record-directory. Changes of the directory are tracked with inotify
+# (with a polling fallback), so the list never needs a full rescan.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import threading, os, select, struct, bisect, traceback
+from threading import Thread
+
+try:
+  import ctypes, ctypes.util
+  _libc = ctypes.CDLL(ctypes.util.find_library("c"),use_errno=True)
+  have_inotify = hasattr(_libc,"inotify_init1")
+except:
+  have_inotify = False
+
+from SRBase import Base
+
+# inotify constants (see /usr/include/sys/inotify.h)
+IN_CREATE     = 0x00000100
+IN_DELETE     = 0x00000200
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO   = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_EVENT_HDR  = struct.Struct("iIII")
+
+POLL_TIME = 2                          # poll-time for inotify-events
+SCAN_TIME = 10                         # scan-interval without inotify
+
+class RecIndex(Thread,Base):
+  """ index of recordings """
+
+  EXTENSIONS = [".mp3",".ogg",".wav"]
+
+  def __init__(self,app):
+    """ initialization """
+    super(RecIndex,self).__init__(name="RecIndex")
+
+    self._app        = app
+    self._lock       = threading.Lock()
+    self._recordings = []                    # sorted list of recordings
+    self._snapshot   = ()                    # immutable copy for readers
+    self._snapshot_version = -1
+    self.version     = 0                     # incremented on every change
+    self.read_config()
+    self.rescan()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug  = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+
+    # section [RECORD]
+    if not self._app.options.target_dir is None:
+      self._target_dir = self._app.options.target_dir[0]
+    else:
+      self._target_dir = self.get_value(self._app.parser,"RECORD","dir",
+                                        os.path.expanduser("~"))
+    if not os.path.exists(self._target_dir):
+      os.mkdir(self._target_dir)
+    elif not os.path.isdir(self._target_dir):
+      print("[ERROR] target-directory for recordings %s is not a directory" %
+            self._target_dir)
+
+  # --- return target directory   ---------------------------------------------
+
+  def get_dir(self):
+    """ return directory of recordings """
+
+    return self._target_dir
+
+  # --- check if the file is a recording   ------------------------------------
+
+  def _is_recording(self,name):
+    """ check extension of file """
+
+    (_,ext) = os.path.splitext(name)
+    return ext in RecIndex.EXTENSIONS
+
+  # --- split name of recording into date, time and channel   -----------------
+
+  def split_name(self,rec):
+    """ split filename of recording into [date,time,channel] """
+
+    (_,rec) = os.path.split(rec)                            # remove path
+    (rec,_) = os.path.splitext(rec)                         # remove extension
+    return rec.split("_")                                   # and split
+
+  # --- return key of the logical recording   --------------------------------
+
+  def group_key(self,rec):
+    """ return key of the logical recording (all parts share the key) """
+
+    name = self.split_name(rec)
+    if len(name) == 3 and '-' in name[1]:
+      # part of a split recording: date_time-part_channel
+      return (os.path.dirname(rec),name[0],name[1].split('-')[0],name[2])
+    else:
+      return rec
+
+  # --- full scan of the directory   ------------------------------------------
+
+  def rescan(self):
+    """ read recordings from configured directory """
+
+    self.debug("scanning %s",self._target_dir)
+    recordings = []
+    for entry in os.scandir(self._target_dir):
+      if entry.is_file() and self._is_recording(entry.name):
+        recordings.append(entry.path)
+    recordings.sort()
+    with self._lock:
+      self._recordings = recordings
+      self.version    += 1
+
+  # --- add a recording   -----------------------------------------------------
+
+  def add(self,path):
+    """ add a recording to the index """
+
+    if not self._is_recording(path):
+      return
+    with self._lock:
+      i = bisect.bisect_left(self._recordings,path)
+      if i < len(self._recordings) and self._recordings[i] == path:
+        return
+      self.debug("adding %s",path)
+      self._recordings.insert(i,path)
+      self.version += 1
+
+  # --- remove a recording   --------------------------------------------------
+
+  def remove(self,path):
+    """ remove a recording from the index """
+
+    with self._lock:
+      i = bisect.bisect_left(self._recordings,path)
+      if i < len(self._recordings) and self._recordings[i] == path:
+        self.debug("removing %s",path)
+        del self._recordings[i]
+        self.version += 1
+
+  # --- return recordings   ---------------------------------------------------
+
+  def get_recordings(self):
+    """ return (immutable) sorted sequence of recordings """
+
+    with self._lock:
+      if self._snapshot_version != self.version:
+        self._snapshot         = tuple(self._recordings)
+        self._snapshot_version = self.version
+      return self._snapshot
+
+  # --- watcher thread   ------------------------------------------------------
+
+  def run(self):
+    """ track changes of the recording directory """
+
+    self.debug("starting RecIndex.run()")
+    fd = -1
+    if have_inotify:
+      fd = _libc.inotify_init1(os.O_NONBLOCK|os.O_CLOEXEC)
+      if fd >= 0 and _libc.inotify_add_watch(fd,
+                        os.fsencode(self._target_dir),
+                        IN_CREATE|IN_DELETE|IN_MOVED_FROM|IN_MOVED_TO) < 0:
+        os.close(fd)
+        fd = -1
+    if fd < 0:
+      self.debug("inotify not available, polling %s",self._target_dir)
+      self._poll()
+    else:
+      self._watch(fd)
+      os.close(fd)
+    self.debug("terminating RecIndex.run() on stop request")
+
+  # --- process inotify-events   ----------------------------------------------
+
+  def _watch(self,fd):
+    """ process inotify-events until the program stops """
+
+    poll_obj = select.poll()
+    poll_obj.register(fd,select.POLLIN)
+    while not self._app.stop_event.is_set():
+      if not poll_obj.poll(POLL_TIME*1000):
+        continue
+      try:
+        data = os.read(fd,4096)
+      except BlockingIOError:
+        continue
+      pos = 0
+      while pos < len(data):
+        (_,mask,_,length) = IN_EVENT_HDR.unpack_from(data,pos)
+        pos += IN_EVENT_HDR.size
+        name = os.fsdecode(data[pos:pos+length].rstrip(b'\0'))
+        pos += length
+        if mask & IN_Q_OVERFLOW:
+          self.rescan()
+          continue
+        path = os.path.join(self._target_dir,name)
+        if mask & (IN_CREATE|IN_MOVED_TO):
+          if os.path.isfile(path):
+            self.add(path)
+        elif mask & (IN_DELETE|IN_MOVED_FROM):
+          self.remove(path)
+
+  # --- polling fallback   ----------------------------------------------------
+
+  def _poll(self):
+    """ compare directory with the index every SCAN_TIME seconds """
+
+    while not self._app.stop_event.wait(SCAN_TIME):
+      try:
+        current = set(entry.path for entry in os.scandir(self._target_dir)
+                      if entry.is_file() and self._is_recording(entry.name))
+        with self._lock:
+          known = set(self._recordings)
+        for path in current - known:
+          self.add(path)
+        for path in known - current:
+          self.remove(path)
+      except:
+        if self._debug:
+          traceback.print_exc()
@@ -15,10 +15,15 @@
 #
 # -----------------------------------------------------------------------------
 
-import threading, os, datetime, urllib.request
+import threading, os, time, datetime, traceback
 from threading import Thread
 
-from SRBase import Base
+from SRBase      import Base
+from SRBus       import RecordEvent
+from SRStream    import find_frame
+from SRStreamHub import MirrorReader
+
+CONNECT_TIMEOUT = 15
 
 class Recorder(Thread,Base):
   """ Recorder-controller """
@@ -33,6 +38,14 @@ class Recorder(Thread,Base):
     self.rec_stop      = None
     self._rec_channel  = None
     self._rec_start_dt = None
+    self._rec_cursor   = None
+    self._m_bytes  = app.metrics.counter("simple_radio_recorder_bytes_total",
+                                         "bytes written by the recorder")
+    self._m_read   = app.metrics.histogram("simple_radio_recorder_read_seconds",
+                                           "time to read a chunk of the stream")
+    self._m_stalls = app.metrics.counter("simple_radio_recorder_stalls_total",
+                                         "reads taking more than twice the "
+                                         "playtime of the data")
 
     self.read_config()
     app.register_funcs(self.get_funcs())
@@ -46,21 +59,20 @@ class Recorder(Thread,Base):
     self._debug = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
 
     # section [RECORD]
-    if not self._app.options.target_dir is None:
-      self._target_dir = self._app.options.target_dir[0]
-    else:
-      self._target_dir = self.get_value(self._app.parser,"RECORD","dir",
-                                        os.path.expanduser("~"))
-    if not os.path.exists(self._target_dir):
-      os.mkdir(self._target_dir)
-    elif not os.path.isdir(self._target_dir):
-      print("[ERROR] target-directory for recordings %s is not a directory" %
-            self._target_dir)
-
+    self._target_dir = self._app.recindex.get_dir()
     if self._app.options.duration:
       self._duration = int(self._app.options.duration)
     else:
       self._duration = int(self.get_value(self._app.parser,"RECORD","duration",60))
+    self._bitrate = int(self.get_value(self._app.parser,"RECORD","bitrate",128))
+    self._rollover       = int(self.get_value(self._app.parser,
+                                              "RECORD","rollover",0))
+    self._rollover_title = self.get_value(self._app.parser,
+                                          "RECORD","rollover_title","0") == "1"
+    self._prerecord      = int(self.get_value(self._app.parser,
+                                              "RECORD","prerecord",0))
+    self._best           = self.get_value(self._app.parser,
+                                          "RECORD","quality","auto") == "best"
 
   # --- return status of recorder   -------------------------------------------
 
@@ -69,50 +81,186 @@ class Recorder(Thread,Base):
 
     return self._rec_start_dt is not None
 
+  # --- return status   -------------------------------------------------------
+
+  def get_status(self):
+    """ return status of the recorder """
+
+    start_dt = self._rec_start_dt
+    if start_dt is None:
+      return {"recording": False}
+    return {
+      "recording": True,
+      "channel":   self._rec_channel,
+      "start":     start_dt.isoformat(timespec='seconds'),
+      "elapsed":   int((datetime.datetime.now()-start_dt).total_seconds()),
+      "duration":  self._duration
+      }
+
   # --- record stream   -------------------------------------------------------
 
   def record_stream(self,channel):
     """ record the given stream """
 
     self._rec_channel,url = channel
-    request = urllib.request.Request(url)
     cur_dt_string = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = "%s%s%s_%s" % (self._target_dir,os.sep,cur_dt_string,
-                                                             self._rec_channel)
+    base = os.path.join(self._target_dir,cur_dt_string)
 
-    content_type = request.get_header('Content-Type')
+    opened = self._open_reader(url)
+    if not opened:
+      self.rec_stop.set()
+      return
+    (reader,content_type,bitrate,align) = opened
     if(content_type == 'audio/mpeg'):
-      filename += '.mp3'
+      ext = '.mp3'
     elif(content_type == 'application/ogg' or content_type == 'audio/ogg'):
-      filename += '.ogg'
-    elif(content_type == 'audio/x-mpegurl'):
-      url = None
-      conn = urllib.request.urlopen(request)
-      with conn as stream:
-        if not line.startswith('#') and len(line) > 1:
-          url = line
-          stream.close()
-      if url:
-        request = urllib.request.Request(url)
-        filename += '.mp3'
-      else:
-        self._debug("could not parse m3u-playlist")
-        return
+      ext = '.ogg'
     else:
-      self.debug('unknown content type %r. Assuming mp3' % content_type)
-      filename += '.mp3'
-
-    with open(filename, "wb") as stream:
-      self.debug('recording %s for %d minutes' %
-                                              (self._rec_channel,self._duration))
-      conn = urllib.request.urlopen(request)
-      self._rec_start_dt = datetime.datetime.now()
-      while(not self.rec_stop.is_set()):
-        stream.write(conn.read(Recorder.RECORD_CHUNK))
-
+      self.debug('unknown content type %r. Assuming mp3',content_type)
+      ext = '.mp3'
+
+    # check if the recording fits (bitrate in kbit/s)
+    bitrate = bitrate or self._bitrate
+    size = 60*self._duration*bitrate*1000//8
+    if not self._app.retention.check_space(size):
+      print("[ERROR] not enough space for recording %s (%d MB)" %
+            (self._rec_channel,size//(1024*1024)))
+      reader.close()
+      self.rec_stop.set()
+      return
+
+    # splitting into parts needs MPEG-frames
+    rollover = ext == '.mp3' and (self._rollover or self._rollover_title)
+    part     = 1 if rollover else 0
+    (filename,stream) = self._open_part(base,ext,part)
+    part_start = time.time()
+    cut        = False
+    title      = None
+
+    self.debug('recording %s for %d minutes',
+                                            self._rec_channel,self._duration)
+    self._rec_start_dt = datetime.datetime.now()
+    self._app.bus.publish(RecordEvent(True,self._rec_channel,
+                                      self._rec_start_dt.timestamp(),
+                                      self._duration))
+    while(not self.rec_stop.is_set()):
+      start = time.monotonic()
+      (data,new_title) = reader.read(Recorder.RECORD_CHUNK)
+      if not data:
+        self.debug('end of stream')
+        break
+      duration = time.monotonic() - start
+      self._m_read.observe(duration)
+      self._m_bytes.inc(len(data))
+      if duration > 2*len(data)/(125*bitrate):
+        self._m_stalls.inc()
+
+      # recordings starting within the stream start with a complete frame
+      if align:
+        align = False
+        if ext == '.mp3':
+          pos = find_frame(bytes(data))
+          if pos > 0:
+            data = data[pos:]
+
+      # rollover at the first frame boundary after the trigger
+      if (rollover and self._rollover and
+                               time.time() - part_start >= 60*self._rollover):
+        cut = True
+      if cut:
+        pos = find_frame(bytes(data))
+        if pos >= 0:
+          stream.write(data[:pos])
+          self._close_part(filename,stream)
+          part += 1
+          (filename,stream) = self._open_part(base,ext,part)
+          part_start = time.time()
+          data = data[pos:]
+          cut  = False
+      stream.write(data)
+
+      if new_title is not None and new_title != title:
+        self.debug("new title: %s",new_title)
+        cut   = rollover and self._rollover_title and title is not None
+        title = new_title
+
+      # check free space
+      if self._app.retention.get_free() < 0:
+        self._app.retention.wake()
+        if self._app.retention.get_free(False) < 4*Recorder.RECORD_CHUNK:
+          print("[ERROR] disk full, stopping recording of %s" %
+                self._rec_channel)
+          break
+    reader.close()
+    self._rec_cursor = None
+    self._close_part(filename,stream)
+
+    self._app.retention.wake()
     self.debug('recording finished')
+    self._rec_start_dt = None
+    self._app.bus.publish(RecordEvent(False,self._rec_channel,None,None))
     self.rec_stop.set()
 
+  # --- open stream   ---------------------------------------------------------
+
+  def _open_reader(self,url):
+    """ return (reader,content_type,bitrate,align) or None on errors """
+
+    hub = self._app.hub
+    if hub.enabled:
+      # share the connection of the hub, start with the audible data
+      # (or prerecord minutes before, as far as the ring-buffer reaches).
+      # The best quality-variant needs a connection of its own.
+      start  = None
+      shared = not self._best or len(hub.get_variants(url)) == 1
+      if hasattr(self._app,'mpg123') and shared:
+        start = self._app.mpg123.get_audible_pos(url)
+      if start is not None and self._prerecord:
+        start -= 60*self._prerecord*hub.get_stream(url).byte_rate()
+      self.debug("recording from the stream-hub (start: %r)",start)
+      cursor = hub.attach(url,start,best=self._best)
+      stream = cursor.stream
+      if not stream.ready.wait(CONNECT_TIMEOUT) or stream.failed:
+        print("[ERROR] could not connect to %s" % url)
+        cursor.close()
+        return None
+      self._rec_cursor = cursor
+      return (cursor,stream.content_type,stream.bitrate,True)
+
+    try:
+      reader = MirrorReader(hub,url,self._rollover_title,
+                            lambda: not self.rec_stop.is_set(),self._best)
+    except:
+      print("[ERROR] could not connect to %s" % url)
+      if self._debug:
+        traceback.print_exc()
+      return None
+    return (reader,reader.content_type,reader.bitrate,False)
+
+  # --- open a (part of a) recording   ----------------------------------------
+
+  def _open_part(self,base,ext,part):
+    """ open file for the given part (0: no parts) """
+
+    if part:
+      filename = "%s-%03d_%s%s" % (base,part,self._rec_channel,ext)
+    else:
+      filename = "%s_%s%s" % (base,self._rec_channel,ext)
+    self.debug("writing to %s",filename)
+    stream = open(filename,"wb")
+    self._app.retention.protect(filename)
+    self._app.recindex.add(filename)
+    return (filename,stream)
+
+  # --- close a (part of a) recording   ---------------------------------------
+
+  def _close_part(self,filename,stream):
+    """ close file and hand it over to postprocessing """
+
+    stream.close()
+    self._app.retention.release(filename)
+    self._app.transcoder.submit(filename)
+
   # --- get title for recordings   -------------------------------------------
 
   def get_title(self):
@@ -141,6 +289,9 @@ class Recorder(Thread,Base):
     """ start recording (argument is [name,url]-list) """
 
     self.debug("start recording")
+    if self.rec_stop and self.rec_stop.is_set():
+      # last recording terminated by itself
+      self.stop_recording()
     if self.rec_stop is None:
       # no recording ongoing, start it
       self._rec_thread = Thread(target=self.record_stream,args=(channel,))
@@ -154,8 +305,11 @@ class Recorder(Thread,Base):
 
     self.debug("stop recording")
     if self.rec_stop:
-      # recording is ongoing, so stop it
+      # recording is ongoing, so stop it (closing the cursor wakes the reader)
       self.rec_stop.set()
+      cursor = self._rec_cursor
+      if cursor:
+        cursor.close()
       self._rec_thread.join()
       self.rec_stop      = None
       self._rec_start_dt = None
@@ -165,6 +319,8 @@ class Recorder(Thread,Base):
   def record(self,channel):
     """ record the given channel (blocks) """
 
+    self._app.retention.cleanup()
     self.start_recording(channel)
     if not self.rec_stop.wait(60*self._duration):
       self.stop_recording()
+    self._app.transcoder.wait()
@@ -0,0 +1,399 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class Relay
+#
+# The class Relay re-serves channels of the stream-hub as HTTP/ICY-streams
+# on the LAN: the current channel (path /) or channel n (path /n). All
+# listeners of a channel share the single upstream connection and the
+# ring-buffer of the hub. Writes never block: listeners which fall behind
+# by more than max_lag seconds are disconnected.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import socket, selectors, time, traceback
+from threading import Thread
+
+from SRBase   import Base
+from SRStream import find_frame
+from SRApi    import HTTP_STATUS
+
+POLL_TIME       = 0.05                 # check for new data of the streams
+IDLE_TIME       = 1                    # poll-time without listeners
+SEND_CHUNK      = 16384
+SEND_BUFFER     = 65536                # small socket-buffer: lag stays visible
+METAINT         = 16000                # bytes between ICY-metadata
+MAX_REQUEST     = 4096
+REQUEST_TIMEOUT = 10
+
+# --- a single listener   -----------------------------------------------------
+
+class Listener(object):
+  """ client of the relay """
+
+  def __init__(self,sock,addr):
+    """ initialization """
+
+    self.sock     = sock
+    self.addr     = "%s:%d" % addr[:2]
+    self.request  = b''
+    self.cursor   = None
+    self.channel  = None
+    self.name     = None
+    self.icy      = False
+    self.aligned  = False
+    self.pending  = b''                  # unsent data (header, partial sends)
+    self.to_meta  = METAINT
+    self.title    = None                 # title of the last metadata
+    self.next_title = None
+    self.start    = time.monotonic()
+    self.bytes    = 0
+
+  # --- return status   -------------------------------------------------------
+
+  def get_status(self):
+    """ return status and throughput of the listener """
+
+    secs = time.monotonic() - self.start
+    lag  = None
+    if self.cursor:
+      stream = self.cursor.stream
+      lag = round((stream.pos-self.cursor.pos)/stream.byte_rate(),2)
+    return {
+      "addr":    self.addr,
+      "channel": self.channel,
+      "name":    self.name,
+      "seconds": round(secs,1),
+      "bytes":   self.bytes,
+      "kbps":    round(8*self.bytes/secs/1000,1) if secs else 0,
+      "lag":     lag
+      }
+
+# --- relay server   ----------------------------------------------------------
+
+class Relay(Thread,Base):
+  """ HTTP/ICY-relay of the streams of the hub """
+
+  def __init__(self,app):
+    """ initialization """
+    super(Relay,self).__init__(name="Relay")
+
+    self._app       = app
+    self._listeners = []
+    self.port       = None               # bound port (after start)
+    self._m_bytes   = app.metrics.counter("simple_radio_relay_bytes_total",
+                                          "bytes sent to relay-listeners")
+    self._m_listeners = app.metrics.counter(
+      "simple_radio_relay_listeners_total","listeners of the relay")
+    self._m_evicted = app.metrics.counter("simple_radio_relay_evictions_total",
+                                          "slow relay-listeners disconnected")
+    self.read_config()
+    app.api.add_route("GET","/relay",self._get_relay)
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug  = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+    self._active = self.get_value(self._app.parser,"GLOBAL", "relay","0") == "1"
+
+    # section [RELAY]
+    self._host    = self.get_value(self._app.parser,"RELAY","host","0.0.0.0")
+    self._port    = int(self.get_value(self._app.parser,"RELAY","port",8000))
+    self._max_listeners = int(self.get_value(self._app.parser,
+                                             "RELAY","listeners",8))
+    self._max_lag = float(self.get_value(self._app.parser,"RELAY","max_lag",10))
+    self._burst   = float(self.get_value(self._app.parser,"RELAY","burst",2))
+    self._connect = self.get_value(self._app.parser,"RELAY","connect","0") == "1"
+
+    # a burst beyond max_lag would disconnect every new listener at once
+    if self._burst >= self._max_lag:
+      print("[WARNING] burst %g not below max_lag %g, using %g" %
+            (self._burst,self._max_lag,self._max_lag/2))
+      self._burst = self._max_lag/2
+
+  # --- return active-state of the object   -----------------------------------
+
+  def is_active(self):
+    """ return active-state (overrides SRBase.is_active()) """
+
+    return self._active
+
+  # --- return status of all listeners   --------------------------------------
+
+  def get_status(self):
+    """ return list with status of all listeners """
+
+    return [listener.get_status() for listener in list(self._listeners)]
+
+  # --- GET /relay (API)   ----------------------------------------------------
+
+  async def _get_relay(self,request):
+    """ return status of all listeners """
+
+    await self._app.api.send_json(request.writer,200,self.get_status())
+
+  # --- accept new listeners   ------------------------------------------------
+
+  def _accept(self,server,sel):
+    """ accept connection and wait for the request """
+
+    try:
+      (sock,addr) = server.accept()
+    except OSError:
+      return
+    sock.setblocking(False)
+    sock.setsockopt(socket.SOL_SOCKET,socket.SO_SNDBUF,SEND_BUFFER)
+    listener = Listener(sock,addr)
+    self.debug("new listener %s",listener.addr)
+    self._m_listeners.inc()
+    self._listeners.append(listener)
+    sel.register(sock,selectors.EVENT_READ,listener)
+
+  # --- read request   --------------------------------------------------------
+
+  def _read_request(self,listener,sel):
+    """ read request, attach listener to the stream """
+
+    try:
+      data = listener.sock.recv(MAX_REQUEST)
+    except BlockingIOError:
+      return
+    except OSError:
+      data = b''
+    listener.request += data
+    if not data or len(listener.request) > MAX_REQUEST:
+      self._close(listener,sel)
+      return
+    if not b'\r\n\r\n' in listener.request:
+      return
+
+    sel.unregister(listener.sock)
+    lines = listener.request.decode('latin-1').split('\r\n')
+    try:
+      (method,path,_) = lines[0].split()
+    except ValueError:
+      self._reject(listener,400)
+      return
+    for line in lines[1:]:
+      (name,_,value) = line.partition(':')
+      if name.strip().lower() == "icy-metadata":
+        listener.icy = value.strip() == "1"
+
+    # map path to the channel
+    if method != "GET":
+      self._reject(listener,405)
+      return
+    if path == "/":
+      nr = self._app.radio.get_status()["channel"]
+    else:
+      try:
+        nr = int(path.strip("/"))
+      except ValueError:
+        nr = None
+    channels = self._app.radio.get_channels()
+    if not nr or not 0 < nr <= len(channels):
+      self._reject(listener,404)
+      return
+    (listener.name,url) = channels[nr-1]
+    listener.channel    = nr
+
+    stream = self._app.hub.get_stream(url)
+    if len(self._listeners) > self._max_listeners:
+      self._reject(listener,503)
+      return
+    if (not stream or stream.eof) and not self._connect:
+      self._reject(listener,404)
+      return
+
+    # start a few seconds in the past, so the client can fill its buffer
+    start = None
+    if stream:
+      start = stream.pos - int(self._burst*stream.byte_rate())
+    listener.cursor = self._app.hub.attach(url,start)
+    self.debug("listener %s: channel %d",listener.addr,nr)
+
+  # --- send an error   -------------------------------------------------------
+
+  def _reject(self,listener,status):
+    """ send error-status and close the connection """
+
+    self.debug("listener %s: rejected (%d)",listener.addr,status)
+    try:
+      listener.sock.send(("HTTP/1.0 %d %s\r\nContent-Length: 0\r\n\r\n" %
+                          (status,HTTP_STATUS.get(status,""))).encode('latin-1'))
+    except OSError:
+      pass
+    self._close(listener)
+
+  # --- close connection   ----------------------------------------------------
+
+  def _close(self,listener,sel=None):
+    """ close connection and detach from the stream """
+
+    if sel and listener.sock in sel.get_map():
+      sel.unregister(listener.sock)
+    if listener.cursor:
+      listener.cursor.close()
+    listener.sock.close()
+    if listener in self._listeners:
+      self._listeners.remove(listener)
+    status = listener.get_status()
+    self.debug("listener %s: closed after %.1fs, %d bytes (%.1f kbit/s)",
+               listener.addr,status["seconds"],status["bytes"],status["kbps"])
+
+  # --- send data   -----------------------------------------------------------
+
+  def _send(self,listener,data):
+    """ send without blocking, keep the rest (return False if incomplete) """
+
+    try:
+      sent = listener.sock.send(data)
+    except BlockingIOError:
+      sent = 0
+    listener.bytes += sent
+    self._m_bytes.inc(sent)
+    if sent < len(data):
+      listener.pending = bytes(data[sent:])    # data might be a memoryview
+      return False
+    listener.pending = b''
+    return True
+
+  # --- send response header   ------------------------------------------------
+
+  def _send_header(self,listener):
+    """ send header with stream-information """
+
+    stream = listener.cursor.stream
+    header = ["HTTP/1.0 200 OK",
+              "Content-Type: %s" % (stream.content_type or "audio/mpeg"),
+              "Cache-Control: no-cache",
+              "icy-name: %s" % listener.name,
+              "icy-br: %d" % (stream.bitrate or stream.byte_rate()//125)]
+    if listener.icy:
+      header.append("icy-metaint: %d" % METAINT)
+    self._send(listener,("\r\n".join(header)+"\r\n\r\n").encode('utf-8'))
+
+  # --- ICY-metadata block   --------------------------------------------------
+
+  def _meta(self,listener):
+    """ return metadata-block (only a zero-byte if the title is unchanged) """
+
+    title = listener.next_title
+    if title is None or title == listener.title:
+      return b'\0'
+    listener.title = title
+    text   = ("StreamTitle='%s';" % title).encode('utf-8')[:4080]
+    blocks = (len(text)+15)//16
+    return bytes([blocks]) + text.ljust(16*blocks,b'\0')
+
+  # --- serve a listener   ----------------------------------------------------
+
+  def _serve(self,listener):
+    """ send available data to the listener """
+
+    cursor = listener.cursor
+    stream = cursor.stream
+    if not listener.aligned and not listener.pending:
+      # wait for the upstream-connection
+      if not stream.ready.is_set():
+        return
+      if stream.failed:
+        self._reject(listener,503)
+        return
+      if listener.bytes == 0:
+        listener.next_title = stream.title
+        self._send_header(listener)
+
+    # evict listeners which can't keep up
+    if cursor.pos < stream.first_pos() or (stream.pos-cursor.pos >
+                                           self._max_lag*stream.byte_rate()):
+      self.debug("listener %s: too slow, disconnecting",listener.addr)
+      self._m_evicted.inc()
+      self._close(listener)
+      return
+    if listener.pending and not self._send(listener,listener.pending):
+      return
+
+    while cursor.available() > 0:
+      size = min(SEND_CHUNK,listener.to_meta) if listener.icy else SEND_CHUNK
+      (data,title) = cursor.read(size)
+      if not listener.aligned:
+        # start with a complete frame
+        pos = find_frame(bytes(data))
+        if pos < 0:
+          continue
+        (data,listener.aligned) = (data[pos:],True)
+      if listener.icy:
+        listener.to_meta -= len(data)
+        if not listener.to_meta:
+          data = bytes(data) + self._meta(listener)
+          listener.to_meta = METAINT
+      if title is not None:
+        listener.next_title = title               # starts after the data
+      if not self._send(listener,data):
+        return
+
+    if stream.eof and not cursor.available() and not listener.pending:
+      self._close(listener)
+
+  # --- run server   ----------------------------------------------------------
+
+  def run(self):
+    """ accept listeners and serve data """
+
+    self.debug("starting Relay.run()")
+    if not self._active:
+      self.debug("relay not active: terminating Relay.run()")
+      return
+    if not self._app.hub.enabled:
+      print("[WARNING] relay needs the stream-hub (section [STREAM], hub: 1)")
+      return
+
+    try:
+      server = socket.create_server((self._host,self._port))
+      server.setblocking(False)
+      self.port = server.getsockname()[1]
+    except OSError:
+      print("[ERROR] could not start relay on %s:%d" % (self._host,self._port))
+      if self._debug:
+        traceback.print_exc()
+      return
+    self.debug("relay listening on %s:%d",self._host,self.port)
+
+    sel = selectors.DefaultSelector()
+    sel.register(server,selectors.EVENT_READ)
+    while not self._app.stop_event.is_set():
+      try:
+        events = sel.select(POLL_TIME if self._listeners else IDLE_TIME)
+        for (key,_) in events:
+          if key.fileobj is server:
+            self._accept(server,sel)
+          else:
+            self._read_request(key.data,sel)
+
+        now = time.monotonic()
+        for listener in list(self._listeners):
+          try:
+            if listener.cursor:
+              self._serve(listener)
+            elif now-listener.start > REQUEST_TIMEOUT:
+              self._close(listener,sel)
+          except OSError:
+            self._close(listener,sel)
+      except:
+        if self._debug:
+          traceback.print_exc()
+
+    for listener in list(self._listeners):
+      self._close(listener,sel)
+    sel.close()
+    server.close()
+    self.debug("terminating Relay.run() on stop request")
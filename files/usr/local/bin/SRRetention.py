@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class Retention
+#
+# The class Retention enforces limits (size, age, count) on the recordings
+# of every channel and keeps track of the free space of the record-directory
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import threading, os, time, collections, traceback
+from threading import Thread
+
+from SRBase import Base
+
+CHECK_TIME = 600                       # interval of periodic checks
+POLL_TIME  = 2
+MB         = 1024*1024
+
+class Retention(Thread,Base):
+  """ Retention-manager for recordings """
+
+  def __init__(self,app):
+    """ initialization """
+    super(Retention,self).__init__(name="Retention")
+
+    self._app        = app
+    self._lock       = threading.Lock()
+    self._wake_event = threading.Event()
+    self._protected  = set()                  # recordings currently written
+    self.read_config()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+
+    # section [RECORD]
+    self._max_size  = MB*int(self.get_value(self._app.parser,
+                                            "RECORD","max_size",0))
+    self._max_age   = 86400*int(self.get_value(self._app.parser,
+                                               "RECORD","max_age",0))
+    self._max_count = int(self.get_value(self._app.parser,"RECORD","max_count",0))
+    self._min_free  = MB*int(self.get_value(self._app.parser,
+                                            "RECORD","min_free",50))
+    self._purge     = self.get_value(self._app.parser,
+                                     "RECORD","purge","0") == "1"
+
+  # --- protect a recording from deletion   -----------------------------------
+
+  def protect(self,path):
+    """ protect the recording (e.g. during recording) """
+
+    with self._lock:
+      self._protected.add(path)
+
+  # --- release protection   --------------------------------------------------
+
+  def release(self,path):
+    """ release protection of the recording """
+
+    with self._lock:
+      self._protected.discard(path)
+
+  # --- return available space   ----------------------------------------------
+
+  def get_free(self,reserve=True):
+    """ return free bytes of the record-directory (minus the reserve) """
+
+    st = os.statvfs(self._app.recindex.get_dir())
+    if reserve:
+      return st.f_bavail*st.f_frsize - self._min_free
+    else:
+      return st.f_bavail*st.f_frsize
+
+  # --- check if a recording fits   -------------------------------------------
+
+  def check_space(self,size):
+    """ check if size bytes fit into the record-directory """
+
+    if self.get_free() >= size:
+      return True
+    self.cleanup()
+    return self.get_free() >= size
+
+  # --- wake up retention-thread   --------------------------------------------
+
+  def wake(self):
+    """ trigger a cleanup in the background """
+
+    self._wake_event.set()
+
+  # --- delete a recording   --------------------------------------------------
+
+  def _delete_files(self,paths):
+    """ delete all parts of a recording and remove them from the index """
+
+    for path in paths:
+      self.debug("deleting %s",path)
+      try:
+        os.unlink(path)
+      except FileNotFoundError:
+        pass
+      self._app.recindex.remove(path)
+
+  # --- enforce limits   ------------------------------------------------------
+
+  def cleanup(self):
+    """ delete the oldest recordings exceeding the configured limits """
+
+    with self._lock:
+      protected = set(self._protected)
+    if hasattr(self._app,'player'):
+      protected |= self._app.player.get_active_recordings()
+
+    # collect logical recordings (parts are deleted together) per channel
+    groups = collections.OrderedDict()
+    for path in self._app.recindex.get_recordings():
+      try:
+        st = os.stat(path)
+      except FileNotFoundError:
+        continue
+      key = self._app.recindex.group_key(path)
+      if key in groups:
+        rec = groups[key]
+        rec[0].append(path)
+        rec[1] += st.st_size
+        rec[2]  = max(rec[2],st.st_mtime)
+      else:
+        groups[key] = [[path],st.st_size,st.st_mtime]
+    channels = {}
+    for rec in groups.values():
+      if not protected.isdisjoint(rec[0]):
+        continue
+      channel = self._app.recindex.split_name(rec[0][0])[-1]
+      channels.setdefault(channel,[]).append(rec)
+
+    with self._lock:
+      now   = time.time()
+      count = 0
+      for recs in channels.values():
+        total = sum(size for (_,size,_) in recs)
+        while recs:
+          (paths,size,mtime) = recs[0]
+          if ((self._max_count and len(recs) > self._max_count) or
+              (self._max_size  and total > self._max_size) or
+              (self._max_age   and now - mtime > self._max_age)):
+            self._delete_files(paths)
+            total -= size
+            count += 1
+            del recs[0]
+          else:
+            break
+
+      # purge oldest recordings of all channels if space is low
+      if self._purge and self.get_free() < 0:
+        recs = sorted((rec for recs in channels.values() for rec in recs),
+                      key=lambda rec: rec[2])
+        for (paths,_,_) in recs:
+          if self.get_free() >= 0:
+            break
+          self._delete_files(paths)
+          count += 1
+    self.debug("cleanup finished, %d recordings deleted",count)
+
+  # --- retention-thread   ----------------------------------------------------
+
+  def run(self):
+    """ run cleanup periodically or on request """
+
+    self.debug("starting Retention.run()")
+    try:
+      # lower priority of this thread only (Linux)
+      os.setpriority(os.PRIO_PROCESS,threading.get_native_id(),19)
+    except:
+      self.debug("could not change priority of retention-thread")
+
+    next_check = 0
+    while not self._app.stop_event.is_set():
+      if self._wake_event.is_set() or time.time() >= next_check:
+        self._wake_event.clear()
+        try:
+          self.cleanup()
+        except:
+          if self._debug:
+            traceback.print_exc()
+        next_check = time.time() + CHECK_TIME
+      self._wake_event.wait(POLL_TIME)
+    self.debug("terminating Retention.run() on stop request")
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: helpers for audio-streams
+#
+# The class IcyReader separates ICY-metadata from the audio-data of a
+# http-stream, the functions find_frame() and frame_bitrate() parse MPEG-
+# frames and open_stream() connects to a stream (resolving m3u-playlists)
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import re, urllib.request
+
+# bitrates (kbit/s) for MPEG-1 and MPEG-2/2.5, indexed by layer
+BITRATES = {
+  (1,1): [0,32,64,96,128,160,192,224,256,288,320,352,384,416,448],
+  (1,2): [0,32,48,56,64,80,96,112,128,160,192,224,256,320,384],
+  (1,3): [0,32,40,48,56,64,80,96,112,128,160,192,224,256,320],
+  (2,1): [0,32,48,56,64,80,96,112,128,144,160,176,192,224,256],
+  (2,2): [0,8,16,24,32,40,48,56,64,80,96,112,128,144,160],
+  (2,3): [0,8,16,24,32,40,48,56,64,80,96,112,128,144,160]
+  }
+SAMPLERATES = {3: [44100,48000,32000],           # MPEG-1
+               2: [22050,24000,16000],           # MPEG-2
+               0: [11025,12000,8000]}            # MPEG-2.5
+
+ICY_TITLE = re.compile(rb"StreamTitle='(.*?)';",re.S)
+
+# --- return length of the MPEG-frame at the given position   ----------------
+
+def frame_length(buf,pos):
+  """ return length of the frame with a header at pos (0 if invalid) """
+
+  if pos+4 > len(buf) or buf[pos] != 0xFF or buf[pos+1] & 0xE0 != 0xE0:
+    return 0
+  version  = (buf[pos+1] >> 3) & 0x03
+  layer    = 4 - ((buf[pos+1] >> 1) & 0x03)
+  br_index = buf[pos+2] >> 4
+  sr_index = (buf[pos+2] >> 2) & 0x03
+  padding  = (buf[pos+2] >> 1) & 0x01
+  if version == 1 or layer == 4 or br_index in (0,15) or sr_index == 3:
+    return 0
+
+  bitrate    = 1000*BITRATES[(1 if version == 3 else 2,layer)][br_index]
+  samplerate = SAMPLERATES[version][sr_index]
+  if layer == 1:
+    return (12*bitrate//samplerate + padding)*4
+  elif layer == 3 and version != 3:
+    return 72*bitrate//samplerate + padding
+  else:
+    return 144*bitrate//samplerate + padding
+
+# --- return bitrate of the MPEG-frame at the given position   ---------------
+
+def frame_bitrate(buf,pos):
+  """ return bitrate (kbit/s) of the frame at pos (0 if invalid) """
+
+  if not frame_length(buf,pos):
+    return 0
+  version  = (buf[pos+1] >> 3) & 0x03
+  layer    = 4 - ((buf[pos+1] >> 1) & 0x03)
+  br_index = buf[pos+2] >> 4
+  return BITRATES[(1 if version == 3 else 2,layer)][br_index]
+
+# --- find the next frame boundary   -----------------------------------------
+
+def find_frame(buf,start=0):
+  """ return position of the next (verified) frame header or -1 """
+
+  pos = start
+  end = len(buf) - 4
+  while pos <= end:
+    pos = buf.find(b'\xFF',pos,end+1)
+    if pos < 0:
+      return -1
+    length = frame_length(buf,pos)
+    if length:
+      # verify with the following header (if within the buffer)
+      if pos+length+4 > len(buf) or frame_length(buf,pos+length):
+        return pos
+    pos += 1
+  return -1
+
+# --- connect to a stream   --------------------------------------------------
+
+def open_stream(url,icy=False,timeout=None):
+  """ open the url (resolve m3u-playlists), return (conn,content_type) """
+
+  def request(url):
+    req = urllib.request.Request(url)
+    if icy:
+      req.add_header('Icy-MetaData','1')
+    return req
+
+  conn = urllib.request.urlopen(request(url),timeout=timeout)
+  content_type = conn.getheader('Content-Type')
+  if content_type == 'audio/x-mpegurl' or url.endswith(".m3u"):
+    stream_url = None
+    with conn as playlist:
+      for line in playlist.read().decode('utf-8').splitlines():
+        if not line.startswith('#') and len(line) > 1:
+          stream_url = line
+          break
+    if not stream_url:
+      raise ValueError("could not parse m3u-playlist %s" % url)
+    conn = urllib.request.urlopen(request(stream_url),timeout=timeout)
+    content_type = conn.getheader('Content-Type')
+  return (conn,content_type)
+
+# --- reader for ICY-streams   -----------------------------------------------
+
+class IcyReader(object):
+  """ split a http-response into audio-data and ICY-titles """
+
+  def __init__(self,conn):
+    """ initialization """
+
+    self._conn = conn
+    try:
+      self._metaint = int(conn.getheader('icy-metaint'))
+    except:
+      self._metaint = 0
+    self._left = self._metaint                  # audio bytes until metadata
+
+  # --- read data   -----------------------------------------------------------
+
+  def read(self,size):
+    """ read up to size bytes of audio, return (data,title). Data never
+        spans a metadata-block, title is None if there was no metadata.
+        At the end of the stream, data is empty and title is None """
+
+    if not self._metaint:
+      return (self._conn.read(size),None)
+
+    data = self._conn.read(min(size,self._left))
+    if not data:
+      return (data,None)
+    self._left -= len(data)
+    title = None
+    if not self._left:
+      # read metadata-block
+      self._left = self._metaint
+      length = self._conn.read(1)
+      if length and length[0]:
+        meta  = self._conn.read(16*length[0])
+        match = ICY_TITLE.search(meta)
+        if match:
+          title = match.group(1).decode('utf-8','replace')
+    return (data,title)
+
+  # --- close connection   ----------------------------------------------------
+
+  def close(self):
+    """ close the connection """
+    self._conn.close()
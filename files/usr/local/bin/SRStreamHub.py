@@ -0,0 +1,746 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class StreamHub
+#
+# The class StreamHub owns a single upstream connection per channel. The
+# audio-data is kept in a ring-buffer and fanned out to any number of
+# consumers (player, recorders), every consumer reads with its own cursor.
+# ICY-titles are parsed by the hub and attached to their byte-position.
+# The ring-buffer doubles as timeshift-buffer (pause live radio, record the
+# last minutes), it is kept in RAM or in a preallocated file (mmap).
+# Channels with mirrors connect to the fastest one (racing connections) and
+# fail over to the next one on stalls or errors, the health of every
+# mirror is remembered. Channels with quality-variants start with the best
+# variant the measured bandwidth allows and step down on repeated underruns.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import threading, os, time, collections, tempfile, mmap, queue, traceback
+from threading import Thread
+
+from SRBase   import Base
+from SRStream import IcyReader, open_stream, find_frame
+
+KB         = 1024
+READ_CHUNK = 4096                      # bytes per upstream read
+MAX_READ   = 65536                     # bytes per read of a consumer
+POLL_TIME  = 1
+MAX_TITLES = 32                        # titles kept per stream
+STABLE_TIME = 60                       # mirror is healthy again after x s
+BITRATE    = 128                       # assumed bitrate (kbit/s)
+BURST_BYTES = 32768                    # measure bandwidth during the burst
+UNDERRUN_RATIO = 0.9                   # underrun: window below x*bitrate
+
+# --- read-cursor of a consumer   ---------------------------------------------
+
+class Cursor(object):
+  """ read-position of a consumer within the ring-buffer of a stream """
+
+  def __init__(self,stream,pos,on_title):
+    """ initialization """
+
+    self.stream    = stream
+    self.pos       = pos                 # absolute position (bytes)
+    self.on_title  = on_title            # callback for new titles
+    self.closed    = False
+    self._tpos     = pos                 # position of last reported title
+
+  # --- read data   -----------------------------------------------------------
+
+  def read(self,size):
+    """ read up to size bytes, return (data,title) like IcyReader.read().
+        Data is a memoryview into the ring-buffer (no copy, at most
+        MAX_READ bytes) and must be consumed before the next read, data
+        close to the oldest position is copied. Data is empty at the end
+        of the stream or after close() """
+
+    return self.stream.read(self,size)
+
+  # --- available data   ------------------------------------------------------
+
+  def available(self):
+    """ return number of bytes readable without blocking """
+
+    return self.stream.pos - self.pos
+
+  # --- close cursor   --------------------------------------------------------
+
+  def close(self):
+    """ detach from the stream """
+
+    if not self.closed:
+      self.closed = True
+      self.stream.detach(self)
+
+# --- reader with failover   -------------------------------------------------
+
+class MirrorReader(object):
+  """ read a channel from its best mirror, fail over on stalls and errors,
+      switch to a lower quality on repeated underruns and back if the
+      bandwidth allows """
+
+  def __init__(self,hub,url,icy=False,active=None,best=False):
+    """ initialization (connects, raises OSError if no mirror answers) """
+
+    self._hub     = hub
+    self._debug   = hub._debug
+    self.url      = url
+    self._icy     = icy
+    self._active  = active or (lambda: True)    # failover only while active
+    self._conn    = None
+    self._align   = False
+    self._empty   = 0                           # connections without data
+    self._stable  = False
+    self._best    = best                        # never step down
+    self._switch  = None                        # pending variant-switch
+    self._deficits = 0                          # windows with underruns
+    self.bitrate  = None
+    self.variant  = hub.select_variant(url,best)
+    self._connect(None)
+
+  # --- connect to the best mirror   ------------------------------------------
+
+  def _connect(self,exclude):
+    """ connect, prefer other mirrors than exclude """
+
+    (conn,content_type,self.mirror) = self._hub.connect(self.url,self._icy,
+                                                        exclude,self.variant)
+    self._conn        = conn
+    self._reader      = IcyReader(conn)
+    self._since       = time.monotonic()
+    self._stable      = False
+    self._window      = None                    # (start,bytes) of the meter
+    self._burst       = True
+    self.content_type = content_type
+    try:
+      self.bitrate = int(conn.getheader('icy-br').split(',')[0])
+    except:
+      self.bitrate = self.variant
+
+  # --- measure the throughput   ----------------------------------------------
+
+  def _measure(self,size):
+    """ measure the bandwidth during the initial burst and the sustained
+        rate every rate_window seconds, step down on repeated underruns,
+        step up if the bandwidth allows """
+
+    now = time.monotonic()
+    if self._window is None:
+      self._window = (now,0)                    # first data after connecting
+      return
+    (start,count) = (self._window[0],self._window[1]+size)
+    self._window  = (start,count)
+    kbps = 8*count/max(now-start,0.001)/1000
+    if self._burst:
+      if count >= BURST_BYTES:
+        # only bursts faster than the stream tell something about the network
+        if self.bitrate and kbps > self._hub._headroom*self.bitrate:
+          self._hub.report_bandwidth(kbps)
+        (self._burst,self._window) = (False,(now,0))
+      return
+    if now-start < self._hub._rate_window or not self.bitrate:
+      return
+
+    self._window = (now,0)
+    if kbps >= UNDERRUN_RATIO*self.bitrate:
+      self._deficits = 0
+      if not self._best:
+        variant = self._hub.step_up(self.url,self.variant)
+        if variant != self.variant:
+          self._switch = variant
+      return
+    self._hub.debug("underrun %s: %.1f kbit/s",self.mirror,kbps)
+    self._hub._m_underruns.inc()
+    self._deficits += 1
+    if self._deficits >= self._hub._underruns and not self._best:
+      self._deficits = 0
+      variant = self._hub.step_down(self.url,self.variant,kbps)
+      if variant != self.variant:
+        self._switch = variant
+
+  # --- read data   -----------------------------------------------------------
+
+  def read(self,size):
+    """ read like IcyReader.read(), fail over instead of returning EOF """
+
+    while True:
+      if self._switch is not None:
+        # other quality, the stream continues with a complete frame
+        if self._switch < self.variant:
+          print("[WARNING] %s: underruns, switching to %d kbit/s" %
+                (self.url,self._switch))
+        else:
+          self._hub.debug("%s: switching to %d kbit/s",self.url,self._switch)
+        (self.variant,self._switch) = (self._switch,None)
+        self._conn.close()
+        try:
+          self._connect(None)
+        except OSError:
+          return (b'',None)
+        self._hub._m_switches.inc()
+        self._align = self.content_type == "audio/mpeg"
+      try:
+        (data,title) = self._reader.read(size)
+      except Exception as ex:
+        self._hub.debug("reading %s failed: %r",self.mirror,ex)
+        (data,title) = (b'',None)
+
+      if data and self._align:
+        # continue with a complete frame after a failover
+        pos = find_frame(bytes(data))
+        if pos < 0:
+          continue
+        (data,self._align) = (data[pos:],False)
+      if data:
+        self._empty = 0
+        self._measure(len(data))
+        if not self._stable and time.monotonic()-self._since > STABLE_TIME:
+          self._stable = True
+          self._hub.report_stable(self.mirror)
+        return (data,title)
+
+      # stall or end of stream
+      if not self._active():
+        return (b'',None)
+      self._hub.report(self.mirror,False)
+      self._empty += 1
+      if self._empty > len(self._hub.get_mirrors(self.url,self.variant)):
+        return (b'',None)                       # no mirror delivers data
+      print("[WARNING] %s failed, switching mirror" % self.mirror)
+      self._conn.close()
+      try:
+        self._connect(self.mirror)
+      except OSError:
+        return (b'',None)
+      self._hub._m_failovers.inc()
+      self._align = self.content_type == "audio/mpeg"
+
+  # --- close connection   ----------------------------------------------------
+
+  def close(self):
+    """ close the connection """
+    self._conn.close()
+
+# --- a single upstream connection   ------------------------------------------
+
+class Stream(Thread,Base):
+  """ upstream connection with a ring-buffer """
+
+  def __init__(self,hub,url,best=False):
+    """ initialization """
+    super(Stream,self).__init__(name="Stream",daemon=True)
+
+    self._hub    = hub
+    self._debug  = hub._debug
+    self.url     = url
+    self.best    = best                  # always the best quality-variant
+    self._ring   = None                  # allocated after connecting
+    self._size   = 0
+    self._cond   = threading.Condition()
+    self._titles = collections.deque(maxlen=MAX_TITLES)   # (pos,title)
+    self.cursors = []
+    self.pos     = 0                     # total bytes received
+    self.title   = None                  # current title
+    self.content_type = None
+    self.bitrate      = None             # kbit/s (from icy-br)
+    self.mirror       = None             # url of the current connection
+    self.variant      = None             # kbit/s of the quality-variant
+    self.ready   = threading.Event()     # connected (or failed)
+    self.failed  = False
+    self.eof     = False
+    self._closing = False
+
+  # --- oldest position still available   -------------------------------------
+
+  def first_pos(self):
+    """ return oldest position within the ring-buffer (the next writes
+        might overwrite the first MAX_READ bytes while a consumer still
+        uses them, so they are not available) """
+    if not self._size:
+      return 0                           # not connected yet
+    return max(0,self.pos-self._size+MAX_READ)
+
+  # --- bytes per second   ---------------------------------------------------
+
+  def byte_rate(self):
+    """ return bytes/s of the stream (from icy-br, else assumed) """
+    return 125*(self.bitrate or BITRATE)
+
+  # --- add cursor   ----------------------------------------------------------
+
+  def attach(self,start,on_title):
+    """ create cursor at start (default: live position), return
+        (cursor,current title) """
+
+    with self._cond:
+      if start is None:
+        start = self.pos
+      cursor = Cursor(self,max(self.first_pos(),min(start,self.pos)),on_title)
+      self.cursors.append(cursor)
+      return (cursor,self.title)
+
+  # --- remove cursor   -------------------------------------------------------
+
+  def detach(self,cursor):
+    """ remove cursor, stop stream after the last cursor """
+
+    with self._hub._lock:
+      with self._cond:
+        if cursor in self.cursors:
+          self.cursors.remove(cursor)
+        self._cond.notify_all()
+        if self.cursors:
+          return
+        self._closing = True
+      self._hub._remove(self)
+
+  # --- read data for a cursor   ----------------------------------------------
+
+  def read(self,cursor,size):
+    """ return (data,title) for the cursor """
+
+    with self._cond:
+      while (cursor.pos >= self.pos and not self.eof and not cursor.closed and
+             not self._hub._app.stop_event.is_set()):
+        self._cond.wait(POLL_TIME)
+      if cursor.closed or cursor.pos >= self.pos:
+        return (b'',None)
+
+      # the cursor fell behind the ring-buffer: skip lost data
+      if cursor.pos < self.first_pos():
+        self.debug("cursor overrun: lost %d bytes",self.first_pos()-cursor.pos)
+        self._hub._m_overruns.inc()
+        cursor.pos = self.first_pos()
+
+      # data never spans the end of the ring or a title (the title is
+      # returned with the data preceding it)
+      offset = cursor.pos % self._size
+      end    = min(self.pos,cursor.pos+min(size,MAX_READ),
+                   cursor.pos+self._size-offset)
+      title  = None
+      for (tpos,ttitle) in self._titles:
+        if tpos > cursor._tpos and cursor.pos < tpos <= end:
+          (end,title,cursor._tpos) = (tpos,ttitle,tpos)
+          break
+      data = self._view[offset:offset+end-cursor.pos]
+      if cursor.pos < self.first_pos()+MAX_READ:
+        data = bytes(data)        # the writer will reach it soon: copy
+      cursor.pos = end
+      return (data,title)
+
+  # --- write data to the ring-buffer   ---------------------------------------
+
+  def _write(self,data):
+    """ append data to the ring-buffer """
+
+    size   = self._size
+    offset = self.pos % size
+    first  = min(len(data),size-offset)
+    self._ring[offset:offset+first] = data[:first]
+    if first < len(data):
+      self._ring[0:len(data)-first] = data[first:]
+    with self._cond:
+      self.pos += len(data)
+      self._cond.notify_all()
+
+  # --- new title   -----------------------------------------------------------
+
+  def _new_title(self,title):
+    """ register title at the current position and notify consumers """
+
+    self.debug("new title: %s",title)
+    with self._cond:
+      self._titles.append((self.pos,title))
+      self.title = title
+      callbacks  = [c.on_title for c in self.cursors if c.on_title]
+    for callback in callbacks:
+      callback(title)
+
+  # --- read upstream   -------------------------------------------------------
+
+  def run(self):
+    """ read upstream into the ring-buffer """
+
+    self.debug("connecting to %s",self.url)
+    try:
+      reader = MirrorReader(self._hub,self.url,True,self._is_open,self.best)
+    except:
+      self.debug("could not connect to %s",self.url)
+      if self._debug:
+        traceback.print_exc()
+      self.failed = True
+      self.ready.set()
+      self._set_eof()
+      return
+
+    (self.content_type,self.bitrate) = (reader.content_type,reader.bitrate)
+    self.variant = reader.variant
+    try:
+      self._ring = self._hub.alloc_ring(self.byte_rate())
+    except:
+      print("[ERROR] could not allocate ring-buffer for %s" % self.url)
+      if self._debug:
+        traceback.print_exc()
+      reader.close()
+      self.failed = True
+    if self.failed:
+      self.ready.set()
+      self._set_eof()
+      return
+    self._view = memoryview(self._ring)
+    self._size = len(self._ring)
+    self.ready.set()
+    try:
+      while self._is_open():
+        (data,title) = reader.read(READ_CHUNK)
+        if not data:
+          self.debug("end of stream %s",self.url)
+          break
+        (self.mirror,self.variant) = (reader.mirror,reader.variant)
+        self.bitrate = reader.bitrate or self.bitrate
+        self._write(data)
+        self._hub._m_bytes.inc(len(data))
+        if title is not None and title != self.title:
+          self._new_title(title)
+    except:
+      if self._debug:
+        traceback.print_exc()
+    reader.close()
+    self._set_eof()
+    self.debug("closed connection to %s",self.url)
+
+  # --- check state   ---------------------------------------------------------
+
+  def _is_open(self):
+    """ return True until the stream is closed or the program stops """
+    return not self._closing and not self._hub._app.stop_event.is_set()
+
+  # --- mark end of stream   --------------------------------------------------
+
+  def _set_eof(self):
+    """ mark end of stream and wake all consumers """
+
+    with self._cond:
+      self.eof = True
+      self._cond.notify_all()
+    self._hub.remove(self)
+
+# --- hub of all streams   ----------------------------------------------------
+
+class StreamHub(Base):
+  """ share upstream connections between player and recorders """
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app     = app
+    self._lock    = threading.Lock()
+    self._streams = {}                   # (url,best) -> Stream
+    self._health  = {}                   # mirror -> health-record
+    self._caps    = {}                   # url -> (kbps,time) after underruns
+    self.bandwidth = None                # estimated bandwidth (kbit/s)
+    self._m_bytes    = app.metrics.counter("simple_radio_hub_bytes_total",
+                                           "bytes read from upstream")
+    self._m_overruns = app.metrics.counter("simple_radio_hub_overruns_total",
+                                           "consumers which lost data")
+    self._m_failovers = app.metrics.counter("simple_radio_hub_failovers_total",
+                                            "switches to another mirror")
+    self._m_underruns = app.metrics.counter("simple_radio_hub_underruns_total",
+                                            "streams below their bitrate")
+    self._m_switches  = app.metrics.counter(
+      "simple_radio_hub_quality_switches_total","switches of the quality")
+    self.read_config()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+
+    # section [STREAM]
+    self.enabled    = self.get_value(self._app.parser,"STREAM","hub","1") == "1"
+    self._ring_size = KB*int(self.get_value(self._app.parser,
+                                            "STREAM","ring_size",1024))
+    self.timeshift  = int(self.get_value(self._app.parser,
+                                         "STREAM","timeshift",0))
+    self._ring_dir  = self.get_value(self._app.parser,"STREAM","ring_dir",None)
+    self._timeout   = float(self.get_value(self._app.parser,
+                                           "STREAM","timeout",10))
+    self._race      = max(1,int(self.get_value(self._app.parser,
+                                               "STREAM","race",2)))
+    self._headroom  = float(self.get_value(self._app.parser,
+                                           "STREAM","headroom",1.2))
+    self._rate_window = float(self.get_value(self._app.parser,
+                                             "STREAM","rate_window",10))
+    self._underruns = max(1,int(self.get_value(self._app.parser,
+                                               "STREAM","underruns",3)))
+    self._cap_time  = float(self.get_value(self._app.parser,
+                                           "STREAM","cap_time",600))
+
+  # --- return persistent state of this class   -------------------------------
+
+  def get_persistent_state(self):
+    """ return persistent state (overrides SRBase.get_pesistent_state()) """
+
+    with self._lock:
+      return {'mirrors': dict(self._health)}
+
+  # --- restore persistent state of this class   ------------------------------
+
+  def set_persistent_state(self,state_map):
+    """ restore persistent state (overrides SRBase.set_pesistent_state()) """
+
+    self.debug("StreamHub: restoring persistent state")
+    if 'mirrors' in state_map:
+      self._health = state_map['mirrors']
+
+  # --- return quality-variants of a channel   --------------------------------
+
+  def get_variants(self,url):
+    """ return list of (kbps,mirrors) of the channel, best quality first """
+
+    radio = getattr(self._app,'radio',None)
+    return radio.get_variants(url) if radio else [(None,[url])]
+
+  # --- select a quality-variant   --------------------------------------------
+
+  def select_variant(self,url,best=False):
+    """ return kbps of the best variant the bandwidth (and the underruns
+        of the channel) allow (best: of the best variant) """
+
+    variants = self.get_variants(url)
+    if best or len(variants) == 1:
+      return variants[0][0]
+    limit = self._get_limit(url)
+    for (kbps,_) in variants:
+      if kbps is None or kbps <= limit:
+        return kbps
+    return variants[-1][0]
+
+  def _get_limit(self,url):
+    """ return the maximal bitrate of the channel: the bandwidth-estimate
+        and the cap after underruns, which expires after cap_time seconds
+        without underruns """
+
+    with self._lock:
+      cap = self._caps.get(url)
+      if cap and time.monotonic()-cap[1] > self._cap_time:
+        self.debug("%s: no underruns, lifting cap of %d kbit/s",url,cap[0])
+        del self._caps[url]
+        (cap,self.bandwidth) = (None,None)        # measure again
+      limit = cap[0] if cap else float('inf')
+      if self.bandwidth:
+        limit = min(limit,self.bandwidth/self._headroom)
+    return limit
+
+  # --- update the bandwidth-estimate   ---------------------------------------
+
+  def report_bandwidth(self,kbps):
+    """ record the throughput of an initial burst """
+
+    with self._lock:
+      if self.bandwidth is not None:
+        kbps = 0.7*self.bandwidth + 0.3*kbps
+      self.bandwidth = round(kbps,1)
+    self.debug("bandwidth: %.1f kbit/s",self.bandwidth)
+
+  def step_down(self,url,kbps,rate):
+    """ record repeated underruns of the variant kbps (sustained rate),
+        return the variant to use """
+
+    lower = [v for (v,_) in self.get_variants(url)
+             if v is not None and (kbps is None or v < kbps)]
+    with self._lock:
+      self.bandwidth = round(rate,1)
+      if lower:
+        self._caps[url] = (lower[0],time.monotonic())
+      elif url in self._caps:
+        self._caps[url] = (self._caps[url][0],time.monotonic())
+    return self.select_variant(url)
+
+  def step_up(self,url,kbps):
+    """ return the next better variant than kbps if the bandwidth (and the
+        underruns of the channel) allow, else kbps """
+
+    higher = [v for (v,_) in self.get_variants(url)
+              if v is not None and kbps is not None and v > kbps]
+    if higher and higher[-1] <= self._get_limit(url):
+      return higher[-1]
+    return kbps
+
+  # --- return mirrors of a channel   -----------------------------------------
+
+  def get_mirrors(self,url,kbps=None):
+    """ return all urls of the variant kbps (default: the best variant)
+        of the channel, the healthiest first """
+
+    variants = self.get_variants(url)
+    mirrors  = list(dict(variants).get(kbps,variants[0][1]))
+    with self._lock:
+      health = {m: self._health.get(m,{}) for m in mirrors}
+    # unknown mirrors are tried early, stable sort keeps the channel-order
+    return sorted(mirrors,key=lambda m: (health[m].get("errors",0),
+                                         health[m].get("latency") or 0))
+
+  # --- update health of a mirror   -------------------------------------------
+
+  def _get_health(self,mirror):
+    """ return health-record of the mirror (caller holds the lock) """
+
+    return self._health.setdefault(mirror,{"ok": 0, "failed": 0,
+                                           "errors": 0, "latency": None})
+
+  def report(self,mirror,ok,latency=None):
+    """ record connect (with latency), failed connect or failed stream """
+
+    with self._lock:
+      health = self._get_health(mirror)
+      if not ok:
+        health["failed"] += 1
+        health["errors"] += 1                   # errors since last stable
+        return
+      health["ok"] += 1
+      if latency is not None:
+        if health["latency"] is not None:
+          latency = 0.7*health["latency"] + 0.3*latency
+        health["latency"] = round(latency,3)
+
+  def report_stable(self,mirror):
+    """ record a stable connection (forget the errors) """
+
+    with self._lock:
+      self._get_health(mirror)["errors"] = 0
+
+  # --- connect to the best mirror   ------------------------------------------
+
+  def connect(self,url,icy=False,exclude=None,kbps=None):
+    """ race connections to the healthiest mirrors of the variant kbps
+        (exclude: last choice), return (conn,content_type,mirror) of the
+        fastest """
+
+    mirrors = self.get_mirrors(url,kbps)
+    batches = []
+    if exclude in mirrors and len(mirrors) > 1:
+      mirrors.remove(exclude)
+      batches = [[exclude]]                     # only as last resort
+    batches = [mirrors[i:i+self._race]
+               for i in range(0,len(mirrors),self._race)] + batches
+    for batch in batches:
+      result = self._race_mirrors(batch,icy)
+      if result:
+        return result
+    raise ConnectionError("could not connect to any mirror of %s" % url)
+
+  def _race_mirrors(self,mirrors,icy):
+    """ connect to all mirrors in parallel, return first connection """
+
+    results = queue.Queue()
+    def open_mirror(mirror):
+      start = time.monotonic()
+      try:
+        (conn,content_type) = open_stream(mirror,icy,self._timeout)
+        results.put((mirror,conn,content_type,time.monotonic()-start))
+      except Exception as ex:
+        self.debug("could not connect to %s: %r",mirror,ex)
+        results.put((mirror,None,None,None))
+
+    if len(mirrors) == 1:
+      open_mirror(mirrors[0])
+    else:
+      for mirror in mirrors:
+        threading.Thread(target=open_mirror,args=(mirror,),
+                         name="MirrorRace",daemon=True).start()
+    for pending in range(len(mirrors),0,-1):
+      (mirror,conn,content_type,latency) = results.get()
+      self.report(mirror,conn is not None,latency)
+      if conn:
+        self.debug("connected to %s (%.3fs)",mirror,latency)
+        if pending > 1:
+          threading.Thread(target=self._close_losers,args=(results,pending-1),
+                           name="MirrorRace",daemon=True).start()
+        return (conn,content_type,mirror)
+    return None
+
+  def _close_losers(self,results,count):
+    """ close the connections which lost the race """
+
+    for _ in range(count):
+      (mirror,conn,_,latency) = results.get()
+      self.report(mirror,conn is not None,latency)
+      if conn:
+        conn.close()
+
+  # --- allocate a ring-buffer   ----------------------------------------------
+
+  def alloc_ring(self,byte_rate):
+    """ return buffer for ring_size kB or timeshift minutes of the stream """
+
+    size = max(self._ring_size,60*self.timeshift*byte_rate,4*MAX_READ)
+    size = (size+mmap.PAGESIZE-1)//mmap.PAGESIZE*mmap.PAGESIZE
+    if not self._ring_dir:
+      return bytearray(size)
+
+    # preallocated file, removed at once (space is freed with the mapping)
+    (fd,path) = tempfile.mkstemp(prefix="simple-radio-",dir=self._ring_dir)
+    try:
+      os.unlink(path)
+      os.posix_fallocate(fd,0,size)
+      return mmap.mmap(fd,size)
+    finally:
+      os.close(fd)
+
+  # --- return running stream   -----------------------------------------------
+
+  def get_stream(self,url,best=False):
+    """ return stream of the url (None if not connected) """
+
+    with self._lock:
+      return self._streams.get(self._key(url,best))
+
+  def _key(self,url,best):
+    """ return key of the stream (channels without variants share it) """
+
+    return (url,best and len(self.get_variants(url)) > 1)
+
+  # --- attach a consumer   ---------------------------------------------------
+
+  def attach(self,url,start=None,on_title=None,best=False):
+    """ return cursor for the url (connect if necessary), best: always
+        read the best quality-variant """
+
+    key = self._key(url,best)
+    with self._lock:
+      stream = self._streams.get(key)
+      if not stream or stream.eof or stream._closing:
+        stream = Stream(self,url,key[1])
+        self._streams[key] = stream
+        stream.start()
+      (cursor,title) = stream.attach(start,on_title)
+
+    # the callback might use the hub, so call it without holding the lock
+    if on_title and title is not None:
+      on_title(title)
+    return cursor
+
+  # --- remove a stream   -----------------------------------------------------
+
+  def remove(self,stream):
+    """ remove stream (called by the stream) """
+
+    with self._lock:
+      self._remove(stream)
+
+  def _remove(self,stream):
+    """ remove stream (caller holds the lock) """
+
+    key = (stream.url,stream.best)
+    if self._streams.get(key) is stream:
+      del self._streams[key]
@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of class Transcoder
+#
+# The class Transcoder re-encodes finished recordings in the background
+# (e.g. with a lower bitrate) using a small pool of niced processes
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import os, signal, subprocess, shlex, queue, traceback
+from threading import Thread
+
+from SRBase     import Base
+from SRRecIndex import RecIndex
+
+POLL_TIME = 2
+
+class Transcoder(Base):
+  """ Transcoder for recordings """
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app     = app
+    self._workers = []
+    self.read_config()
+    self._jobs    = queue.Queue(maxsize=self._queue_size)
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+
+    # section [RECORD]
+    self._active     = self.get_value(self._app.parser,
+                                      "RECORD","transcode","0") == "1"
+    self._cmd        = self.get_value(self._app.parser,"RECORD","transcode_cmd",
+      "ffmpeg -nostdin -v quiet -i {src} -codec:a libmp3lame -b:a 64k -f mp3 {dst}")
+    self._ext        = self.get_value(self._app.parser,
+                                      "RECORD","transcode_ext",".mp3")
+    self._jobs_max   = int(self.get_value(self._app.parser,
+                                          "RECORD","transcode_jobs",1))
+    self._queue_size = int(self.get_value(self._app.parser,
+                                          "RECORD","transcode_queue",8))
+    self._max_load   = float(self.get_value(self._app.parser,
+                                            "RECORD","transcode_load",1.0))
+
+    # transcoded files must stay visible to the index of recordings
+    if self._active and self._ext not in RecIndex.EXTENSIONS:
+      print("[ERROR] transcode_ext %s not supported (use one of %s)" %
+            (self._ext,", ".join(RecIndex.EXTENSIONS)))
+      self._active = False
+
+  # --- return active-state of the object   -----------------------------------
+
+  def is_active(self):
+    """ return active-state (overrides SRBase.is_active()) """
+
+    return self._active
+
+  # --- start worker threads   ------------------------------------------------
+
+  def start(self):
+    """ start worker threads """
+
+    if not self._active:
+      return
+    for i in range(self._jobs_max):
+      worker = Thread(target=self._work,name="Transcoder-%d" % i)
+      self._workers.append(worker)
+      worker.start()
+
+  # --- submit a recording   --------------------------------------------------
+
+  def submit(self,path):
+    """ queue recording for transcoding (never blocks) """
+
+    if not self._active:
+      return
+    try:
+      self._jobs.put_nowait(path)
+      self.debug("queued %s for transcoding",path)
+    except queue.Full:
+      self.debug("transcoder queue full, not transcoding %s",path)
+
+  # --- wait for pending jobs   -----------------------------------------------
+
+  def wait(self):
+    """ wait until all queued recordings are processed """
+
+    if self._active:
+      self._jobs.join()
+
+  # --- check if transcoding should pause   -----------------------------------
+
+  def _is_busy(self):
+    """ check for live playback with high system load """
+
+    if not hasattr(self._app,'mpg123') or not self._app.mpg123.is_active():
+      return False
+    return os.getloadavg()[0] > self._max_load
+
+  # --- check if the recording is played   ------------------------------------
+
+  def _is_playing(self,path):
+    """ check if the player currently plays or queues the recording """
+
+    if not hasattr(self._app,'player'):
+      return False
+    return path in self._app.player.get_active_recordings()
+
+  # --- wait until the recording is no longer played   ------------------------
+
+  def _wait_unused(self,path):
+    """ wait while the recording is played, return False on stop request """
+
+    if self._is_playing(path):
+      self.debug("deferring transcoding of %s (recording is played)",path)
+    while self._is_playing(path):
+      if self._app.stop_event.wait(POLL_TIME):
+        return False
+    return True
+
+  # --- worker thread   -------------------------------------------------------
+
+  def _work(self):
+    """ process queued recordings """
+
+    self.debug("starting transcoder worker")
+    while not self._app.stop_event.is_set():
+      try:
+        path = self._jobs.get(timeout=POLL_TIME)
+      except queue.Empty:
+        continue
+      try:
+        # don't start while live playback competes for the cpu
+        while self._is_busy():
+          if self._app.stop_event.wait(POLL_TIME):
+            break
+        # don't touch recordings the player uses
+        if not self._app.stop_event.is_set() and self._wait_unused(path):
+          self._transcode(path)
+      except:
+        if self._debug:
+          traceback.print_exc()
+      finally:
+        self._jobs.task_done()
+    self.debug("terminating transcoder worker on stop request")
+
+  # --- transcode a single recording   ----------------------------------------
+
+  def _transcode(self,path):
+    """ transcode recording and replace the original """
+
+    dst = os.path.splitext(path)[0] + self._ext
+    tmp = dst + ".part"
+    args = ["nice","-n","19"]
+    args += [arg.format(src=path,dst=tmp) for arg in shlex.split(self._cmd)]
+
+    self.debug("transcoding with args %r",args)
+    self._app.retention.protect(path)
+    try:
+      process = subprocess.Popen(args,stdin=subprocess.DEVNULL,
+                                 stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL)
+      paused = False
+      while True:
+        try:
+          process.wait(POLL_TIME)
+          break
+        except subprocess.TimeoutExpired:
+          pass
+        if self._app.stop_event.is_set():
+          process.terminate()
+          if paused:
+            process.send_signal(signal.SIGCONT)
+          process.wait()
+          break
+        busy = self._is_busy()
+        if busy and not paused:
+          self.debug("pausing transcoder (system busy)")
+          process.send_signal(signal.SIGSTOP)
+          paused = True
+        elif paused and not busy:
+          self.debug("continuing transcoder")
+          process.send_signal(signal.SIGCONT)
+          paused = False
+
+      if process.returncode != 0:
+        self.debug("transcoding of %s failed",path)
+        if os.path.exists(tmp):
+          os.unlink(tmp)
+        return
+
+      # playback might have started in the meantime
+      if not self._wait_unused(path):
+        os.unlink(tmp)
+        return
+
+      # atomically replace original
+      os.replace(tmp,dst)
+      if dst != path:
+        self._app.recindex.add(dst)
+        os.unlink(path)
+        self._app.recindex.remove(path)
+      self.debug("finished transcoding %s",dst)
+    finally:
+      self._app.retention.release(path)
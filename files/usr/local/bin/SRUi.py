@@ -0,0 +1,443 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio: implementation of the UI-process
+#
+# With ui_process: 1 the display, keypad and lirc run in a process of their
+# own, audio and recording stay in the engine. The engine publishes its
+# state (titles, content, positions, buffer-levels) to a shared-memory
+# status-block guarded by a sequence-counter, so it never waits for the
+# UI. Alternative title-lines are published together, the UI toggles
+# between them at its own refresh-rate. Keys are sent from the UI to the
+# engine through a pipe. Within the UI-process, changes of the state are
+# published to a bus of its own.
+#
+# The class Ui stands in for display and keypad within the engine, the
+# class UiApp is the application of the UI-process.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import os, time, struct, signal, threading, configparser, traceback
+import multiprocessing
+from multiprocessing import shared_memory
+from threading import Thread
+
+from SRBase   import Base, setup_logging
+from SRBus    import ChannelEvent, PlaybackEvent, RecordEvent, VolumeEvent
+from SRKeypad import Keypad
+
+PUBLISH_TIME = 0.25                    # engine: publish the state
+POLL_TIME    = 1                       # engine: poll the command-pipe
+UI_POLL_TIME = 0.05                    # UI: check the state for changes
+RESTART_TIME = 5                       # minimal lifetime before a restart
+TEXT_SIZE    = 2048                    # content-lines (utf-8)
+
+# --- shared-memory status-block   --------------------------------------------
+
+class StatusBlock(object):
+  """ state of the engine in shared memory (single writer: the engine) """
+
+  SEQ    = struct.Struct("<I")         # odd while the engine writes
+  FIELDS = ("stop","mode","title_seq","clear_seq","wipe_seq","content_seq",
+            "channel","volume","recording","rec_elapsed","rec_duration",
+            "buffered","timeshift","pipe","left","right","left2","right2",
+            "content")
+  STATE  = struct.Struct("<BBIIIIhhBffffI64s32s64s32s%ds" % TEXT_SIZE)
+  TEXTS  = {"left","right","left2","right2","content"}
+  ACK    = struct.Struct("<I")         # written by the UI: content fetched
+  SIZE   = SEQ.size + STATE.size + ACK.size
+
+  def __init__(self,name=None):
+    """ create (engine) or attach to (UI) the block """
+
+    if name:
+      self._shm = shared_memory.SharedMemory(name)
+    else:
+      self._shm = shared_memory.SharedMemory(create=True,size=StatusBlock.SIZE)
+    self.name = self._shm.name
+
+  # --- write state   ---------------------------------------------------------
+
+  def write(self,state):
+    """ write complete state (engine only) """
+
+    values = [state[f].encode('utf-8') if f in StatusBlock.TEXTS else state[f]
+              for f in StatusBlock.FIELDS]
+    buf = self._shm.buf
+    seq = StatusBlock.SEQ.unpack_from(buf)[0]
+    StatusBlock.SEQ.pack_into(buf,0,seq+1)
+    StatusBlock.STATE.pack_into(buf,StatusBlock.SEQ.size,*values)
+    StatusBlock.SEQ.pack_into(buf,0,seq+2)
+
+  # --- read state   ----------------------------------------------------------
+
+  def read(self):
+    """ return consistent copy of the state (retry while the engine writes) """
+
+    buf = self._shm.buf
+    while True:
+      seq = StatusBlock.SEQ.unpack_from(buf)[0]
+      if seq & 1:
+        time.sleep(0)
+        continue
+      values = StatusBlock.STATE.unpack_from(buf,StatusBlock.SEQ.size)
+      if StatusBlock.SEQ.unpack_from(buf)[0] == seq:
+        break
+    state = dict(zip(StatusBlock.FIELDS,values))
+    for f in StatusBlock.TEXTS:
+      state[f] = state[f].rstrip(b'\0').decode('utf-8','ignore')
+    return state
+
+  # --- acknowledge content   -------------------------------------------------
+
+  def get_ack(self):
+    """ return content_seq last fetched by the UI """
+    return StatusBlock.ACK.unpack_from(self._shm.buf,
+                                       StatusBlock.SIZE-StatusBlock.ACK.size)[0]
+
+  def set_ack(self,seq):
+    """ set content_seq last fetched (UI only) """
+    StatusBlock.ACK.pack_into(self._shm.buf,
+                              StatusBlock.SIZE-StatusBlock.ACK.size,seq)
+
+  # --- close   ---------------------------------------------------------------
+
+  def close(self,unlink=False):
+    """ detach (and remove) the block """
+
+    self._shm.close()
+    if unlink:
+      self._shm.unlink()
+
+# --- engine-side of the UI   -------------------------------------------------
+
+class Ui(Thread,Base):
+  """ publish state to the UI-process and execute its keys """
+
+  KEYPAD_RADIO  = Keypad.KEYPAD_RADIO
+  KEYPAD_PLAYER = Keypad.KEYPAD_PLAYER
+
+  def __init__(self,app):
+    """ initialization """
+    super(Ui,self).__init__(name="Ui")
+
+    self._app      = app
+    self._provider = None
+    self._lock     = threading.Lock()
+    self._wake     = threading.Event()
+    self._state    = {f: "" if f in StatusBlock.TEXTS else 0
+                      for f in StatusBlock.FIELDS}
+    self._status   = None
+    self._process  = None
+    self._events   = app.bus.subscribe(PlaybackEvent,notify=self._wake.set)
+    self._changes  = app.bus.subscribe(ChannelEvent,RecordEvent,VolumeEvent,
+                                       latest=True,notify=self._wake.set)
+    self._m_restarts = app.metrics.counter("simple_radio_ui_restarts_total",
+                                           "restarts of the UI-process")
+    self.read_config()
+
+  # --- read configuration   --------------------------------------------------
+
+  def read_config(self):
+    """ read configuration from config-file """
+
+    # section [GLOBAL]
+    self._debug = self.get_value(self._app.parser,"GLOBAL", "debug","0") == "1"
+
+  # --- interface of class Display   ----------------------------------------
+
+  def set_content_provider(self,provider):
+    """ set content-provider """
+
+    self.debug("set content-provider")
+    self._provider = provider
+    self.refresh()
+
+  def init(self):
+    """ create status-block and start the UI-process """
+
+    self._status = StatusBlock()
+    self._publish()
+    self._spawn()
+
+  def refresh(self):
+    """ update the display as soon as possible """
+
+    with self._lock:
+      self._state["title_seq"] += 1
+    self._wake.set()
+
+  def clear(self):
+    """ clear the display """
+
+    with self._lock:
+      self._state["wipe_seq"] += 1
+    self._wake.set()
+
+  # --- interface of class Keypad   -----------------------------------------
+
+  def set_keymap(self,map):
+    """ set the keymap to use """
+
+    with self._lock:
+      self._state["mode"] = map
+    self._wake.set()
+
+  # --- start UI-process   ----------------------------------------------------
+
+  def _spawn(self):
+    """ start UI-process and a reader for its commands """
+
+    ctx = multiprocessing.get_context("spawn")
+    (receiver,sender) = ctx.Pipe(duplex=False)
+    self._process = ctx.Process(target=run_ui,name="simple-radio-ui",
+                                args=(self._app.options.config[0],
+                                      self._status.name,sender),daemon=True)
+    self._process.start()
+    self._spawn_time = time.monotonic()
+    sender.close()
+    threading.Thread(target=self._read_commands,args=(receiver,),
+                     name="UiCommands",daemon=True).start()
+    self.debug("started UI-process (pid: %d)",self._process.pid)
+
+  # --- read commands of the UI   -------------------------------------------
+
+  def _read_commands(self,conn):
+    """ queue all commands sent by the UI-process """
+
+    while not self._app.stop_event.is_set():
+      try:
+        if conn.poll(POLL_TIME):
+          (func_name,key) = conn.recv()
+          self._app.queue_func(func_name,key)
+      except (EOFError,OSError):
+        break                                   # UI-process terminated
+    conn.close()
+
+  # --- publish state   -------------------------------------------------------
+
+  def _publish(self):
+    """ collect state of all objects and write it to the status-block """
+
+    provider = self._provider
+    events   = self._events.drain() + self._changes.drain()  # state: bus.last()
+    bus      = self._app.bus
+    with self._lock:
+      state = self._state
+      for event in events:
+        state["title_seq"] += 1
+        if (isinstance(event,PlaybackEvent) and event.radio and
+            event.state == "stopped"):
+          state["clear_seq"] += 1
+      if provider:
+        # all alternatives: get_title() of the provider toggles on every call
+        if hasattr(provider,'get_titles'):
+          titles = provider.get_titles()
+        else:
+          titles = [provider.get_title()]
+        (state["left"],state["right"]) = titles[0]
+        (state["left2"],state["right2"]) = (titles[1] if len(titles) > 1
+                                            else ("",""))
+        # fetch new content only after the UI took the last one
+        if self._status.get_ack() == state["content_seq"]:
+          content = provider.get_content()
+          if content:
+            state["content"]      = "\n".join(content)
+            state["content_seq"] += 1
+
+      event = bus.last(ChannelEvent)
+      state["channel"] = (event.nr or 0) if event else 0
+      event = bus.last(VolumeEvent)
+      state["volume"]  = event.volume if event else -1
+      event = bus.last(RecordEvent)
+      if event and event.recording:
+        state["recording"]    = 1
+        state["rec_elapsed"]  = time.time()-event.start
+        state["rec_duration"] = event.duration or 0
+      else:
+        (state["recording"],state["rec_elapsed"],state["rec_duration"]) = (0,0,0)
+      (state["buffered"],state["timeshift"],
+       state["pipe"]) = self._app.mpg123.get_levels()
+      self._status.write(state)
+
+  # --- publisher thread   ----------------------------------------------------
+
+  def run(self):
+    """ publish state, restart the UI-process if it terminated """
+
+    self.debug("starting Ui.run()")
+    while not self._app.stop_event.is_set():
+      self._wake.wait(PUBLISH_TIME)
+      self._wake.clear()
+      try:
+        self._publish()
+      except:
+        if self._debug:
+          traceback.print_exc()
+      if (not self._process.is_alive() and
+          time.monotonic()-self._spawn_time > RESTART_TIME):
+        print("[WARNING] UI-process terminated, restarting")
+        self._m_restarts.inc()
+        self._spawn()
+
+    # stop the UI-process
+    self._state["stop"] = 1
+    self._status.write(self._state)
+    self._process.join(5)
+    if self._process.is_alive():
+      self._process.terminate()
+    self._status.close(unlink=True)
+    self.debug("terminating Ui.run() on stop request")
+
+# --- state of the engine within the UI-process   -----------------------------
+
+class EngineProxy(Base):
+  """ content-provider for the display """
+
+  def __init__(self,app):
+    """ initialization """
+
+    self._app   = app
+    self._debug = app._debug
+    self._seen  = app.state["content_seq"]
+    self._title_toggle = True
+    app.status.set_ack(self._seen)              # e.g. after a restart
+
+  def get_title(self):
+    """ return title-line (1st line of display), toggle between the
+        alternatives of the engine """
+
+    state = self._app.state
+    if not state["left2"] and not state["right2"]:
+      return (state["left"],state["right"])
+    self._title_toggle = not self._title_toggle
+    if self._title_toggle:
+      return (state["left2"],state["right2"])
+    return (state["left"],state["right"])
+
+  def get_content(self):
+    """ return new content of the engine """
+
+    state = self._app.state
+    if state["content_seq"] == self._seen:
+      return []
+    self._seen = state["content_seq"]
+    self._app.status.set_ack(self._seen)
+    return state["content"].split("\n")
+
+# --- application of the UI-process   -----------------------------------------
+
+class UiApp(Base):
+  """ display, keypad and lirc within their own process """
+
+  def __init__(self,config,name,conn):
+    """ initialization """
+
+    self.parser = configparser.RawConfigParser(inline_comment_prefixes=(';',))
+    self.parser.optionxform = str
+    self.parser.read(config)
+    self._debug = self.get_value(self.parser,"GLOBAL", "debug","0") == "1"
+    setup_logging(self.parser)
+
+    self.stop_event = threading.Event()
+    self.key_time   = None
+    self._conn      = conn
+    self._lock      = threading.Lock()
+    self._ppid      = os.getppid()
+    self.status     = StatusBlock(name)
+    self.state      = self.status.read()
+
+    from SRMetrics import Metrics
+    from SRBus     import Bus
+    from SRDisplay import Display
+    from SRLirc    import Lirc
+    self.metrics  = Metrics(self)
+    self.bus      = Bus(self)
+    self.engine   = EngineProxy(self)
+    self.display  = Display(self)
+    self.keypad   = Keypad(self)
+    self.lirc     = Lirc(self)
+
+  # --- register functions   --------------------------------------------------
+
+  def register_funcs(self,func_map):
+    """ functions are executed by the engine """
+    pass
+
+  # --- queue function   ------------------------------------------------------
+
+  def queue_func(self,func_name,key):
+    """ send function to the engine """
+
+    with self._lock:
+      try:
+        self._conn.send((func_name,key))
+      except OSError:
+        self.stop_event.set()                   # engine terminated
+
+  # --- publish changes of the engine-state   --------------------------------
+
+  def _publish_changes(self,old):
+    """ publish events for changes of the state to the bus of the UI """
+
+    state = self.state
+    if state["channel"] != old["channel"]:
+      self.bus.publish(ChannelEvent(state["channel"] or None,None))
+    if state["volume"] != old["volume"]:
+      self.bus.publish(VolumeEvent(state["volume"]))
+    if (state["recording"] != old["recording"] or
+        state["rec_duration"] != old["rec_duration"]):
+      self.bus.publish(RecordEvent(bool(state["recording"]),None,
+                                   time.time()-state["rec_elapsed"],
+                                   state["rec_duration"]))
+    if state["clear_seq"] != old["clear_seq"]:
+      self.bus.publish(PlaybackEvent("stopped",True))
+
+  # --- run UI   --------------------------------------------------------------
+
+  def run(self):
+    """ start threads and follow the state of the engine """
+
+    self.display.set_content_provider(self.engine)
+    self.display.init()
+    self.keypad.set_keymap(self.state["mode"])
+    self._publish_changes(dict(self.state,channel=None,volume=None,
+                               recording=None))
+    threads = [self.display,self.keypad,self.lirc]
+    for thread in threads:
+      thread.start()
+
+    while not self.stop_event.wait(UI_POLL_TIME):
+      (old,self.state) = (self.state,self.status.read())
+      if self.state["stop"] or os.getppid() != self._ppid:
+        break
+      if self.state["wipe_seq"] != old["wipe_seq"]:
+        self.display.clear()
+      self._publish_changes(old)
+      if self.state["title_seq"] != old["title_seq"]:
+        self.display.refresh()
+      if self.state["mode"] != old["mode"]:
+        self.keypad.set_keymap(self.state["mode"])
+
+    self.stop_event.set()
+    for thread in threads:
+      thread.join(5)
+    self.status.close()
+
+# --- entry-point of the UI-process   -----------------------------------------
+
+def run_ui(config,name,conn):
+  """ run the UI-process """
+
+  signal.signal(signal.SIGINT,signal.SIG_IGN)    # the engine stops the UI
+  app = UiApp(config,name,conn)
+  signal.signal(signal.SIGTERM,lambda signo,frame: app.stop_event.set())
+  try:
+    app.run()
+  except:
+    traceback.print_exc()
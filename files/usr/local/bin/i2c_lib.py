@@ -18,20 +18,24 @@ class i2c_device:
    def __init__(self, addr, port=1):
       self.addr = addr
       self.bus = smbus.SMBus(port)
+      self.bytes_written = 0
 
 # Write a single command
    def write_cmd(self, cmd):
       self.bus.write_byte(self.addr, cmd)
+      self.bytes_written += 1
       sleep(0.0001)
 
 # Write a command and argument
    def write_cmd_arg(self, cmd, data):
       self.bus.write_byte_data(self.addr, cmd, data)
+      self.bytes_written += 2
       sleep(0.0001)
 
 # Write a block of data
    def write_block_data(self, cmd, data):
       self.bus.write_block_data(self.addr, cmd, data)
+      self.bytes_written += len(data)+1
       sleep(0.0001)
 
 # Read a single byte
@@ -0,0 +1,103 @@
+# -----------------------------------------------------------------------------
+# Character translation for HD44780-displays
+#
+# Builds str.translate()-tables which convert a complete line in one call
+# to the codes of the display: explicit mappings (config-variable trans),
+# custom glyphs in CGRAM, and a fallback for all other characters
+# (transliteration of accents, quotes, dashes and so on).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import unicodedata
+
+# transliteration of characters without a decomposition
+TRANSLIT = {
+  u"‘": "'",  u"’": "'",  u"‚": "'",  u"‛": "'",
+  u"′": "'",  u"´": "'",  u"`": "'",
+  u"“": '"',  u"”": '"',  u"„": '"',  u"‟": '"',
+  u"″": '"',
+  u"‐": "-",  u"‑": "-",  u"‒": "-",  u"–": "-",
+  u"—": "-",  u"―": "-",  u"−": "-",
+  u"…": "...",u"«": "<<", u"»": ">>", u"‹": "<",
+  u"›": ">",  u"•": "*",  u"·": ".",  u"×": "x",
+  u"÷": ":",  u"ß": "ss", u"Æ": "AE", u"æ": "ae",
+  u"Ø": "O",  u"ø": "o",  u"Œ": "OE", u"œ": "oe",
+  u"Đ": "D",  u"đ": "d",  u"Ł": "L",  u"ł": "l",
+  u"Þ": "Th", u"þ": "th", u"Ð": "D",  u"ð": "d",
+  u"€": "EUR",u"£": "GBP",u"©": "(c)",u"®": "(R)",
+  u"™": "TM", u"°": "o",  u"¡": "!",  u"¿": "?",
+  u"♪": "*",  u"♫": "*",  u"§": "S",  u"µ": "u",
+  u"¼": "1/4",u"½": "1/2",u"¾": "3/4",
+  u"\\":     "/",  u"~":      "-"                   # not in ROM A00
+  }
+
+# 5x8 glyphs for CGRAM (one value per row)
+GLYPHS = {
+  u"Ä": (0x0A,0x00,0x0E,0x11,0x1F,0x11,0x11,0x00),      # Ä
+  u"Ö": (0x0A,0x00,0x0E,0x11,0x11,0x11,0x0E,0x00),      # Ö
+  u"Ü": (0x0A,0x00,0x11,0x11,0x11,0x11,0x0E,0x00),      # Ü
+  u"ä": (0x0A,0x00,0x0E,0x01,0x0F,0x11,0x0F,0x00),      # ä
+  u"ö": (0x0A,0x00,0x0E,0x11,0x11,0x11,0x0E,0x00),      # ö
+  u"ü": (0x0A,0x00,0x11,0x11,0x11,0x13,0x0D,0x00),      # ü
+  u"ß": (0x0C,0x12,0x12,0x16,0x11,0x11,0x16,0x10),      # ß
+  u"é": (0x02,0x04,0x0E,0x11,0x1F,0x10,0x0E,0x00),      # é
+  u"è": (0x08,0x04,0x0E,0x11,0x1F,0x10,0x0E,0x00),      # è
+  u"á": (0x02,0x04,0x0E,0x01,0x0F,0x11,0x0F,0x00),      # á
+  u"à": (0x08,0x04,0x0E,0x01,0x0F,0x11,0x0F,0x00),      # à
+  u"ç": (0x00,0x0E,0x10,0x10,0x11,0x0E,0x04,0x0C),      # ç
+  u"ñ": (0x0D,0x12,0x00,0x16,0x19,0x11,0x11,0x00),      # ñ
+  u"€": (0x07,0x08,0x1E,0x08,0x1E,0x08,0x07,0x00)       # €
+  }
+CGRAM_SLOTS = 8
+
+# --- fallback for a single character   --------------------------------------
+
+def fallback(char):
+  """ return replacement for a character outside of the table """
+
+  if u" " <= char < u"\x7f":
+    return TRANSLIT.get(char,char)
+  elif char < u" " or char == u"\x7f":
+    return u" "
+  elif char in TRANSLIT:
+    return TRANSLIT[char]
+
+  # strip accents and other marks
+  ascii = unicodedata.normalize('NFKD',char).encode('ascii','ignore').decode()
+  ascii = u"".join([c for c in ascii if u" " <= c < u"\x7f"])
+  if ascii:
+    return ascii
+  return u" " if unicodedata.category(char)[0] == 'Z' else u"?"
+
+# --- translation table   -----------------------------------------------------
+
+class TransTable(dict):
+  """ table for str.translate(): unknown chars are computed once """
+
+  def __missing__(self,code):
+    value = fallback(chr(code))
+    self[code] = value
+    return value
+
+def build_table(tmap=None,glyphs=None):
+  """ build table from a map char->code and a map char->CGRAM-slot """
+
+  table = TransTable()
+  for (char,code) in (tmap or {}).items():
+    table[ord(char)] = chr(code)
+  for (char,slot) in (glyphs or {}).items():
+    table[ord(char)] = chr(slot)
+  return table
+
+# --- convert a line   --------------------------------------------------------
+
+def translate(text,table,cols=None):
+  """ convert text to bytes for the display """
+
+  data = text.translate(table).encode('latin-1')
+  return data[:cols] if cols else data
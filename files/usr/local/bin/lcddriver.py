@@ -11,8 +11,9 @@
 #
 # -----------------------------------------------------------------------------
 
-import sys
+import sys, collections
 import i2c_lib
+import lcdcharset
 from time import *
 
 # LCD Address
@@ -64,11 +65,21 @@ En = 0b00000100 # Enable bit
 Rw = 0b00000010 # Read/Write bit
 Rs = 0b00000001 # Register select bit
 
+# DDRAM-address of the first column of every line
+LINE_ADDR = {1: 0x80, 2: 0xC0, 3: 0x94, 4: 0xD4}
+
 class lcd:
   #initializes objects and lcd
-  def __init__(self,port=1,tmap=None):
+  def __init__(self,port=1,tmap=None,glyphs=None):
     self.lcd_device = i2c_lib.i2c_device(ADDRESS,port)
     self.tmap = tmap if tmap else {}
+    self.glyphs = {}                          # char -> CGRAM-slot
+    self.table  = lcdcharset.build_table(self.tmap)
+
+    # characters which could be uploaded as custom glyphs
+    self._auto_glyphs = glyphs == "auto"
+    self._glyph_counts = collections.Counter()
+    self._glyph_candidates = frozenset(lcdcharset.GLYPHS) - frozenset(self.tmap)
 
     self.lcd_write(0x03)
     self.lcd_write(0x03)
@@ -81,6 +92,9 @@ class lcd:
     self.lcd_write(LCD_ENTRYMODESET | LCD_ENTRYLEFT)
     sleep(0.2)
 
+    if glyphs and not self._auto_glyphs:
+      self.load_glyphs(glyphs)
+
   # clocks EN to latch command
   def lcd_strobe(self, data):
     self.lcd_device.write_cmd(data | En | LCD_BACKLIGHT)
@@ -106,22 +120,49 @@ class lcd:
     else:
       print("Unknown State!")
 
-  # put string function
-  def lcd_display_string(self, string, line):
-    if line == 1:
-      self.lcd_write(0x80)
-    if line == 2:
-      self.lcd_write(0xC0)
-    if line == 3:
-      self.lcd_write(0x94)
-    if line == 4:
-      self.lcd_write(0xD4)
-
-    for char in string:
-      if char in self.tmap:
-        self.lcd_write(self.tmap[char], Rs)
-      else:
-        self.lcd_write(ord(char), Rs)
+  # put string function (the line is translated in one call, the
+  # result is truncated to cols if given)
+  def lcd_display_string(self, string, line, cols=None):
+    self.lcd_display_bytes(lcdcharset.translate(string,self.table,cols),line)
+
+  # write already translated bytes starting at the given column
+  def lcd_display_bytes(self, data, line, col=0):
+    self.lcd_write(LINE_ADDR[line] + col)
+    for byte in data:
+      self.lcd_write(byte, Rs)
+
+  # upload custom glyphs to CGRAM (at most 8, slots of characters which
+  # are still used are kept)
+  def load_glyphs(self, chars):
+    chars = [c for c in chars if c in lcdcharset.GLYPHS]
+    chars = chars[:lcdcharset.CGRAM_SLOTS]
+    slots = {c: s for (c,s) in self.glyphs.items() if c in chars}
+    free  = [s for s in range(lcdcharset.CGRAM_SLOTS) if s not in slots.values()]
+    for char in chars:
+      if char in slots:
+        continue
+      slot = free.pop(0)
+      slots[char] = slot
+      self.lcd_write(LCD_SETCGRAMADDR | (slot << 3))
+      for row in lcdcharset.GLYPHS[char]:
+        self.lcd_write(row, Rs)
+    self.lcd_write(LCD_SETDDRAMADDR)
+    self.glyphs = slots
+    self.table  = lcdcharset.build_table(self.tmap,slots)
+
+  # count characters with custom glyphs and upload the most frequent ones
+  # (only with glyphs="auto")
+  def count_glyphs(self, string):
+    if not self._auto_glyphs:
+      return
+    chars = self._glyph_candidates.intersection(string)
+    if not chars:
+      return
+    for char in chars:
+      self._glyph_counts[char] += string.count(char)
+    top = [c for (c,_) in self._glyph_counts.most_common(lcdcharset.CGRAM_SLOTS)]
+    if set(top) != set(self.glyphs):
+      self.load_glyphs(top)
 
   # clear lcd and set to home
   def lcd_clear(self):
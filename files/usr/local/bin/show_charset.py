@@ -17,6 +17,34 @@ SLEEP_TIME = 5
 COLS       = 20
 ROWS       = 4
 
+# --- dump translation table   -------------------------------------------------
+
+def dump_table():
+  """ dump translation table built from /etc/simple-radio.conf """
+
+  import configparser, unicodedata, lcdcharset
+  parser = configparser.RawConfigParser(inline_comment_prefixes=(';',))
+  parser.read('/etc/simple-radio.conf')
+  tmap = {}
+  if parser.has_option("DISPLAY","trans"):
+    rule = parser.get("DISPLAY","trans").split(",")
+    for i in range(len(rule[0])):
+      tmap[rule[0][i]] = int(rule[i+1],16)
+  table  = lcdcharset.build_table(tmap)
+  for code in list(range(0xA0,0x180))+list(range(0x2010,0x2040))+[0x20AC]:
+    char = chr(code)
+    if not unicodedata.name(char,None):
+      continue
+    codes  = " ".join(["%02x" % b for b in lcdcharset.translate(char,table)])
+    source = "trans" if char in tmap else "fallback"
+    if char in lcdcharset.GLYPHS and not char in tmap:
+      source += ", glyph available"
+    print("U+%04X %s -> %-12s (%s)" % (code,char,codes,source))
+
+if len(sys.argv) > 1 and sys.argv[1] == "-t":
+  dump_table()
+  sys.exit(0)
+
 try:
   import lcddriver
   lcd = lcddriver.lcd(port=I2C_PORT)
@@ -17,10 +17,10 @@
 
 import locale, os, sys, json, traceback
 from   argparse import ArgumentParser
-import threading, signal
+import threading, signal, time, asyncio
 import configparser
 
-from SRBase     import Base
+from SRBase     import Base, setup_logging, dump_log
 
 # --- helper class for options   --------------------------------------------
 
@@ -43,6 +43,10 @@ def get_parser():
     dest='do_list', default=False,
     help="display radio-channels")
 
+  parser.add_argument('-P', '--probe', action='store_true',
+    dest='do_probe', default=False,
+    help="check all radio-channels")
+
   parser.add_argument('-r', '--record', action='store_true',
     dest='do_record', default=False,
     help="record radio (needs channel as argument)")
@@ -51,6 +55,11 @@ def get_parser():
     dest='target_dir',
     help='target directory for recordings')
 
+  parser.add_argument('-c', '--config', nargs=1,
+    metavar='config-file', default=['/etc/simple-radio.conf'],
+    dest='config',
+    help='configuration file (default: /etc/simple-radio.conf)')
+
   parser.add_argument('-h', '--help', action='help',
     help='print this help')
 
@@ -81,7 +90,7 @@ class App(Base):
     self.options    = options
     self.parser     = configparser.RawConfigParser(inline_comment_prefixes=(';',))
     self.parser.optionxform = str
-    self.parser.read('/etc/simple-radio.conf')
+    self.parser.read(options.config[0])
 
     self.read_config()
     self._store = os.path.join(os.path.expanduser("~"),".simple-radio.json")
@@ -89,40 +98,86 @@ class App(Base):
     self._threads    = []                   # thread-store
     self.stop_event  = threading.Event()
     self._functions  = {}                   # maps user-functions to methods
+                                            # (list: first active one wins)
+    self.key_time    = None                 # start of current key-event
     self.register_funcs(self.get_funcs())
 
+    from SRMetrics  import Metrics
+    from SRBus      import Bus
+    self.metrics  = Metrics(self)
+    self.bus      = Bus(self)
+
     # create all objects
+    if options.do_record or not (options.do_list or options.do_probe):
+      from SRStreamHub import StreamHub
+      self.hub = StreamHub(self)
     if options.do_record:
       from SRRadio    import Radio
+      from SRRecIndex import RecIndex
+      from SRRetention import Retention
+      from SRTranscoder import Transcoder
       from SRRecorder import Recorder
-      self.radio    = Radio(self)
-      self.recorder = Recorder(self)
-      self._objects = [self,self.radio,self.recorder]
+      self.radio      = Radio(self)
+      self.recindex   = RecIndex(self)
+      self.retention  = Retention(self)
+      self.transcoder = Transcoder(self)
+      self.recorder   = Recorder(self)
+      self._objects = [self,self.hub,self.radio,self.recorder]
     elif options.do_list:
       from SRRadio    import Radio
       self.radio    = Radio(self)
       self._objects = [self,self.radio]
+    elif options.do_probe:
+      from SRRadio    import Radio
+      from SRProbe    import Prober
+      self.radio    = Radio(self)
+      self.prober   = Prober(self)
+      self._objects = [self,self.radio]
     else:
       from SRKeypad   import Keypad
       from SRDisplay  import Display
       from SRRadio    import Radio
+      from SRRecIndex import RecIndex
+      from SRRetention import Retention
+      from SRTranscoder import Transcoder
       from SRRecorder import Recorder
       from SRPlayer   import Player
       from SRMpg123   import Mpg123
       from SRAmp      import Amp
       from SRLirc     import Lirc
       from SRCec      import CECController
-      self.keypad   = Keypad(self)
-      self.lirc     = Lirc(self)
+      from SREventLoop import EventLoop
+      from SRApi      import Api
+      from SRRelay    import Relay
+      from SRProbe    import Prober
+      from SRCommands import CommandQueue
+      if self._ui_process:
+        from SRUi import Ui
+        self.ui       = Ui(self)
+        self.display  = self.ui               # the Ui-object stands in for
+        self.keypad   = self.ui               # display and keypad
+      else:
+        self.keypad   = Keypad(self)
+        self.lirc     = Lirc(self)
+        self.display  = Display(self)
       self.radio    = Radio(self)
+      self.recindex = RecIndex(self)
+      self.retention = Retention(self)
+      self.transcoder = Transcoder(self)
       self.player   = Player(self)
       self.recorder = Recorder(self)
       self.mpg123   = Mpg123(self)
       self.amp      = Amp(self)
-      self.display  = Display(self)
       self.cec      = CECController(self)
-      self._objects = [self,self.keypad,self.lirc,self.radio,self.player,
-                       self.recorder,self.mpg123,self.amp,self.display,self.cec]
+      self.eventloop = EventLoop(self)
+      self.api      = Api(self)
+      self.relay    = Relay(self)
+      self.prober   = Prober(self)
+      self.commands = CommandQueue(self)
+      self._objects = [self,self.hub,self.radio,self.recindex,self.player,
+                       self.recorder,self.mpg123,self.amp,self.cec]
+      if not self._ui_process:
+        self._objects.extend([self.keypad,self.lirc,self.display])
     self._load_state()
 
   # --- read configuration   --------------------------------------------------
@@ -132,26 +187,58 @@ class App(Base):
 
     # section [GLOBAL]
     self._debug  = self.get_value(self.parser,"GLOBAL", "debug","0") == "1"
+    self._ui_process = self.get_value(self.parser,
+                                      "GLOBAL","ui_process","0") == "1"
+    setup_logging(self.parser)
 
   # --- register functions   --------------------------------------------------
 
   def register_funcs(self,func_map):
     """ register functions im map (called by every class providing functions) """
 
-    self._functions.update(func_map)
+    for (func_name,func) in func_map.items():
+      self._functions.setdefault(func_name,[]).append(func)
 
-  # --- execute function   ----------------------------------------------------
+  # --- return names of functions   ------------------------------------------
+
+  def get_func_names(self):
+    """ return sorted list of registered functions """
+
+    return sorted(self._functions.keys())
+
+  # --- queue function   ------------------------------------------------------
 
-  def exec_func(self,func_name,key):
-    """ execute logical function """
+  def queue_func(self,func_name,key):
+    """ queue logical function for execution by the command-worker """
 
     if func_name in self._functions:
-      func = self._functions[func_name]
-      if func.__self__.is_active():
-        self.debug("executing: %s" % func_name)
-        func(key)
-      else:
-        self.debug("ignoring: %s (not active)" % func_name)
+      self.commands.put(func_name,key)
+    else:
+      self.debug("ignoring: %s (unknown)",func_name)
+
+  # --- execute function   ----------------------------------------------------
+
+  def exec_func(self,func_name,key,count=1,key_time=None):
+    """ execute logical function (count: number of merged key-events) """
+
+    funcs = [func for func in self._functions.get(func_name,[])
+             if func.__self__.is_active()]
+    if not funcs:
+      self.debug("ignoring: %s (not active)",func_name)
+      return
+
+    self.debug("executing: %s (%d)",func_name,count)
+    start = time.monotonic()
+    self.key_time = key_time or start
+    if count == 1:
+      funcs[0](key)
+    else:
+      funcs[0](key,count)
+    self.metrics.histogram("simple_radio_dispatch_seconds",
+                           "execution time of functions",
+                           {"func": func_name}).observe(
+                             time.monotonic()-start)  # without queue-wait
+    self.key_time = None
 
   # --- switch to player mode   -----------------------------------------------
 
@@ -233,7 +320,7 @@ class App(Base):
       state[obj.__module__] = obj.get_persistent_state()
 
     f = open(self._store,"w")
-    self.debug("Saving settings to %s" % self._store)
+    self.debug("Saving settings to %s",self._store)
     json.dump(state,f,indent=2,sort_keys=True)
     f.close()
 
@@ -245,7 +332,7 @@ class App(Base):
     try:
       if not os.path.exists(self._store):
         return
-      self.debug("Loading settings from %s" % self._store)
+      self.debug("Loading settings from %s",self._store)
       f = open(self._store,"r")
       state = json.load(f)
       for obj in self._objects:
@@ -266,12 +353,22 @@ class App(Base):
     if hasattr(self,'mpg123'):
       self.mpg123.stop()
     self.stop_event.set()
-    self.recorder.stop_recording()
+    if hasattr(self,'eventloop'):
+      self.eventloop.stop()
+    if hasattr(self,'recorder'):
+      self.recorder.stop_recording()
     map(threading.Thread.join,self._threads)
     self._save_state()
     self.debug("... done stopping program")
     sys.exit(0)
 
+  # --- dump log-records   ---------------------------------------------------
+
+  def dump_handler(self,_signo, _stack_frame):
+    """ signal-handler dumping the in-memory log-records """
+
+    dump_log()
+
   # --- play radio   ----------------------------------------------------------
 
   def do_play(self):
@@ -283,10 +380,29 @@ class App(Base):
     self._threads.append(self.display)
     self.display.start()
 
-    if options.channel:
-      self.radio.func_switch_channel(options.channel)
-
-    # start control-threads
+    if self.options.channel:
+      self.radio.func_tune_channel(self.options.channel)
+
+    # start watcher of recordings
+    self._threads.append(self.recindex)
+    self.recindex.start()
+    self._threads.append(self.retention)
+    self.retention.start()
+    self.transcoder.start()
+
+    # start shared event-loop and API-server
+    self._threads.append(self.eventloop)
+    self.eventloop.start()
+    self.api.start()
+    self._threads.append(self.relay)
+    self.relay.start()
+    self.prober.start()
+
+    # start command-worker and control-threads
+    self._threads.append(self.commands)
+    self.commands.start()
+    if self._ui_process:
+      return                              # keypad and lirc run within the UI
     self._threads.append(self.keypad)
     self.keypad.start()
     self._threads.append(self.lirc)
@@ -309,11 +425,17 @@ if __name__ == '__main__':
   # setup signal-handler
   signal.signal(signal.SIGTERM, app.signal_handler)
   signal.signal(signal.SIGINT,  app.signal_handler)
+  signal.signal(signal.SIGUSR1, app.dump_handler)
 
   if options.do_list:
     app.radio.print_channels()
+  elif options.do_probe:
+    asyncio.run(app.prober.probe_all())
+    app.prober.print_results()
   elif options.do_record:
+    app.transcoder.start()
     app.recorder.record(app.radio.get_channel(int(options.channel)-1))
+    app.stop_event.set()
   else:
     app.do_play()
     signal.pause()
@@ -0,0 +1,547 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio simulation: end-to-end benchmarks
+#
+# Runs the complete application (class App) against the fake hardware and
+# a local stream-server and drives it through scripted scenarios. Reports
+# latency-percentiles and CPU-time per component (thread).
+#
+# Usage: bench.py [-s scenario] [--json]
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import os, time, random, json, tempfile, shutil, resource, signal
+import importlib.util, threading, socket, http.client, urllib.parse
+from argparse import ArgumentParser
+
+import simlib
+simlib.activate()
+
+from streamserver import StreamServer
+from inject import FifoInjector, LircInjector
+from SRStream import IcyReader
+
+CHANNELS  = 9
+LISTENERS = 4                               # fast listeners of the relay
+EVICT_MAX = 60                              # max. wait for the eviction (s)
+
+# --- options for class App   -------------------------------------------------
+
+class Options(object):
+  do_play    = True
+  do_list    = False
+  do_probe   = False
+  do_record  = False
+  target_dir = None
+  channel    = None
+  duration   = 0
+
+# --- benchmark environment   -------------------------------------------------
+
+class Bench(object):
+  """ running application with fake hardware """
+
+  def __init__(self,options,recordings=0,overrides={}):
+    """ create environment and application """
+
+    self.work_dir = tempfile.mkdtemp(prefix="sr-bench-")
+    os.environ["HOME"] = self.work_dir
+    os.environ["AMIXER_SIM_STATE"] = os.path.join(self.work_dir,"amixer.state")
+
+    self.server = StreamServer(("127.0.0.1",0),title_time=options.title_time)
+    self.server.start()
+    channels = simlib.write_channels(self.work_dir,self.server.url,CHANNELS)
+    config   = simlib.write_config(self.work_dir,channels,overrides)
+    if recordings:
+      simlib.create_recordings(os.path.join(self.work_dir,"recordings"),
+                               recordings)
+
+    self.keypad = FifoInjector(os.path.join(self.work_dir,"keypad.fifo"))
+    self.lirc   = LircInjector(os.path.join(self.work_dir,"lircd"))
+
+    spec   = importlib.util.spec_from_file_location(
+      "simple_radio",os.path.join(simlib.BIN_DIR,"simple-radio.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    app_options        = Options()
+    app_options.config = [config]
+    self.app = module.App(app_options)
+
+    # collect raw samples in addition to the histograms
+    self.samples = {}
+    self.info    = {}                       # additional results (tables)
+    self._capture("switch","simple_radio_channel_switch_seconds")
+    self._capture("rec_read","simple_radio_recorder_read_seconds")
+    self._wrap_exec()
+
+  # --- capture observations of a histogram   --------------------------------
+
+  def _capture(self,key,name):
+    """ record raw observations of the given histogram """
+
+    hist    = self.app.metrics.histogram(name,"")
+    samples = self.samples.setdefault(key,[])
+    observe = hist.observe
+    def capture(value):
+      samples.append(value)
+      observe(value)
+    hist.observe = capture
+
+  # --- time execution of all functions   ------------------------------------
+
+  def _wrap_exec(self):
+    """ time every call of App.exec_func """
+
+    exec_func = self.app.exec_func
+    def timed(func_name,key,*args):
+      start = time.monotonic()
+      exec_func(func_name,key,*args)
+      self.samples.setdefault("exec:"+func_name,[]).append(
+        time.monotonic()-start)
+    self.app.exec_func = timed
+
+  # --- start/stop   ----------------------------------------------------------
+
+  def start(self):
+    """ start application and connect injectors """
+
+    self.cpu = simlib.CpuSampler()
+    self.cpu.start()
+    self._ru_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    self.app.do_play()
+    self.keypad.open()                    # blocks until keypad reads
+    self.lirc.connected.wait(5)
+
+  def stop(self):
+    """ stop application and cleanup """
+
+    app = self.app
+    app.mpg123.stop()
+    app.stop_event.set()
+    app.eventloop.stop()
+    app.recorder.stop_recording()
+    for thread in app._threads:
+      thread.join(5)
+    cpu = self.cpu.stop()
+    ru  = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu["subprocesses"] = ((ru.ru_utime-self._ru_start.ru_utime) +
+                           (ru.ru_stime-self._ru_start.ru_stime))
+    self.keypad.close()
+    self.lirc.close()
+    self.server.stop()
+    shutil.rmtree(self.work_dir,ignore_errors=True)
+    return cpu
+
+  def wait_idle(self,timeout=10):
+    """ wait until the decoder started (or timeout) """
+
+    end = time.monotonic() + timeout
+    while time.monotonic() < end and not self.app.mpg123.is_active():
+      time.sleep(0.05)
+
+# --- scenarios   -------------------------------------------------------------
+
+def zap_storm(bench,options):
+  """ many channel-switches from the keypad in a short time """
+
+  bench.keypad.send("1")
+  bench.wait_idle()
+  time.sleep(1)
+  for i in range(options.count):
+    bench.keypad.send(str(random.randint(1,8)))
+    time.sleep(options.interval)
+  time.sleep(2)
+
+def record_while_playing(bench,options):
+  """ record a channel while playing another one """
+
+  bench.lirc.send("KEY_1")
+  bench.wait_idle()
+  bench.lirc.send("KEY_RECORD")
+  end = time.monotonic() + options.duration
+  while time.monotonic() < end:
+    bench.lirc.send("KEY_%d" % random.randint(2,9))
+    time.sleep(options.interval*10)
+  bench.lirc.send("KEY_RECORD")
+  time.sleep(1)
+
+def player_navigation(bench,options):
+  """ navigate through many recordings in player-mode """
+
+  app = bench.app
+  app.exec_func("start_playmode","16")
+  for i in range(options.count):
+    app.exec_func(random.choice(["next_recording","prev_recording",
+                                 "play_following","play_channel"]),"_")
+    time.sleep(options.interval)
+  app.exec_func("stop_play","8")
+  app.exec_func("exit_playmode","16")
+
+class RelayClient(threading.Thread):
+  """ listener of the relay (optionally reading slowly) """
+
+  def __init__(self,url,icy=False,rate=None):
+    """ initialization """
+    super(RelayClient,self).__init__(name="RelayClient",daemon=True)
+
+    self.url     = urllib.parse.urlsplit(url)
+    self.icy     = icy
+    self.rate    = rate                     # bytes/s (None: as fast as sent)
+    self.bytes   = 0
+    self.titles  = 0
+    self.closed  = False                    # closed by the relay
+    self.stopped = threading.Event()
+
+  def run(self):
+    """ read the stream until stopped or closed by the relay """
+
+    conn = http.client.HTTPConnection(self.url.hostname,self.url.port,
+                                      timeout=10)
+    conn.connect()
+    if self.rate:
+      conn.sock.setsockopt(socket.SOL_SOCKET,socket.SO_RCVBUF,4096)
+    conn.request("GET",self.url.path,
+                 headers={"Icy-MetaData": "1"} if self.icy else {})
+    reader = IcyReader(conn.getresponse())
+    start  = time.monotonic()
+    try:
+      while not self.stopped.is_set():
+        (data,title) = reader.read(1024 if self.rate else 16384)
+        if not data:
+          self.closed = True
+          break
+        self.bytes  += len(data)
+        self.titles += title is not None
+        if self.rate:
+          delay = self.bytes/self.rate - (time.monotonic()-start)
+          if delay > 0:
+            time.sleep(delay)
+    except OSError:
+      self.closed = True
+    conn.close()
+
+def relay(bench,options):
+  """ fan out the current channel to listeners on localhost """
+
+  bench.lirc.send("KEY_1")
+  bench.wait_idle()
+  app = bench.app
+  while app.relay.port is None:
+    time.sleep(0.05)
+  url = "http://127.0.0.1:%d/" % app.relay.port
+
+  clients = [RelayClient(url,icy=i%2 == 0) for i in range(LISTENERS)]
+  clients.append(RelayClient(url,rate=simlib.BYTE_RATE//8))    # too slow
+  start = time.monotonic()
+  for client in clients:
+    client.start()
+  time.sleep(options.duration)
+
+  # the socket-buffers absorb the shortfall for a while: wait for the eviction
+  evictions = app.metrics.counter("simple_radio_relay_evictions_total","")
+  end = start + EVICT_MAX
+  while evictions.value == 0 and time.monotonic() < end:
+    time.sleep(0.1)
+  evicted_after = round(time.monotonic()-start,1) if evictions.value else None
+  if not evictions.value:
+    print("[WARNING] slow listener not evicted within %ds" % EVICT_MAX)
+
+  bench.info["relay listeners"] = app.relay.get_status()
+  bench.info["relay clients"]   = [{"icy":    c.icy,
+                                    "slow":   bool(c.rate),
+                                    "bytes":  c.bytes,
+                                    "titles": c.titles,
+                                    "closed": c.closed} for c in clients]
+  bench.info["relay summary"] = [{
+    "upstream": bench.server.clients,
+    "evicted":  evictions.value,
+    "after":    evicted_after}]
+  for client in clients:
+    client.stopped.set()
+  for client in clients:
+    client.join(5)
+
+def ui_stall(bench,options):
+  """ freeze the UI-process while playing and recording """
+
+  app = bench.app
+  bench.lirc.send("KEY_1")
+  bench.wait_idle()
+  bench.lirc.send("KEY_RECORD")
+  time.sleep(1)
+  (fed,start) = (app.mpg123._fed_pos,time.monotonic())
+  os.kill(app.ui._process.pid,signal.SIGSTOP)       # e.g. a hanging I2C-bus
+  time.sleep(options.duration)
+  os.kill(app.ui._process.pid,signal.SIGCONT)
+  secs = time.monotonic()-start
+  bench.info["ui stall"] = [{"seconds":   round(secs,1),
+                             "fed_kbps":  round(8*(app.mpg123._fed_pos-fed)/
+                                                secs/1000,1),
+                             "restarts":  app.metrics.counter(
+                               "simple_radio_ui_restarts_total","").value}]
+  bench.lirc.send("KEY_RECORD")
+  time.sleep(1)
+
+def probe(bench,options):
+  """ probe live, slow and broken channels (and a live channel too slow to
+      deliver all bytes in time), skip the dead ones """
+
+  app   = bench.app
+  paths = ["channel01","slow1","fail","channel02","drop","slow9","channel03",
+           "channel04?kbps=24&burst=0"]
+  with open(app.radio._channel_file,"w") as f:
+    for path in paths:
+      f.write("%s@%s/%s\n" % (path,bench.server.url,path))
+  app.radio.read_channels()
+
+  start   = time.monotonic()
+  results = app.eventloop.submit(app.prober.probe_all()).result()
+  secs    = time.monotonic()-start
+  bench.info["probe results"] = [
+    {"channel": path, "ok": r["ok"], "connect": r["connect"],
+     "first_byte": r["first_byte"], "codec": r["codec"],
+     "bitrate": r["bitrate"], "throughput": r["throughput"],
+     "error": r["error"]}
+    for (path,r) in zip(paths,results)]
+
+  # next/prev must skip the dead channels
+  app.exec_func("tune_channel","1")
+  channels = []
+  for func in 3*["next_channel"]+3*["prev_channel"]:
+    app.exec_func(func,"_")
+    channels.append(str(app.radio.get_status()["channel"]))
+  bench.info["probe summary"] = [{"seconds":  round(secs,2),
+                                  "dead":     len([r for r in results
+                                                   if not r["ok"]]),
+                                  "channels": ",".join(channels)}]
+
+def failover(bench,options):
+  """ play and record a channel whose mirrors stall or close """
+
+  app     = bench.app
+  mirrors = ["stall2","eof3","channel01"]
+  with open(app.radio._channel_file,"w") as f:
+    f.write("Flaky@%s\n" % "@".join("%s/%s" % (bench.server.url,m)
+                                    for m in mirrors))
+  app.radio.read_channels()
+
+  bench.lirc.send("KEY_1")
+  bench.wait_idle()
+  bench.lirc.send("KEY_RECORD")
+  process = app.mpg123._process
+  (last_pos,last_t,gap) = (app.mpg123._fed_pos,time.monotonic(),0)
+  end = time.monotonic() + options.duration
+  while time.monotonic() < end:
+    time.sleep(0.05)
+    now = time.monotonic()
+    if app.mpg123._fed_pos != last_pos:
+      (last_pos,last_t) = (app.mpg123._fed_pos,now)
+    gap = max(gap,now-last_t)
+  stream = app.hub.get_stream(app.radio.get_channel(0)[1])
+  health = app.hub.get_persistent_state()["mirrors"]
+  bench.info["failover summary"] = [{
+    "failovers":   app.metrics.counter("simple_radio_hub_failovers_total",
+                                       "").value,
+    "mirror":      stream.mirror.rsplit("/",1)[1] if stream else None,
+    "max_gap":     round(gap,2),
+    "same_player": app.mpg123._process is process,
+    "recording":   app.recorder.is_recording()}]
+  bench.info["failover mirrors"] = [dict(health[m],mirror=m.rsplit("/",1)[1])
+                                    for m in sorted(health)]
+  bench.lirc.send("KEY_RECORD")
+  time.sleep(1)
+
+def quality(bench,options):
+  """ play a channel whose best variant the network can't sustain, record
+      the best variant """
+
+  app = bench.app
+  url = bench.server.url
+  with open(app.radio._channel_file,"w") as f:
+    f.write("Variants@192:%s/q?kbps=192&max=160@128:%s/q?kbps=128"
+            "@64:%s/q?kbps=64\n" % (url,url,url))
+  app.radio.read_channels()
+
+  bench.lirc.send("KEY_1")
+  bench.wait_idle()
+  bench.lirc.send("KEY_RECORD")
+  process = app.mpg123._process
+  (last_pos,last_t,gap) = (app.mpg123._fed_pos,time.monotonic(),0)
+  end = time.monotonic() + options.duration
+  while time.monotonic() < end:
+    time.sleep(0.05)
+    now = time.monotonic()
+    if app.mpg123._fed_pos != last_pos:
+      (last_pos,last_t) = (app.mpg123._fed_pos,now)
+    gap = max(gap,now-last_t)
+  channel = app.radio.get_channel(0)[1]
+  streams = [app.hub.get_stream(channel),app.hub.get_stream(channel,True)]
+  bench.info["quality summary"] = [{
+    "player_kbps": streams[0].variant if streams[0] else None,
+    "record_kbps": streams[1].variant if streams[1] else None,
+    "bandwidth":   app.hub.bandwidth,
+    "underruns":   app.metrics.counter("simple_radio_hub_underruns_total",
+                                       "").value,
+    "switches":    app.metrics.counter(
+      "simple_radio_hub_quality_switches_total","").value,
+    "max_gap":     round(gap,2),
+    "same_player": app.mpg123._process is process,
+    "recording":   app.recorder.is_recording()}]
+  bench.lirc.send("KEY_RECORD")
+  time.sleep(1)
+
+def buffer(bench,options):
+  """ alternate between a stable, a jittery and a slow-starting channel,
+      report the buffer-settings learned for all of them """
+
+  app   = bench.app
+  paths = ["channel01","jitter5","channel02?burst=0"]
+  with open(app.radio._channel_file,"w") as f:
+    for path in paths:
+      f.write("%s@%s/%s\n" % (path,bench.server.url,path))
+  app.radio.read_channels()
+
+  rows = []
+  for rnd in range(3):
+    for (nr,path) in enumerate(paths):
+      underruns = app.metrics.counter("simple_radio_mpg123_underruns_total",
+                                      "").value
+      bench.lirc.send("KEY_%d" % (nr+1))
+      time.sleep(options.duration)
+      tuning = app.mpg123._get_tuning(app.radio.get_channel(nr)[1])
+      rows.append({"round": rnd+1, "channel": path,
+                   "buffer": tuning["buffer"],
+                   "prefill": round(app.mpg123._get_buffer(tuning)[1],2),
+                   "start": tuning["start"],
+                   "underruns": app.metrics.counter(
+                     "simple_radio_mpg123_underruns_total","").value-underruns})
+  app.exec_func("radio_off","_")
+  time.sleep(1)
+  bench.info["buffer sessions"] = rows
+  bench.info["buffer settings"] = [dict(app.mpg123._tuning[url],channel=path)
+                                   for (path,url) in
+                                   zip(paths,[c[1] for c in
+                                              app.radio.get_channels()])]
+
+def titles(bench,options):
+  """ play a channel with a large buffer, compare the arrival of the titles
+      with their publication """
+
+  from SRBus import TitleEvent
+  app = bench.app
+  url = app.radio.get_channel(0)[1]
+  subscription = app.bus.subscribe(TitleEvent)
+  bench.lirc.send("KEY_1")
+  bench.wait_idle()
+  arrived = {}
+  cursor  = app.hub.attach(url,on_title=lambda title:
+                           arrived.setdefault(title,time.monotonic()))
+  rows = []
+  end  = time.monotonic() + options.duration
+  while time.monotonic() < end:
+    event = subscription.get(0.05)
+    if not event or not event.title in arrived:
+      continue
+    audible = app.mpg123.get_audible_pos(url)
+    rows.append({"title": event.title.rsplit(" ",1)[1],
+                 "delay": round(time.monotonic()-arrived[event.title],2),
+                 "buffered": round((cursor.stream.pos-audible)/
+                                   cursor.stream.byte_rate(),2)})
+  cursor.close()
+  subscription.close()
+  bench.info["titles"] = rows
+
+SCENARIOS = {
+  "zap_storm":            (zap_storm,0,{}),
+  "record_while_playing": (record_while_playing,0,{}),
+  "player_navigation":    (player_navigation,5000,{}),
+  "relay":                (relay,0,{"GLOBAL": {"relay": "1"},
+                                    "RELAY":  {"host": "127.0.0.1",
+                                               "port": "0",
+                                               "max_lag": "1",
+                                               "burst":   "0.5"}}),
+  "ui_stall":             (ui_stall,0,{"GLOBAL": {"ui_process": "1"}}),
+  "probe":                (probe,0,{"PROBE": {"timeout": "3",
+                                              "bytes": "81920",
+                                              "concurrency": "3"}}),
+  "failover":             (failover,0,{"STREAM": {"timeout": "2"}}),
+  "quality":              (quality,0,{"STREAM": {"rate_window": "1"},
+                                      "RECORD": {"quality": "best"}}),
+  "buffer":               (buffer,0,{}),
+  "titles":               (titles,0,{"MPG123": {"adaptive": "0",
+                                                "mpg123_opts":
+                                                  "-b 1024 --preload 1"}}),
+  "titles_quiet":         (titles,0,{"MPG123": {"adaptive": "0",
+                                                "mpg123_opts":
+                                                  "-q -b 1024 --preload 1"}})
+  }
+
+# --- report   ----------------------------------------------------------------
+
+def report(name,samples,cpu,info,as_json):
+  """ print results of a scenario """
+
+  result = {"scenario": name,
+            "latency":  {key: simlib.summary(values)
+                         for (key,values) in sorted(samples.items())},
+            "cpu":      cpu,
+            "info":     info}
+  if as_json:
+    print(json.dumps(result,indent=2,sort_keys=True))
+    return
+
+  print("\n=== %s ===" % name)
+  print("%-32s %6s %9s %9s %9s %9s" % ("latency (ms)","n","p50","p90",
+                                       "p99","max"))
+  for (key,s) in sorted(result["latency"].items()):
+    if s["count"]:
+      print("%-32s %6d %9.2f %9.2f %9.2f %9.2f" %
+            (key,s["count"],1000*s["p50"],1000*s["p90"],1000*s["p99"],
+             1000*s["max"]))
+  print("%-32s %9s" % ("cpu (s)",""))
+  for (component,secs) in sorted(cpu.items(),key=lambda x: -x[1]):
+    print("%-32s %9.3f" % (component,secs))
+  for (title,rows) in sorted(info.items()):
+    if not rows:
+      continue
+    keys = sorted(rows[0].keys())
+    print("%-32s" % title)
+    print("  "+" ".join("%12s" % key for key in keys))
+    for row in rows:
+      print("  "+" ".join("%12s" % (row[key],) for key in keys))
+
+# --- main program   ----------------------------------------------------------
+
+if __name__ == '__main__':
+  parser = ArgumentParser(description='Simple radio benchmarks')
+  parser.add_argument('-s','--scenario',action='append',
+                      choices=sorted(SCENARIOS.keys()),
+                      help='scenario to run (default: all)')
+  parser.add_argument('-n','--count',type=int,default=50,
+                      help='number of key-events')
+  parser.add_argument('-i','--interval',type=float,default=0.05,
+                      help='seconds between key-events')
+  parser.add_argument('-d','--duration',type=float,default=10,
+                      help='duration of recordings (seconds)')
+  parser.add_argument('-T','--title-time',type=float,default=2,
+                      help='seconds between title-changes of the streams')
+  parser.add_argument('--json',action='store_true',default=False,
+                      help='print results as JSON')
+  options = parser.parse_args()
+
+  for name in options.scenario or sorted(SCENARIOS.keys()):
+    (func,recordings,overrides) = SCENARIOS[name]
+    bench = Bench(options,recordings,overrides)
+    bench.start()
+    try:
+      func(bench,options)
+    finally:
+      cpu = bench.stop()
+    report(name,bench.samples,cpu,bench.info,options.json)
@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio simulation: key-injectors
+#
+# FifoInjector writes keys to the keypad-FIFO, LircInjector emulates the
+# socket of lircd. Both can be used from scripts or from the commandline:
+#
+#   inject.py fifo  /tmp/keypad.fifo 1 2 3 +
+#   inject.py lircd /tmp/lircd KEY_UP KEY_DOWN
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import os, sys, time, socket, threading
+from argparse import ArgumentParser
+
+# --- keypad-FIFO   -----------------------------------------------------------
+
+class FifoInjector(object):
+  """ write keys to the FIFO of the keypad """
+
+  def __init__(self,path):
+    """ create FIFO (opening blocks until the reader opens it) """
+
+    self._path = path
+    if not os.path.exists(path):
+      os.mkfifo(path)
+    self._fifo = None
+
+  def open(self):
+    """ open FIFO for writing """
+
+    if not self._fifo:
+      self._fifo = open(self._path,"w")
+
+  def send(self,key):
+    """ send a single key """
+
+    self.open()
+    self._fifo.write("%s\n" % key)
+    self._fifo.flush()
+
+  def close(self):
+    """ close and remove FIFO """
+
+    if self._fifo:
+      self._fifo.close()
+      self._fifo = None
+    if os.path.exists(self._path):
+      os.unlink(self._path)
+
+# --- lircd-socket   ----------------------------------------------------------
+
+class LircInjector(object):
+  """ emulate the socket of lircd """
+
+  def __init__(self,path,remote="sim"):
+    """ create socket and accept clients in the background """
+
+    self._path    = path
+    self._remote  = remote
+    self._clients = []
+    self._lock    = threading.Lock()
+    if os.path.exists(path):
+      os.unlink(path)
+    self._socket = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    self._socket.bind(path)
+    self._socket.listen(4)
+    self.connected = threading.Event()
+    threading.Thread(target=self._accept,name="LircInjector",
+                     daemon=True).start()
+
+  def _accept(self):
+    """ accept clients """
+
+    while True:
+      try:
+        (conn,_) = self._socket.accept()
+      except OSError:
+        return
+      with self._lock:
+        self._clients.append(conn)
+      self.connected.set()
+
+  def send(self,key,repeat=0):
+    """ send key to all clients (format of lircd) """
+
+    line = ("%016x %02x %s %s\n" % (0,repeat,key,self._remote)).encode()
+    with self._lock:
+      for conn in list(self._clients):
+        try:
+          conn.sendall(line)
+        except OSError:
+          self._clients.remove(conn)
+
+  def close(self):
+    """ close all connections and remove the socket """
+
+    with self._lock:
+      for conn in self._clients:
+        conn.close()
+      self._clients = []
+    self._socket.close()
+    if os.path.exists(self._path):
+      os.unlink(self._path)
+
+# --- main program   ----------------------------------------------------------
+
+if __name__ == '__main__':
+  parser = ArgumentParser(description='Simple radio key-injector')
+  parser.add_argument('-d','--delay',type=float,default=0.5,
+                      help='delay between keys')
+  parser.add_argument('type',choices=['fifo','lircd'])
+  parser.add_argument('path')
+  parser.add_argument('keys',nargs='*',
+                      help='keys to send (default: read lines from stdin)')
+  options = parser.parse_args()
+
+  if options.type == 'fifo':
+    injector = FifoInjector(options.path)
+  else:
+    injector = LircInjector(options.path)
+    print("waiting for client ...")
+    injector.connected.wait()
+
+  try:
+    keys = options.keys or (line.strip() for line in sys.stdin)
+    for key in keys:
+      if key:
+        injector.send(key)
+        time.sleep(options.delay)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    injector.close()
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio simulation: fake smbus-module
+#
+# Records all writes and decodes the 4-bit protocol of a HD44780 behind a
+# PCF8574 (as used by lcddriver.py), so the content of the simulated LCD
+# can be inspected with SMBus.screen().
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import threading
+
+EN = 0x04
+RS = 0x01
+
+# DDRAM-address of the first column of every row (20x4 layout, also
+# valid for 16x2)
+ROW_ADDR = (0x00,0x40,0x14,0x54)
+
+# all busses (port -> SMBus), e.g. for benchmarks
+busses = {}
+
+class SMBus(object):
+  """ fake SMBus """
+
+  def __init__(self,port=1):
+    """ initialization """
+
+    self.port          = port
+    self.bytes_written = 0
+    self.writes        = 0
+    self._lock         = threading.Lock()
+    self._last         = 0
+    self._nibble       = None
+    self._addr         = 0
+    self._cgram        = False
+    self.ddram         = bytearray(b' '*0x68)
+    busses[port]       = self
+
+  # --- decode a byte of the PCF8574   ----------------------------------------
+
+  def _decode(self,value):
+    """ latch nibble on falling edge of EN """
+
+    if self._last & EN and not value & EN:
+      nibble = value & 0xF0
+      if self._nibble is None:
+        self._nibble = nibble
+      else:
+        self._execute((self._nibble | nibble >> 4),value & RS)
+        self._nibble = None
+    self._last = value
+
+  def _execute(self,byte,rs):
+    """ execute command or write data """
+
+    if rs:
+      if self._cgram:
+        return                                   # custom glyphs: ignored
+      if self._addr < len(self.ddram):
+        self.ddram[self._addr] = byte
+      self._addr += 1
+    elif byte == 0x01:                           # clear display
+      self.ddram[:] = b' '*len(self.ddram)
+      self._addr    = 0
+      self._cgram   = False
+    elif byte == 0x02:                           # return home
+      self._addr  = 0
+      self._cgram = False
+    elif byte & 0x80:                            # set DDRAM-address
+      self._addr  = byte & 0x7F
+      self._cgram = False
+    elif byte & 0x40:                            # set CGRAM-address
+      self._cgram = True
+
+  # --- write methods   -------------------------------------------------------
+
+  def write_byte(self,addr,value):
+    with self._lock:
+      self.writes        += 1
+      self.bytes_written += 1
+      self._decode(value)
+
+  def write_byte_data(self,addr,cmd,value):
+    with self._lock:
+      self.writes        += 1
+      self.bytes_written += 2
+
+  def write_block_data(self,addr,cmd,data):
+    with self._lock:
+      self.writes        += 1
+      self.bytes_written += len(data)+1
+
+  def write_i2c_block_data(self,addr,cmd,data):
+    with self._lock:
+      self.writes        += 1
+      self.bytes_written += len(data)+1
+
+  # --- read methods   --------------------------------------------------------
+
+  def read_byte(self,addr):
+    return 0
+
+  def read_byte_data(self,addr,cmd):
+    return 0
+
+  def read_block_data(self,addr,cmd):
+    return []
+
+  # --- return current content   ----------------------------------------------
+
+  def screen(self,rows=2,cols=16):
+    """ return list of rows of the simulated LCD """
+
+    with self._lock:
+      return [self.ddram[a:a+cols].decode('latin-1') for a in ROW_ADDR[:rows]]
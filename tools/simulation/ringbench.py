@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio simulation: throughput of the ring-buffer of the stream-hub
+#
+# Writes synthetic stream-data into the ring-buffer (RAM or mmap'ed file)
+# as fast as possible while a number of cursors read it. Reports the
+# sustained write- and read-throughput and the number of overruns.
+#
+# Usage: ringbench.py [-m ram|file] [-r readers] [-s MB]
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import time, threading, configparser, tempfile, shutil
+from argparse import ArgumentParser
+
+import simlib
+simlib.activate()
+
+from SRMetrics   import Metrics
+from SRStreamHub import StreamHub, Stream, READ_CHUNK
+
+# --- minimal application   ---------------------------------------------------
+
+class App(object):
+  """ the parts of class App needed by the hub """
+
+  def __init__(self,values):
+    """ initialization """
+
+    self.parser = configparser.RawConfigParser()
+    self.parser.read_dict(values)
+    self.stop_event = threading.Event()
+    self.metrics    = Metrics(self)
+
+  def register_funcs(self,funcs):
+    pass
+
+# --- run benchmark for one medium   ------------------------------------------
+
+def run(medium,options):
+  """ run benchmark, return result-dict """
+
+  ring_dir = tempfile.mkdtemp(prefix="sr-ring-",dir=options.dir)
+  stream = {"ring_size": str(options.ring_size),
+            "timeshift": str(options.timeshift)}
+  if medium == "file":
+    stream["ring_dir"] = ring_dir
+  app = App({"STREAM": stream})
+  hub = StreamHub(app)
+
+  # a stream without upstream-connection, fed by the benchmark
+  s = Stream(hub,"bench://%s" % medium)
+  s._ring = hub.alloc_ring(s.byte_rate())
+  s._view = memoryview(s._ring)
+  s._size = len(s._ring)
+
+  total   = options.size*1024*1024
+  chunk   = simlib.silent_frames(READ_CHUNK//simlib.FRAME_LEN+1)[:READ_CHUNK]
+  cursors = [s.attach(None,None)[0] for _ in range(options.readers)]
+  read    = [0]*options.readers
+
+  def reader(nr,cursor):
+    while True:
+      (data,_) = cursor.read(options.chunk)
+      if not data:
+        break
+      read[nr] += len(data)
+
+  threads = [threading.Thread(target=reader,args=(nr,c))
+             for (nr,c) in enumerate(cursors)]
+  start = time.monotonic()
+  for t in threads:
+    t.start()
+  while s.pos < total:
+    s._write(chunk)
+  w_secs = time.monotonic()-start
+  s._set_eof()
+  for t in threads:
+    t.join()
+  r_secs = time.monotonic()-start
+
+  result = {"medium":    medium,
+            "ring_kb":   s._size//1024,
+            "write_mbs": s.pos/w_secs/1e6,
+            "read_mbs":  sum(read)/r_secs/1e6,
+            "lost_kb":   (options.readers*s.pos-sum(read))//1024,
+            "overruns":  hub._m_overruns.value}
+  shutil.rmtree(ring_dir)
+  return result
+
+# --- main program   ----------------------------------------------------------
+
+if __name__ == '__main__':
+  parser = ArgumentParser(description='Simple radio ring-buffer benchmark')
+  parser.add_argument('-m','--medium',action='append',choices=["ram","file"],
+                      help='medium of the ring-buffer (default: both)')
+  parser.add_argument('-r','--readers',type=int,default=2,
+                      help='number of cursors')
+  parser.add_argument('-s','--size',type=int,default=256,
+                      help='MB written')
+  parser.add_argument('-c','--chunk',type=int,default=4096,
+                      help='bytes per read')
+  parser.add_argument('-R','--ring-size',type=int,default=1024,
+                      help='size of the ring-buffer (kB)')
+  parser.add_argument('-t','--timeshift',type=int,default=30,
+                      help='timeshift (minutes at 128 kbit/s)')
+  parser.add_argument('-D','--dir',default=None,
+                      help='directory for the ring-file (default: $TMPDIR)')
+  options = parser.parse_args()
+
+  print("%-6s %9s %11s %11s %9s %9s" % ("medium","ring (kB)","write (MB/s)",
+                                        "read (MB/s)","lost (kB)","overruns"))
+  for medium in options.medium or ["ram","file"]:
+    r = run(medium,options)
+    print("%-6s %9d %11.1f %11.1f %9d %9d" %
+          (r["medium"],r["ring_kb"],r["write_mbs"],r["read_mbs"],r["lost_kb"],
+           r["overruns"]))
@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio simulation: common helpers
+#
+# Synthetic MP3-data, generation of a test-environment (config-file,
+# channel-file, recordings), CPU-sampling per thread and percentiles.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import os, sys, threading, configparser, datetime
+
+SIM_DIR  = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(os.path.dirname(SIM_DIR))
+BIN_DIR  = os.path.join(REPO_DIR,"files","usr","local","bin")
+CONF     = os.path.join(REPO_DIR,"files","etc","simple-radio.conf")
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, joint-stereo: 417 bytes per frame
+FRAME_HEADER = b'\xFF\xFB\x90\x64'
+FRAME_LEN    = 417
+BYTE_RATE    = 16000                        # bytes per second at 128 kbit/s
+
+# --- synthetic audio   -------------------------------------------------------
+
+def silent_frames(count):
+  """ return count frames of (invalid but well-framed) audio """
+
+  return (FRAME_HEADER + bytes(FRAME_LEN-4))*count
+
+def seconds_to_frames(secs):
+  """ return number of frames for the given duration """
+
+  return max(1,int(secs*BYTE_RATE/FRAME_LEN))
+
+# --- environment for the simulated radio   ----------------------------------
+
+def sim_path():
+  """ return PATH and PYTHONPATH with the fake binaries and modules first """
+
+  path = os.pathsep.join([os.path.join(SIM_DIR,"bin"),os.environ["PATH"]])
+  pypath = [os.path.join(SIM_DIR,"lib"),BIN_DIR]
+  if "PYTHONPATH" in os.environ:
+    pypath.append(os.environ["PYTHONPATH"])
+  return (path,os.pathsep.join(pypath))
+
+def activate():
+  """ activate fake binaries and modules within the current process """
+
+  (path,pypath) = sim_path()
+  os.environ["PATH"] = path
+  os.environ["PYTHONPATH"] = pypath
+  for p in reversed(pypath.split(os.pathsep)):
+    if p not in sys.path:
+      sys.path.insert(0,p)
+
+def write_channels(work_dir,url,count):
+  """ write channel-file with count channels served by the stream-server """
+
+  path = os.path.join(work_dir,"simple-radio.channels")
+  with open(path,"w") as f:
+    for i in range(count):
+      f.write("Sim %02d@%s/channel%02d\n" % (i+1,url,i+1))
+  return path
+
+def write_config(work_dir,channel_file,overrides={}):
+  """ write config-file based on the shipped one, returns the path """
+
+  parser = configparser.RawConfigParser(inline_comment_prefixes=(';',))
+  parser.optionxform = str
+  parser.read(CONF)
+
+  rec_dir = os.path.join(work_dir,"recordings")
+  defaults = {
+    "GLOBAL":  {"keypad": "1", "lirc": "1", "cec": "0", "api": "0",
+                "channel_file": channel_file,
+                "keypad_fifo": os.path.join(work_dir,"keypad.fifo"),
+                "lirc_socket": os.path.join(work_dir,"lircd")},
+    "DISPLAY": {"display": "1"},
+    "RECORD":  {"dir": rec_dir, "min_free": "0"}
+    }
+  for values in (defaults,overrides):
+    for (section,options) in values.items():
+      if not parser.has_section(section):
+        parser.add_section(section)
+      for (option,value) in options.items():
+        parser.set(section,option,value)
+
+  path = os.path.join(work_dir,"simple-radio.conf")
+  with open(path,"w") as f:
+    parser.write(f)
+  return path
+
+def create_recordings(rec_dir,count,channels=10,frames=2):
+  """ create count (tiny) recordings, one every 30 minutes """
+
+  os.makedirs(rec_dir,exist_ok=True)
+  data  = silent_frames(frames)
+  start = datetime.datetime(2020,1,1)
+  for i in range(count):
+    dt   = start + datetime.timedelta(minutes=30*i)
+    name = "%s_Sim %02d.mp3" % (dt.strftime('%Y%m%d_%H%M%S'),1+i % channels)
+    with open(os.path.join(rec_dir,name),"wb") as f:
+      f.write(data)
+
+# --- statistics   ------------------------------------------------------------
+
+def percentile(samples,p):
+  """ return the p-th percentile (nearest rank) """
+
+  if not samples:
+    return float('nan')
+  samples = sorted(samples)
+  index   = max(0,min(len(samples)-1,int(round(p/100.0*len(samples)+0.5))-1))
+  return samples[index]
+
+def summary(samples):
+  """ return dict with count and percentiles """
+
+  return {"count": len(samples),
+          "p50":   percentile(samples,50),
+          "p90":   percentile(samples,90),
+          "p99":   percentile(samples,99),
+          "max":   max(samples) if samples else float('nan')}
+
+# --- CPU-time per thread   ---------------------------------------------------
+
+class CpuSampler(threading.Thread):
+  """ sample CPU-time of all threads of this process from /proc """
+
+  def __init__(self,interval=0.1):
+    """ initialization """
+    super(CpuSampler,self).__init__(name="CpuSampler",daemon=True)
+    self._interval   = interval
+    self._stop_event = threading.Event()
+    self._tick       = os.sysconf("SC_CLK_TCK")
+    self._threads    = {}                         # tid -> (name,seconds)
+
+  def _component(self,name):
+    """ map thread-name to component """
+
+    if name.endswith(")") and "(" in name:      # Thread-n (func)
+      return name[name.rindex("(")+1:-1]
+    return name.split("-")[0]
+
+  def sample(self):
+    """ read CPU-times of all living threads """
+
+    names = {t.native_id: t.name for t in threading.enumerate()}
+    task_dir = "/proc/self/task"
+    for tid in os.listdir(task_dir):
+      try:
+        with open(os.path.join(task_dir,tid,"stat")) as f:
+          fields = f.read().rpartition(")")[2].split()
+      except OSError:
+        continue                                  # thread just terminated
+      secs = (int(fields[11])+int(fields[12]))/self._tick
+      name = names.get(int(tid),self._threads.get(tid,("?",0))[0])
+      self._threads[tid] = (name,secs)
+
+  def run(self):
+    """ sample until stopped """
+
+    while not self._stop_event.wait(self._interval):
+      self.sample()
+
+  def stop(self):
+    """ stop sampling and return CPU-seconds per component """
+
+    self._stop_event.set()
+    self.sample()
+    result = {}
+    for (name,secs) in self._threads.values():
+      if name == self.name:
+        continue
+      component = self._component(name)
+      result[component] = result.get(component,0) + secs
+    return result
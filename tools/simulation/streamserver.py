@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Simple radio simulation: local HTTP stream-server
+#
+# Serves endless MP3-streams (synthetic frames or a looped mp3-file) at
+# real-time speed. Clients sending "Icy-MetaData: 1" get ICY-metadata with
+# a changing StreamTitle. Every path is a channel, e.g. /channel01. Some
+# paths simulate broken servers: /slowN (response after N seconds), /fail
+# (status 503), /drop (connection closed without a response), /stallN (no
+# more data after N seconds), /eofN (connection closed after N seconds) and
+# /jitterN (pauses of N seconds every JITTER_PERIOD seconds, then catches up).
+# The query ?kbps=N serves a quality-variant with N kbit/s, &max=M limits
+# the throughput to M kbit/s (a variant the network can't sustain), &burst=B
+# sends B bytes (default: 65536) before pacing the output.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/simple-radio
+#
+# -----------------------------------------------------------------------------
+
+import time, threading, urllib.parse
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import simlib
+
+METAINT = 8192
+JITTER_PERIOD = 3
+CHUNK   = 4096
+
+# --- request handler   -------------------------------------------------------
+
+class StreamHandler(BaseHTTPRequestHandler):
+  """ serve a single stream """
+
+  protocol_version = "HTTP/1.0"
+
+  def log_message(self,format,*args):
+    """ be quiet """
+    pass
+
+  def _title(self,count):
+    """ return current title """
+    return "%s - title %d" % (self.path.split("?")[0].strip("/"),count)
+
+  def _meta(self,title):
+    """ return ICY-metadata block for title """
+
+    text = ("StreamTitle='%s';" % title).encode('utf-8')
+    blocks = (len(text)+15)//16
+    return bytes([blocks]) + text.ljust(16*blocks,b'\0')
+
+  def do_GET(self):
+    """ stream audio until the client disconnects """
+
+    server  = self.server
+    icy     = self.headers.get("Icy-MetaData") == "1"
+    limit   = None
+    query   = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+    kbps    = int(query.get("kbps",[128])[0])
+    rate    = server.rate*min(kbps,int(query.get("max",[kbps])[0]))/128
+    burst   = int(query.get("burst",[server.burst])[0])
+    for fault in ("/stall","/eof"):
+      if self.path.startswith(fault):
+        limit = float(self.path[len(fault):] or 1)
+    jitter  = 0
+    if self.path.startswith("/jitter"):
+      jitter = float(self.path[7:].split("?")[0] or 1)
+    if self.path.startswith("/slow"):
+      time.sleep(float(self.path[5:] or 1))
+    elif self.path.startswith("/fail"):
+      self.send_error(503)
+      return
+    elif self.path.startswith("/drop"):
+      self.close_connection = True
+      return
+    self.send_response(200)
+    self.send_header("Content-Type","audio/mpeg")
+    self.send_header("icy-br",str(kbps))
+    self.send_header("icy-name",self.path.split("?")[0].strip("/"))
+    if icy:
+      self.send_header("icy-metaint",str(METAINT))
+    self.end_headers()
+    server.clients += 1
+
+    data     = server.data
+    pos      = 0
+    left     = METAINT
+    count    = 0
+    title    = None
+    start    = time.monotonic()
+    sent     = 0
+    paused   = start
+    try:
+      while not server.stopped:
+        chunk = data[pos:pos+(min(CHUNK,left) if icy else CHUNK)]
+        pos  += len(chunk)
+        if pos >= len(data):
+          pos = 0
+        self.wfile.write(chunk)
+        sent += len(chunk)
+        left -= len(chunk)
+        if icy and not left:
+          left = METAINT
+          new  = self._title(int((time.monotonic()-start)/server.title_time))
+          if new != title:
+            title = new
+            self.wfile.write(self._meta(title))
+          else:
+            self.wfile.write(b'\0')
+
+        # simulate a stalled or closed connection
+        if limit is not None and time.monotonic()-start >= limit:
+          while self.path.startswith("/stall") and not server.stopped:
+            time.sleep(0.1)
+          break
+
+        # simulate network-jitter
+        if jitter and time.monotonic()-paused >= JITTER_PERIOD:
+          time.sleep(jitter)
+          paused = time.monotonic()
+
+        # pace output (with an initial burst like real servers)
+        if rate:
+          delay = (sent-burst)/rate - (time.monotonic()-start)
+          if delay > 0:
+            time.sleep(delay)
+    except (BrokenPipeError,ConnectionResetError):
+      pass
+    finally:
+      server.clients -= 1
+
+# --- server   ----------------------------------------------------------------
+
+class StreamServer(ThreadingHTTPServer):
+  """ stream-server with shared settings """
+
+  daemon_threads = True
+
+  def __init__(self,address,data=None,rate=simlib.BYTE_RATE,burst=65536,
+               title_time=10):
+    """ initialization """
+    super(StreamServer,self).__init__(address,StreamHandler)
+    self.data       = data or simlib.silent_frames(simlib.seconds_to_frames(10))
+    self.rate       = rate
+    self.burst      = burst
+    self.title_time = title_time
+    self.clients    = 0
+    self.stopped    = False
+    self._thread    = None
+
+  @property
+  def url(self):
+    """ base-url of the server """
+    return "http://%s:%d" % self.server_address[:2]
+
+  def start(self):
+    """ serve in a background thread """
+    self._thread = threading.Thread(target=self.serve_forever,
+                                    name="StreamServer",daemon=True)
+    self._thread.start()
+
+  def stop(self):
+    """ stop server """
+    self.stopped = True
+    self.shutdown()
+    self.server_close()
+
+# --- main program   ----------------------------------------------------------
+
+if __name__ == '__main__':
+  parser = ArgumentParser(description='Simple radio stream-server')
+  parser.add_argument('-H','--host',default='127.0.0.1')
+  parser.add_argument('-P','--port',type=int,default=8000)
+  parser.add_argument('-f','--file',default=None,
+                      help='mp3-file to loop (default: synthetic frames)')
+  parser.add_argument('-r','--rate',type=int,default=simlib.BYTE_RATE,
+                      help='bytes per second (0: unpaced)')
+  parser.add_argument('-t','--title-time',type=float,default=10,
+                      help='seconds between title changes')
+  options = parser.parse_args()
+
+  data = None
+  if options.file:
+    with open(options.file,"rb") as f:
+      data = f.read()
+  server = StreamServer((options.host,options.port),data,options.rate,
+                        title_time=options.title_time)
+  print("serving on %s/<channel>" % server.url)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass